@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed cache of the asset topology reported by Asset Performance Management.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import json
+import logging
+import threading
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.messagebus.exceptions import SystemLinkException
+from systemlink.messagebus.generic_message import GenericMessage
+from systemlink.messagebus.message_header import MessageHeader
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Query filter of the assets updated since a timestamp
+DEFAULT_DELTA_FILTER = 'LastUpdatedTimestamp >= "{}"'
+
+# Fields of a system asset that identify it as a system controller
+SYSTEM_CONTROLLER_FIELDS = ('modelName', 'modelNumber', 'serialNumber',
+                            'vendorName', 'vendorNumber', 'busType')
+
+
+class AssetIndex():
+    """
+    Assets indexed by name, minion id and serial number, with the system hierarchy.
+
+    The index is built once from paged ``AssetPerformanceManagementQueryAssetsRequest``
+    requests. Lookups and the system to children tree are then served from
+    memory. :meth:`refresh` only queries the assets whose
+    ``lastUpdatedTimestamp`` is at or after the newest one already indexed,
+    so its cost grows with the number of changes rather than the number of
+    assets. A delta query cannot see removed assets; ``refresh(full=True)``
+    pages through all the assets and also drops the ones that were removed.
+    :meth:`apply_changes` applies known changes without any request.
+    """
+    def __init__(self, message_service, page_size=1000, delta_filter=DEFAULT_DELTA_FILTER):
+        """
+        :param message_service: The message service used to query the assets.
+        :type message_service: systemlink.messagebus.message_service.MessageService
+        :param page_size: Number of assets to request per page.
+        :type page_size: int
+        :param delta_filter: The ``filter`` of the query of the assets updated
+            since a timestamp, with ``{}`` in place of the timestamp, or ``None``
+            to make every refresh a full refresh.
+        :type delta_filter: str or None
+        """
+        self._message_service = message_service
+        self._page_size = page_size
+        self._delta_filter = delta_filter
+        self._watermark = None
+        self._lock = threading.RLock()
+        self._assets = {}
+        self._by_name = {}
+        self._by_minion_id = {}
+        self._by_serial_number = {}
+        self._children = {}
+        self.refresh(full=True)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._assets)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._assets.values()))
+
+    def by_name(self, name):
+        """
+        Return the asset with this name, or ``None``.
+
+        :param name: The asset name.
+        :type name: str
+        :rtype: dict or None
+        """
+        with self._lock:
+            return self._first(self._by_name.get(name))
+
+    def by_serial_number(self, serial_number):
+        """
+        Return the asset with this serial number, or ``None``.
+
+        :param serial_number: The asset serial number.
+        :type serial_number: str
+        :rtype: dict or None
+        """
+        with self._lock:
+            return self._first(self._by_serial_number.get(serial_number))
+
+    def by_minion_id(self, minion_id):
+        """
+        Return the assets located in the system with this minion id.
+
+        :param minion_id: The minion id of the system.
+        :type minion_id: str
+        :rtype: list(dict)
+        """
+        with self._lock:
+            return [self._assets[key] for key in self._by_minion_id.get(minion_id, ())]
+
+    def systems(self):
+        """
+        Return the top-level system assets.
+
+        :rtype: list(dict)
+        """
+        with self._lock:
+            return [asset for asset in self._assets.values() if _is_system(asset)]
+
+    def children(self, system_name):
+        """
+        Return the assets located in a system, excluding the system itself.
+
+        :param system_name: The name of the system asset.
+        :type system_name: str
+        :rtype: list(dict)
+        """
+        with self._lock:
+            return [self._assets[key] for key in self._children.get(system_name, ())]
+
+    def system_controller(self, asset):
+        """
+        Return the minion id and system controller identification of an asset's system.
+
+        :param asset: The asset, as returned by the Asset Performance Management service.
+        :type asset: dict
+        :return: The minion id and system controller identification, or ``None``
+            if the asset's system is not known.
+        :rtype: tuple(str, dict) or None
+        """
+        location = asset['location']
+        system = self.by_name(location['systemName'])
+        if system is None:
+            return None
+        return location['minionId'], dict((field, system[field])
+                                          for field in SYSTEM_CONTROLLER_FIELDS)
+
+    @property
+    def watermark(self):
+        """
+        The newest ``lastUpdatedTimestamp`` of the indexed assets, or ``None``.
+
+        :rtype: str or None
+        """
+        with self._lock:
+            return self._watermark
+
+    def refresh(self, full=False):
+        """
+        Query the assets updated since the last refresh and re-index them
+
+        :param full: Whether to query all the assets, which also removes the
+            assets that no longer exist, instead of the updated ones.
+        :type full: bool
+        :return: The number of assets that were added, changed or removed.
+        :rtype: int
+        """
+        watermark = self.watermark
+        delta = not full and self._delta_filter is not None and watermark is not None
+        query_filter = self._delta_filter.format(watermark) if delta else None
+        seen = set()
+        changed = []
+        for asset in self._query_assets(query_filter):
+            key = asset_key(asset)
+            seen.add(key)
+            with self._lock:
+                known = self._assets.get(key)
+            if known is None or _changed(known, asset):
+                changed.append(asset)
+        removed = []
+        if not delta:
+            with self._lock:
+                removed = [key for key in self._assets if key not in seen]
+        self.apply_changes(changed, removed)
+        return len(changed) + len(removed)
+
+    def apply_changes(self, assets=(), removed_keys=()):
+        """
+        Add or replace assets and remove others without querying the service.
+
+        :param assets: Assets that were added or changed.
+        :type assets: list(dict)
+        :param removed_keys: Keys of assets that were removed, as returned by
+            :func:`asset_key`.
+        :type removed_keys: list
+        """
+        with self._lock:
+            for key in removed_keys:
+                self._unindex(key)
+            for asset in assets:
+                key = asset_key(asset)
+                self._unindex(key)
+                self._index(key, asset)
+                timestamp = asset.get('lastUpdatedTimestamp')
+                if timestamp is not None and (self._watermark is None or
+                                              timestamp > self._watermark):
+                    self._watermark = timestamp
+
+    def _query_assets(self, query_filter=None):
+        skip = 0
+        while True:
+            body = {'skip': skip, 'take': self._page_size}
+            if query_filter is not None:
+                body['filter'] = query_filter
+            response = self._publish(body)
+            assets = response.get('assets', [])
+            for asset in assets:
+                yield asset
+            skip += len(assets)
+            total_count = response.get('totalCount')
+            if len(assets) < self._page_size or (total_count is not None and skip >= total_count):
+                return
+
+    def _publish(self, body):
+        header = MessageHeader(
+            message_name='AssetPerformanceManagementQueryAssetsRequest',
+            content_type='application/json',
+            routing_param='AssetPerformanceManagement'
+        )
+        generic_message = GenericMessage(header=header, body=json.dumps(body))
+        response = self._message_service.publish_synchronous_message(generic_message)
+        if response is None:
+            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
+        if response.has_error():
+            raise SystemLinkException(error=response.error)
+        return json.loads(response.body_bytes)
+
+    def _index(self, key, asset):
+        self._assets[key] = asset
+        location = asset.get('location') or {}
+        _add(self._by_name, asset.get('name'), key)
+        _add(self._by_serial_number, asset.get('serialNumber'), key)
+        _add(self._by_minion_id, location.get('minionId'), key)
+        if asset.get('busType') != 'BUILT_IN_SYSTEM' and location.get('systemName'):
+            _add(self._children, location['systemName'], key)
+
+    def _unindex(self, key):
+        asset = self._assets.pop(key, None)
+        if asset is None:
+            return
+        location = asset.get('location') or {}
+        _discard(self._by_name, asset.get('name'), key)
+        _discard(self._by_serial_number, asset.get('serialNumber'), key)
+        _discard(self._by_minion_id, location.get('minionId'), key)
+        _discard(self._children, location.get('systemName'), key)
+
+    def _first(self, keys):
+        if not keys:
+            return None
+        return self._assets[next(iter(keys))]
+
+
+def asset_key(asset):
+    """
+    Return the key an asset is indexed by.
+
+    :param asset: The asset, as returned by the Asset Performance Management service.
+    :type asset: dict
+    :return: The asset id, or its vendor, model and serial number if it has no id.
+    """
+    if asset.get('id'):
+        return asset['id']
+    return (asset.get('vendorNumber'), asset.get('modelNumber'), asset.get('serialNumber'))
+
+
+def _changed(known, asset):
+    timestamp = asset.get('lastUpdatedTimestamp')
+    if timestamp is not None:
+        return timestamp != known.get('lastUpdatedTimestamp')
+    return asset != known
+
+
+def _is_system(asset):
+    location = asset.get('location') or {}
+    return asset.get('busType') == 'BUILT_IN_SYSTEM' and location.get('parent') == ''
+
+
+def _add(index, value, key):
+    if value is None or value == '':
+        return
+    index.setdefault(value, {})[key] = None
+
+
+def _discard(index, value, key):
+    keys = index.get(value)
+    if keys is None:
+        return
+    keys.pop(key, None)
+    if not keys:
+        del index[value]
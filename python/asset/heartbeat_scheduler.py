@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Single-threaded heartbeat scheduler for many concurrent asset utilizations.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import heapq
+import json
+import logging
+import math
+import queue
+import random
+import threading
+import time
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.messagebus.exceptions import SystemLinkException
+from systemlink.messagebus.generic_message import GenericMessage
+from systemlink.messagebus.message_header import MessageHeader
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class HeartbeatScheduler():
+    """
+    Send heartbeats for any number of active utilizations from one thread.
+
+    Deadlines are rounded up to ``resolution`` seconds, so utilizations that
+    are due at about the same time share a slot of a timer wheel. The
+    scheduler wakes up once per slot, at a random time within the slot so
+    that schedulers started together do not send their heartbeats at the
+    same instant, and sends one
+    ``AssetPerformanceManagementRecordAssetUtilizationHeartbeatRequest`` with
+    the ``utilizationIds`` of every utilization in it, split in requests of
+    at most ``max_batch`` ids. A message service is used by one thread at a
+    time, so as many requests are sent at the same time as message services
+    are given. The cost of the scheduler and the number of requests grow
+    with the number of distinct slots, not with the number of utilizations.
+    """
+    def __init__(self, message_service, interval=20.0, resolution=0.5, max_batch=1000):
+        """
+        :param message_service: The message service used to publish the
+            heartbeats, or several to send as many requests at the same time.
+        :type message_service: systemlink.messagebus.message_service.MessageService or
+            list(systemlink.messagebus.message_service.MessageService)
+        :param interval: Time, in seconds, between two heartbeats of a utilization.
+        :type interval: float or int
+        :param resolution: Width, in seconds, of a slot. Heartbeats are sent up to
+            this much earlier or later than their exact deadline.
+        :type resolution: float or int
+        :param max_batch: Maximum number of utilizations per heartbeat request.
+        :type max_batch: int
+        """
+        if isinstance(message_service, (list, tuple)):
+            message_services = list(message_service)
+        else:
+            message_services = [message_service]
+        self._idle_services = queue.Queue()
+        for service in message_services:
+            self._idle_services.put(service)
+        self._max_batch = max_batch
+        self._interval = interval
+        self._resolution = resolution
+        self._condition = threading.Condition()
+        self._slots = {}
+        self._due_times = {}
+        self._heap = []
+        self._random = random.Random()
+        self._slot_of = {}
+        self._closing = False
+        self._heartbeat_count = 0
+        self._request_count = 0
+        self._failure_count = 0
+        self._missed_count = 0
+        self._wakeup_count = 0
+        self._total_lateness = 0.0
+        self._max_lateness = 0.0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(message_services), thread_name_prefix='HeartbeatScheduler')
+        self._thread = threading.Thread(target=self._run, name='HeartbeatScheduler', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Stop sending heartbeats. Utilizations are not ended.
+        """
+        with self._condition:
+            if self._closing:
+                return
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def add(self, utilization):
+        """
+        Send heartbeats for a utilization until it is removed.
+
+        :param utilization: The id of the utilization to keep alive, as sent in
+            its ``AssetPerformanceManagementRecordAssetUtilizationStartRequest``.
+        :type utilization: str
+        """
+        with self._condition:
+            if self._closing:
+                raise RuntimeError('HeartbeatScheduler is closed')
+            if utilization in self._slot_of:
+                return
+            self._schedule(utilization, time.monotonic() + self._interval)
+
+    def remove(self, utilization):
+        """
+        Stop sending heartbeats for a utilization.
+
+        :param utilization: A utilization id passed to :meth:`add`.
+        :type utilization: str
+        """
+        with self._condition:
+            slot = self._slot_of.pop(utilization, None)
+            if slot is not None:
+                self._slots[slot].discard(utilization)
+
+    def statistics(self):
+        """
+        Return the counters of this scheduler.
+
+        :return: The number of ``active`` utilizations and of distinct
+            ``slots``, the ``heartbeats`` sent, the ``requests`` they were
+            sent in and the heartbeats that failed (``failures``), the
+            ``wakeups`` of the scheduler thread, the slots that were ``missed``
+            by more than one resolution, and the ``mean_lateness`` and
+            ``max_lateness`` of the wakeups, in seconds.
+        :rtype: dict
+        """
+        with self._condition:
+            return {
+                'active': len(self._slot_of),
+                'slots': sum(1 for members in self._slots.values() if members),
+                'heartbeats': self._heartbeat_count,
+                'requests': self._request_count,
+                'failures': self._failure_count,
+                'wakeups': self._wakeup_count,
+                'missed': self._missed_count,
+                'mean_lateness': (self._total_lateness / self._wakeup_count
+                                  if self._wakeup_count else 0.0),
+                'max_lateness': self._max_lateness,
+            }
+
+    def _schedule(self, utilization, deadline):
+        slot = int(math.ceil(deadline / self._resolution))
+        members = self._slots.get(slot)
+        if members is None:
+            members = self._slots[slot] = set()
+            # A random time within the slot, so due times stay in slot order
+            self._due_times[slot] = (slot - 1 + self._random.random()) * self._resolution
+            heapq.heappush(self._heap, slot)
+            self._condition.notify_all()
+        members.add(utilization)
+        self._slot_of[utilization] = slot
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._next_due_slot()
+                if due is None:
+                    return
+                slot, due_time, members = due
+                deadline = slot * self._resolution
+                lateness = max(time.monotonic() - due_time, 0.0)
+                self._wakeup_count += 1
+                self._total_lateness += lateness
+                self._max_lateness = max(self._max_lateness, lateness)
+                if lateness > self._resolution:
+                    self._missed_count += 1
+                for utilization in members:
+                    self._schedule(utilization, deadline + self._interval)
+            batches = [members[start:start + self._max_batch]
+                       for start in range(0, len(members), self._max_batch)]
+            failures = sum(self._executor.map(self._send_heartbeats, batches))
+            with self._condition:
+                self._heartbeat_count += len(members)
+                self._request_count += len(batches)
+                self._failure_count += failures
+
+    def _send_heartbeats(self, utilization_ids):
+        """
+        Send one heartbeat request for several utilizations.
+
+        :return: The number of heartbeats that failed.
+        :rtype: int
+        """
+        header = MessageHeader(
+            message_name='AssetPerformanceManagementRecordAssetUtilizationHeartbeatRequest',
+            content_type='application/json',
+            routing_param='AssetPerformanceManagement'
+        )
+        generic_message = GenericMessage(
+            header=header, body=json.dumps({'utilizationIds': utilization_ids}))
+        message_service = self._idle_services.get()
+        try:
+            response = message_service.publish_synchronous_message(generic_message)
+            if response is None:
+                raise SystemLinkException.from_name('Skyline.RequestTimedOut')
+            if response.has_error():
+                raise SystemLinkException(error=response.error)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.warning('Heartbeat failed for %d utilizations: %s', len(utilization_ids), exc)
+            return len(utilization_ids)
+        finally:
+            self._idle_services.put(message_service)
+        return 0
+
+    def _next_due_slot(self):
+        while not self._closing:
+            if not self._heap:
+                self._condition.wait()
+                continue
+            slot = self._heap[0]
+            members = self._slots[slot]
+            if not members:
+                heapq.heappop(self._heap)
+                del self._slots[slot]
+                del self._due_times[slot]
+                continue
+            remaining = self._due_times[slot] - time.monotonic()
+            if remaining > 0:
+                self._condition.wait(remaining)
+                continue
+            heapq.heappop(self._heap)
+            del self._slots[slot]
+            return slot, self._due_times.pop(slot), list(members)
+        return None
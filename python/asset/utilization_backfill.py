@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, resumable backfill of asset utilization history.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.messagebus.exceptions import SystemLinkException
+from systemlink.messagebus.generic_message import GenericMessage
+from systemlink.messagebus.message_header import MessageHeader
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Checkpoint file markers
+_STARTED = 'S'
+_ENDED = 'E'
+# The start request was rejected by the service, so the utilization was not started
+_NOT_STARTED = 'N'
+
+# Fields of an asset identification that identify the asset across runs
+_ASSET_IDENTITY_FIELDS = ('vendorNumber', 'modelNumber', 'serialNumber')
+
+
+class UtilizationBackfill():
+    """
+    Record many past asset utilizations, one request in flight per message service.
+
+    Each utilization is a start/end pair of requests to the Asset Performance
+    Management service. A message service is used by one thread at a time,
+    so as many utilizations are recorded at the same time as message
+    services are given. Progress is appended to a checkpoint file, so a
+    backfill that is interrupted resumes where it stopped: completed
+    utilizations are skipped and utilizations that were started but not
+    ended only send their end request. Utilization ids are derived from the
+    utilization itself, so a resumed utilization keeps its id.
+
+    The start of a utilization is recorded in the checkpoint before its
+    request is published, so a start is never sent twice, even when the
+    backfill stops between the request and the checkpoint. It is retracted
+    when the service rejects the start. If the backfill stops after the
+    start is recorded but before the request is published, the resumed end
+    request fails and the utilization is reported as failed.
+    """
+    def __init__(self,
+                 message_service,
+                 checkpoint_path=None,
+                 report_interval=10.0,
+                 progress_callback=None):
+        """
+        :param message_service: The message service used to publish the
+            requests, or several to record as many utilizations at the same time.
+        :type message_service: systemlink.messagebus.message_service.MessageService or
+            list(systemlink.messagebus.message_service.MessageService)
+        :param checkpoint_path: The file progress is recorded in and resumed
+            from, or ``None`` to not record progress.
+        :type checkpoint_path: str or None
+        :param report_interval: Time, in seconds, between two progress reports.
+        :type report_interval: float or int
+        :param progress_callback: Called with the dict returned by :meth:`progress`
+            at every report, or ``None`` to log the progress instead.
+        :type progress_callback: callable or None
+        """
+        if isinstance(message_service, (list, tuple)):
+            self._message_services = list(message_service)
+        else:
+            self._message_services = [message_service]
+        self._idle_services = queue.Queue()
+        for service in self._message_services:
+            self._idle_services.put(service)
+        self._checkpoint_path = checkpoint_path
+        self._report_interval = report_interval
+        self._progress_callback = progress_callback
+        self._lock = threading.Lock()
+        self._started = set()
+        self._ended = set()
+        self._load_checkpoint()
+        self._reset_progress(None)
+
+    def progress(self):
+        """
+        Return the progress of the current or last :meth:`run`.
+
+        :return: ``completed``, ``skipped`` and ``failed`` utilization counts,
+            ``total`` if known, the ``elapsed`` time in seconds, the
+            ``throughput`` in utilizations per second and the ``eta`` in
+            seconds if ``total`` is known.
+        :rtype: dict
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._start_time
+            throughput = self._completed / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self._total is not None and throughput > 0:
+                remaining = self._total - self._completed - self._skipped - self._failed
+                eta = max(remaining, 0) / throughput
+            return {
+                'completed': self._completed,
+                'skipped': self._skipped,
+                'failed': self._failed,
+                'total': self._total,
+                'elapsed': elapsed,
+                'throughput': throughput,
+                'eta': eta,
+            }
+
+    def run(self, utilizations, total=None):
+        """
+        Record utilizations
+
+        :param utilizations: Dicts with the ``minionId``,
+            ``systemControllerIdentification``, ``assetIdentifications``,
+            ``utilizationCategory``, ``taskName``, ``userName``,
+            ``startTimestamp`` and ``endTimestamp`` keys. Timestamps are ISO
+            8601 strings. May be a generator.
+        :type utilizations: iterable(dict)
+        :param total: Number of utilizations, used to compute the ETA, or ``None``.
+        :type total: int or None
+        :return: The final progress, as returned by :meth:`progress`.
+        :rtype: dict
+        """
+        self._reset_progress(total)
+        last_report = time.monotonic()
+        max_in_flight = len(self._message_services)
+        with contextlib.ExitStack() as stack:
+            checkpoint = None
+            if self._checkpoint_path is not None:
+                checkpoint = stack.enter_context(open(self._checkpoint_path, 'a'))
+            executor = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight))
+            in_flight = set()
+            for utilization in utilizations:
+                key = utilization_key(utilization)
+                if key in self._ended:
+                    with self._lock:
+                        self._skipped += 1
+                    continue
+                if len(in_flight) >= max_in_flight:
+                    _, in_flight = concurrent.futures.wait(
+                        in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                in_flight.add(executor.submit(self._record, key, utilization, checkpoint))
+                if time.monotonic() - last_report >= self._report_interval:
+                    self._report()
+                    last_report = time.monotonic()
+            concurrent.futures.wait(in_flight)
+        self._report()
+        return self.progress()
+
+    def _record(self, key, utilization, checkpoint):
+        utilization_id = str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+        message_service = self._idle_services.get()
+        try:
+            if key not in self._started:
+                start_request = {
+                    'startUtilizationRecord': {
+                        'utilizationId': utilization_id,
+                        'minionId': utilization['minionId'],
+                        'systemControllerIdentification':
+                            utilization['systemControllerIdentification'],
+                        'assetIdentifications': utilization['assetIdentifications'],
+                        'utilizationCategory': utilization.get('utilizationCategory', 'Test'),
+                        'taskName': utilization.get('taskName', 'Testing'),
+                        'userName': utilization.get('userName'),
+                        'utilizationTimestamp': utilization['startTimestamp'],
+                    }
+                }
+                # Recorded first, so a start that may have been applied is never sent again
+                self._checkpoint(checkpoint, _STARTED, key)
+                self._publish(message_service,
+                              'AssetPerformanceManagementRecordAssetUtilizationStartRequest',
+                              start_request,
+                              lambda: self._checkpoint(checkpoint, _NOT_STARTED, key))
+            self._publish(message_service,
+                          'AssetPerformanceManagementRecordAssetUtilizationEndRequest',
+                          {'utilizationId': utilization_id,
+                           'utilizationTimestamp': utilization['endTimestamp']})
+            self._checkpoint(checkpoint, _ENDED, key)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.warning('Failed to record utilization %s: %s', utilization_id, exc)
+            with self._lock:
+                self._failed += 1
+            return
+        finally:
+            self._idle_services.put(message_service)
+        with self._lock:
+            self._completed += 1
+
+    @staticmethod
+    def _publish(message_service, message_name, body, on_rejected=None):
+        """
+        Publish a request and raise if it fails.
+
+        ``on_rejected`` is called if the service rejects the request, which was
+        then not applied. A request that timed out may have been applied.
+        """
+        header = MessageHeader(
+            message_name=message_name,
+            content_type='application/json',
+            routing_param='AssetPerformanceManagement'
+        )
+        generic_message = GenericMessage(header=header, body=json.dumps(body))
+        response = message_service.publish_synchronous_message(generic_message)
+        if response is None:
+            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
+        if response.has_error():
+            if on_rejected is not None:
+                on_rejected()
+            raise SystemLinkException(error=response.error)
+        return response
+
+    def _checkpoint(self, checkpoint, marker, key):
+        with self._lock:
+            if checkpoint is not None:
+                checkpoint.write('{} {}\n'.format(marker, key))
+                checkpoint.flush()
+            _apply_marker(marker, key, self._started, self._ended)
+
+    def _load_checkpoint(self):
+        if self._checkpoint_path is None or not os.path.exists(self._checkpoint_path):
+            return
+        with open(self._checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                marker, _, key = line.strip().partition(' ')
+                _apply_marker(marker, key, self._started, self._ended)
+        LOGGER.info('Resuming backfill: %d utilizations already recorded', len(self._ended))
+
+    def _reset_progress(self, total):
+        with self._lock:
+            self._total = total
+            self._completed = 0
+            self._skipped = 0
+            self._failed = 0
+            self._start_time = time.monotonic()
+
+    def _report(self):
+        progress = self.progress()
+        if self._progress_callback is not None:
+            self._progress_callback(progress)
+            return
+        eta = progress['eta']
+        LOGGER.info('%d completed, %d skipped, %d failed, %.1f utilizations/s, ETA %s',
+                    progress['completed'], progress['skipped'], progress['failed'],
+                    progress['throughput'], 'unknown' if eta is None else '{:.0f} s'.format(eta))
+
+
+def _apply_marker(marker, key, started, ended):
+    """
+    Apply one checkpoint marker to the sets of started and ended utilization keys.
+    """
+    if marker == _STARTED:
+        started.add(key)
+    elif marker == _NOT_STARTED:
+        started.discard(key)
+    elif marker == _ENDED:
+        ended.add(key)
+
+
+def utilization_key(utilization):
+    """
+    Return the key that identifies a utilization across runs.
+
+    The key covers the system, the vendor, model and serial number of the
+    assets and the start time, which are the same every time a utilization
+    is generated for an asset slot. The user, category, task, end time and
+    the other asset fields, such as timestamps and properties, are not part
+    of the key, so a utilization generated again with a different random
+    operator or from a newer asset query still has the same key.
+
+    :param utilization: The utilization, as accepted by :meth:`UtilizationBackfill.run`.
+    :type utilization: dict
+    :rtype: str
+    """
+    assets = sorted(json.dumps([asset.get(field) for field in _ASSET_IDENTITY_FIELDS],
+                               default=str)
+                    for asset in utilization['assetIdentifications'])
+    identity = json.dumps([utilization['minionId'], assets, utilization['startTimestamp']])
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
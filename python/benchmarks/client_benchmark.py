@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Offline throughput benchmark of the SystemLink clients against FakeMessageService
+and FakeHttpService.
+
+Example::
+
+    python client_benchmark.py --batch-sizes 1 10 100 1000 --latency 0.002 --jitter 0.001
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+# Import third party libs
+import numpy as np
+
+# Import local libs
+# pylint: disable=import-error,wrong-import-position
+_PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.extend(os.path.join(_PYTHON_DIR, name) for name in ('asset', 'file', 'tag', 'tdms'))
+from systemlink.testmonclient import TestMonitorClient
+from fake_http_service import FakeHttpService
+from fake_message_service import FakeMessageService
+from utilization_backfill import UtilizationBackfill
+# pylint: enable=import-error,wrong-import-position
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+BATCH_SIZES = (1, 10, 100, 1000)
+
+# Steps per result, and result ids per request, of the query_steps_for_results benchmark
+STEPS_PER_RESULT = 5
+STEP_QUERY_CHUNK_SIZE = 25
+
+# Values per tag, and per page, of the tag history benchmark
+HISTORY_LENGTH = 1000
+HISTORY_PAGE_SIZE = 250
+
+# Size of a chunk of the file upload benchmark
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def benchmark(operation, batch_size, iterations):
+    """
+    Time an operation and measure its peak traced memory
+
+    Latencies are measured without tracing. The operation is then run once
+    more per iteration with :mod:`tracemalloc` tracing, so tracing does not
+    distort the timings. The peak is the highest size of the memory blocks
+    traced during one call, not a count of allocations.
+
+    :param operation: Callable that takes ``batch_size`` and performs one call.
+    :type operation: callable
+    :param batch_size: Number of items per call.
+    :type batch_size: int
+    :param iterations: Number of calls.
+    :type iterations: int
+    :return: The ``ops_per_second`` (items per second), ``p50`` and ``p99``
+        call latencies in seconds, and the mean ``peak_bytes`` traced per call.
+    :rtype: dict
+    """
+    operation(batch_size)
+    latencies = np.empty(iterations)
+    for index in range(iterations):
+        start = time.perf_counter()
+        operation(batch_size)
+        latencies[index] = time.perf_counter() - start
+    peaks = np.empty(iterations)
+    for index in range(iterations):
+        tracemalloc.start()
+        operation(batch_size)
+        peaks[index] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'ops_per_second': float(batch_size * iterations / latencies.sum()),
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'peak_bytes': float(peaks.mean()),
+    }
+
+
+def test_monitor_operations(message_service, workers=4):
+    """
+    Return the Test Monitor operations to benchmark.
+
+    :param workers: Number of clients ``query_steps_for_results`` queries with.
+    :type workers: int
+    :rtype: dict(str, callable)
+    """
+    client = TestMonitorClient(message_service=message_service)
+    other_clients = [TestMonitorClient(message_service=message_service)
+                     for _ in range(workers - 1)]
+    result_id = client.create_results([_result()]).results[0].id
+    step_result_ids = []
+
+    def create_results(batch_size):
+        client.create_results([_result() for _ in range(batch_size)])
+
+    def create_steps(batch_size):
+        client.create_steps([_step(result_id) for _ in range(batch_size)])
+
+    def query_results(batch_size):
+        client.query_results(None, 0, batch_size)
+
+    def create_results_from_frame(batch_size):
+        client.create_results_from_frame(_result_frame(batch_size))
+
+    def query_steps_for_results(batch_size):
+        # The results are created by the first, untimed, call of each batch size
+        while len(step_result_ids) < batch_size:
+            new_result_id = client.create_results([_result()]).results[0].id
+            client.create_steps([_step(new_result_id) for _ in range(STEPS_PER_RESULT)])
+            step_result_ids.append(new_result_id)
+        client.query_steps_for_results(step_result_ids[:batch_size],
+                                       chunk_size=STEP_QUERY_CHUNK_SIZE,
+                                       clients=other_clients)
+
+    return {
+        'create_results': create_results,
+        'create_steps': create_steps,
+        'query_results': query_results,
+        'create_results_from_frame': create_results_from_frame,
+        'query_steps_for_results': query_steps_for_results,
+    }
+
+
+def tag_operations(message_service):
+    """
+    Return the Tag operations to benchmark, or none if the Tag client is not installed.
+
+    :rtype: dict(str, callable)
+    """
+    try:
+        from systemlink.tagclient import TagClient  # pylint: disable=import-error
+    except ImportError:
+        LOGGER.warning('systemlink.tagclient is not installed, skipping tag benchmarks')
+        return {}
+    client = TagClient(message_service=message_service)
+
+    def update_tags(batch_size):
+        client.update_tags([{'path': 'benchmark.tag{}'.format(index),
+                             'type': 'DOUBLE',
+                             'value': str(float(index))} for index in range(batch_size)])
+
+    return {'update_tags': update_tags}
+
+
+def asset_operations(message_service):
+    """
+    Return the utilization start/end operation to benchmark.
+
+    :rtype: dict(str, callable)
+    """
+    def record_utilizations(batch_size):
+        backfill = UtilizationBackfill(message_service, report_interval=float('inf'),
+                                       progress_callback=lambda progress: None)
+        backfill.run(_utilization(index) for index in range(batch_size))
+
+    return {'utilization_start_end': record_utilizations}
+
+
+def tag_history_operations(http_service, max_workers=8):
+    """
+    Return the tag history read to benchmark, or none if requests is not installed.
+
+    :param max_workers: Maximum number of tags read at the same time.
+    :type max_workers: int
+    :rtype: dict(str, callable)
+    """
+    from tag_history import TagHistoryReader, TagHistorianSource  # pylint: disable=import-error
+    try:
+        source = TagHistorianSource(http_service.server_url, max_connections=max_workers)
+    except ImportError:
+        LOGGER.warning('requests is not installed, skipping tag history benchmarks')
+        return {}
+    reader = TagHistoryReader(source.fetch_page, page_size=HISTORY_PAGE_SIZE,
+                              max_workers=max_workers)
+    start = datetime.datetime(2020, 1, 1)
+    values = [((start + datetime.timedelta(seconds=index)).isoformat() + 'Z', str(float(index)))
+              for index in range(HISTORY_LENGTH)]
+    paths = []
+
+    def read_history(batch_size):
+        while len(paths) < batch_size:
+            paths.append('benchmark.history{}'.format(len(paths)))
+            http_service.add_history(paths[-1], values)
+        reader.read(paths[:batch_size], start,
+                    start + datetime.timedelta(seconds=HISTORY_LENGTH))
+
+    return {'read_tag_history': read_history}
+
+
+def file_operations(http_service, max_workers=4):
+    """
+    Return the file upload to benchmark, or none if requests is not installed.
+
+    :param max_workers: Maximum number of chunks sent at the same time.
+    :type max_workers: int
+    :rtype: dict(str, callable)
+    """
+    try:
+        from file_upload import FileUploader  # pylint: disable=import-error
+    except ImportError:
+        LOGGER.warning('requests is not installed, skipping file upload benchmarks')
+        return {}
+    uploader = FileUploader(http_service.server_url, chunk_size=UPLOAD_CHUNK_SIZE,
+                            max_workers=max_workers)
+    chunk = os.urandom(UPLOAD_CHUNK_SIZE)
+
+    def upload_file(batch_size):
+        uploader.upload_stream((chunk for _ in range(batch_size)), 'benchmark.bin')
+
+    return {'upload_chunks': upload_file}
+
+
+def tdms_operations(message_service):
+    """
+    Return the TDMS reader operations to benchmark, or none if the client is not installed.
+
+    :rtype: dict(str, callable)
+    """
+    try:
+        # pylint: disable=import-error
+        from systemlink.tdmsreaderclient import TDMSReaderClient
+        from tdms_channels import read_channels, sample_window
+        # pylint: enable=import-error
+    except ImportError:
+        LOGGER.warning('systemlink.tdmsreaderclient is not installed, skipping TDMS benchmarks')
+        return {}
+    client = TDMSReaderClient(message_service=message_service)
+    channel_names = ['sine_wave{}'.format(index) for index in range(10)]
+    for channel_name in channel_names:
+        message_service.add_channel('benchmark', 'signals', channel_name, np.random.randn(1000))
+
+    def read_channels_operation(batch_size):
+        read_channels(client, 'benchmark', 'signals', channel_names,
+                      sample_window(0, min(batch_size, 1000)))
+
+    return {'read_channels': read_channels_operation}
+
+
+def main(argv=None):
+    """
+    Run the benchmarks and print one line per operation and batch size.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Mean simulated round trip time, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximum deviation from the latency, in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    message_service = FakeMessageService(args.latency, args.jitter, args.seed)
+    http_service = FakeHttpService(args.latency, args.jitter, args.seed)
+    # Operation and the fake service it sends its requests to, by name
+    operations = {}
+    for service, operations_of_service in (
+            (message_service, test_monitor_operations(message_service)),
+            (message_service, tag_operations(message_service)),
+            (message_service, asset_operations(message_service)),
+            (message_service, tdms_operations(message_service)),
+            (http_service, tag_history_operations(http_service)),
+            (http_service, file_operations(http_service))):
+        operations.update((name, (operation, service))
+                          for name, operation in operations_of_service.items())
+
+    print('{:<28}{:>8}{:>14}{:>12}{:>12}{:>14}{:>12}'.format(
+        'operation', 'batch', 'items/s', 'p50 (ms)', 'p99 (ms)', 'peak KiB', 'in flight'))
+    try:
+        for name, (operation, service) in operations.items():
+            for batch_size in args.batch_sizes:
+                service.reset_counters()
+                stats = benchmark(operation, batch_size, args.iterations)
+                print('{:<28}{:>8}{:>14.0f}{:>12.3f}{:>12.3f}{:>14.1f}{:>12}'.format(
+                    name, batch_size, stats['ops_per_second'], stats['p50'] * 1000,
+                    stats['p99'] * 1000, stats['peak_bytes'] / 1024,
+                    service.peak_active_count))
+    finally:
+        http_service.close()
+
+
+def _result():
+    return {
+        'status': 'PASSED',
+        'startedAt': datetime.datetime.now(),
+        'programName': 'Benchmark',
+        'systemId': 'benchmark',
+        'hostName': 'benchmark',
+        'operator': 'benchmark',
+        'serialNumber': str(uuid.uuid4()),
+        'totalTimeInSeconds': 1.0,
+        'keywords': [],
+        'properties': {},
+        'fileIds': [],
+    }
+
+
+def _result_frame(length):
+    """
+    Return the columns of ``length`` results, as accepted by ``create_results_from_frame``.
+
+    :rtype: dict(str, numpy.ndarray or list)
+    """
+    return {
+        'status': np.full(length, 'PASSED', dtype=object),
+        'startedAt': np.full(length, np.datetime64(datetime.datetime.now(), 'us')),
+        'programName': np.full(length, 'Benchmark', dtype=object),
+        'systemId': np.full(length, 'benchmark', dtype=object),
+        'hostName': np.full(length, 'benchmark', dtype=object),
+        'operator': np.full(length, 'benchmark', dtype=object),
+        'serialNumber': [str(uuid.uuid4()) for _ in range(length)],
+        'totalTimeInSeconds': np.ones(length),
+    }
+
+
+def _step(result_id):
+    return {
+        'name': 'Benchmark step',
+        'stepType': 'NumericLimit',
+        'stepId': str(uuid.uuid4()),
+        'parentId': None,
+        'resultId': result_id,
+        'status': 'PASSED',
+        'totalTimeInSeconds': 0.1,
+        'startedAt': datetime.datetime.now(),
+        'dataModel': 'TestStand',
+        'data': {'text': None, 'parameters': []},
+    }
+
+
+def _utilization(index):
+    timestamp = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index)
+    return {
+        'minionId': 'benchmark',
+        'systemControllerIdentification': {},
+        'assetIdentifications': [],
+        'userName': str(uuid.uuid4()),
+        'startTimestamp': timestamp.isoformat() + 'Z',
+        'endTimestamp': (timestamp + datetime.timedelta(seconds=30)).isoformat() + 'Z',
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP server that stands in for the File and Tag Historian services.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import http.server
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Routes of the File and Tag Historian HTTP APIs
+_SESSIONS_ROUTE = '/nifile/v1/service-groups/Default/upload-sessions'
+_FINISH_ROUTE = _SESSIONS_ROUTE + '/finish'
+_FILES_ROUTE = '/nifile/v1/service-groups/Default/files'
+_QUERY_HISTORY_ROUTE = '/nitaghistorian/v2/tags/query-history'
+
+
+class FakeHttpService():
+    """
+    Answer upload session and tag history requests on a loopback port.
+
+    Its :attr:`server_url` can be passed to :class:`FileUploader` and
+    :class:`TagHistorianSource`, so that they send real HTTP requests without
+    a SystemLink server. Each request is answered by its own thread after
+    ``latency`` seconds, plus or minus up to ``jitter`` seconds, and the state
+    of each service is kept under a lock of its own. ``active_count`` and
+    ``peak_active_count`` count the requests being answered, as in
+    :class:`FakeMessageService`.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        """
+        :param latency: Mean time, in seconds, before a request is answered.
+        :type latency: float or int
+        :param jitter: Maximum deviation, in seconds, from ``latency``.
+        :type jitter: float or int
+        :param seed: Seed of the jitter, or ``None``.
+        :type seed: int or None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        self.sessions = {}
+        self.files = {}
+        self.histories = {}
+        self.request_count = 0
+        self.active_count = 0
+        self.peak_active_count = 0
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _handler_class(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='FakeHttpService', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def server_url(self):
+        """
+        The URL to send the requests to, such as ``http://127.0.0.1:50000``.
+
+        :rtype: str
+        """
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def close(self):
+        """
+        Stop the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def reset_counters(self):
+        """
+        Set ``request_count`` back to zero and ``peak_active_count`` to ``active_count``.
+        """
+        with self._counter_lock:
+            self.request_count = 0
+            self.peak_active_count = self.active_count
+
+    def add_history(self, path, values):
+        """
+        Add the retained values of a tag answered to ``query-history`` requests.
+
+        :param path: The tag path.
+        :type path: str
+        :param values: The ``(timestamp, value)`` pairs of the tag, in time
+            order, with ISO 8601 timestamps and string values.
+        :type values: list(tuple(str, str))
+        """
+        with self._history_lock:
+            self.histories[path] = [{'timestamp': timestamp, 'value': value}
+                                    for timestamp, value in values]
+
+    def answer(self, method, route, query, body):
+        """
+        Return the status code and JSON body of the response to a request.
+
+        :param method: The HTTP method.
+        :type method: str
+        :param route: The path of the URL.
+        :type route: str
+        :param query: The query string parameters.
+        :type query: dict(str, str)
+        :param body: The request body.
+        :type body: bytes
+        :rtype: tuple(int, dict)
+        """
+        with self._counter_lock:
+            self.request_count += 1
+            self.active_count += 1
+            self.peak_active_count = max(self.peak_active_count, self.active_count)
+        try:
+            self._wait()
+            if route == _QUERY_HISTORY_ROUTE and method == 'POST':
+                with self._history_lock:
+                    return 200, self._query_history(json.loads(body.decode('utf-8')))
+            with self._file_lock:
+                return self._upload_request(method, route, query, body)
+        finally:
+            with self._counter_lock:
+                self.active_count -= 1
+
+    def _wait(self):
+        if not self.latency and not self.jitter:
+            return
+        with self._random_lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _upload_request(self, method, route, query, body):
+        if route == _SESSIONS_ROUTE and method == 'POST':
+            session_id = uuid.uuid4().hex
+            self.sessions[session_id] = {}
+            return 201, {'sessionId': session_id}
+        if route == _FINISH_ROUTE and method == 'POST':
+            request = json.loads(body.decode('utf-8'))
+            chunks = self.sessions.pop(request['sessionId'], None)
+            if chunks is None:
+                return 404, {}
+            file_id = uuid.uuid4().hex
+            self.files[file_id] = {'name': request['fileName'],
+                                   'size': sum(chunks.values())}
+            return 200, {'uri': '{}/{}'.format(_FILES_ROUTE, file_id)}
+        session_id = route[len(_SESSIONS_ROUTE) + 1:]
+        if not route.startswith(_SESSIONS_ROUTE + '/') or session_id not in self.sessions:
+            return 404, {}
+        if method == 'PUT':
+            # The size of the multipart body is close enough to the size of the chunk
+            self.sessions[session_id][int(query.get('chunkIndex', 0))] = len(body)
+            return 200, {}
+        if method == 'DELETE':
+            del self.sessions[session_id]
+            return 200, {}
+        return 405, {}
+
+    def _query_history(self, request):
+        values = [value for value in self.histories.get(request.get('path'), [])
+                  if request['startTime'] <= value['timestamp'] <= request['endTime']]
+        skip = int(request.get('continuationToken') or 0)
+        take = request.get('take') or len(values)
+        page = values[skip:skip + take]
+        continuation = str(skip + take) if skip + take < len(values) else None
+        return {'values': page, 'continuationToken': continuation}
+
+
+def _handler_class(service):
+    """
+    Return the request handler class of the server of a :class:`FakeHttpService`.
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """
+        Pass every request to :meth:`FakeHttpService.answer`.
+        """
+        protocol_version = 'HTTP/1.1'
+        # The headers and the body are written separately; do not delay the body
+        disable_nagle_algorithm = True
+
+        def _answer(self):
+            url = urllib.parse.urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            query = dict(urllib.parse.parse_qsl(url.query))
+            status, response = service.answer(self.command, url.path, query, body)
+            content = json.dumps(response).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_POST = do_PUT = do_DELETE = _answer
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            LOGGER.debug(format, *args)
+
+    return Handler
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stand-in for the message service that answers requests from memory.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import datetime
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.messagebus.generic_message import GenericMessage
+from systemlink.messagebus.message_header import MessageHeader
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class FakeMessageService():
+    """
+    Answer Test Monitor, Tag, Asset and TDMS reader requests without a broker.
+
+    It can be passed as ``message_service`` to any client. Requests are
+    answered from in-memory state after ``latency`` seconds, plus or minus up
+    to ``jitter`` seconds, so that the client-side cost of serializing,
+    publishing and decoding can be measured offline. Requests without a
+    handler are answered with an empty JSON object; :meth:`register` adds
+    or replaces the handler of a message name.
+
+    Requests wait out their latency without holding a lock, and each
+    service keeps its state under a lock of its own, so requests to
+    different services are also handled at the same time.
+    ``active_count`` is the number of requests being answered and
+    ``peak_active_count`` the highest it was since the counters were reset,
+    which shows how many requests a client really sends at the same time.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        """
+        :param latency: Mean time, in seconds, before a request is answered.
+        :type latency: float or int
+        :param jitter: Maximum deviation, in seconds, from ``latency``.
+        :type jitter: float or int
+        :param seed: Seed of the jitter, or ``None``.
+        :type seed: int or None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._test_monitor_lock = threading.Lock()
+        self._tag_lock = threading.Lock()
+        self._asset_lock = threading.Lock()
+        self._channel_lock = threading.Lock()
+        self.results = {}
+        self.steps = {}
+        self.tags = {}
+        self.assets = []
+        self.utilizations = {}
+        self.channels = {}
+        self.request_count = 0
+        self.routed_count = 0
+        self.active_count = 0
+        self.peak_active_count = 0
+        # Handler and lock of each message name
+        self._handlers = {
+            'TestMonitorCreateTestResultsRequest': (self._create_results,
+                                                    self._test_monitor_lock),
+            'TestMonitorUpdateTestResultsRequest': (self._update_results,
+                                                    self._test_monitor_lock),
+            'TestMonitorDeleteResultsRequest': (self._delete_results, self._test_monitor_lock),
+            'TestMonitorQueryResultsRequest': (self._query_results, self._test_monitor_lock),
+            'TestMonitorCreateTestStepsRequest': (self._create_steps, self._test_monitor_lock),
+            'TestMonitorUpdateTestStepsRequest': (self._update_steps, self._test_monitor_lock),
+            'TestMonitorDeleteStepsRequest': (self._delete_steps, self._test_monitor_lock),
+            'TestMonitorQueryStepsRequest': (self._query_steps, self._test_monitor_lock),
+            'AssetPerformanceManagementQueryAssetsRequest': (self._query_assets,
+                                                             self._asset_lock),
+            'AssetPerformanceManagementRecordAssetUtilizationStartRequest':
+                (self._start_utilization, self._asset_lock),
+            'AssetPerformanceManagementRecordAssetUtilizationEndRequest':
+                (self._end_utilization, self._asset_lock),
+            'AssetPerformanceManagementRecordAssetUtilizationHeartbeatRequest':
+                (self._utilization_heartbeat, self._asset_lock),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Nothing to release; present for compatibility with the message service.
+        """
+
+    def register(self, message_name, handler):
+        """
+        Answer the requests named ``message_name`` with ``handler``.
+
+        The handler is called under a lock of its own, so it handles one
+        request at a time.
+
+        :param message_name: The name of the request message.
+        :type message_name: str
+        :param handler: Callable that takes the decoded request body and returns
+            the body of the response, a JSON-serializable object.
+        :type handler: callable
+        """
+        self._handlers[message_name] = (handler, threading.Lock())
+
+    def reset_counters(self):
+        """
+        Set the request counters back to zero and ``peak_active_count`` to ``active_count``.
+        """
+        with self._counter_lock:
+            self.request_count = 0
+            self.routed_count = 0
+            self.peak_active_count = self.active_count
+
+    def publish_synchronous_message(self, message, timeout=None):
+        """
+        Answer a request.
+
+        If the reply would take longer than ``timeout``, the request is still
+        applied, as it would be by the service, but ``None`` is returned after
+        ``timeout`` seconds, as the message service does when no reply arrives.
+
+        :param message: The request.
+        :param timeout: Time, in seconds, to wait for the reply, or ``None``.
+        :type timeout: float or int or None
+        :return: The response, with a JSON body, or ``None`` on timeout.
+        :rtype: systemlink.messagebus.generic_message.GenericMessage or None
+        """
+        message_name, body = _decode(message)
+        with self._counter_lock:
+            self.request_count += 1
+            self.active_count += 1
+            self.peak_active_count = max(self.peak_active_count, self.active_count)
+        try:
+            timed_out = self._wait(timeout)
+            handler, lock = self._handlers.get(message_name, (None, None))
+            if handler is None and message_name.startswith('Tag'):
+                handler, lock = self._tags_request, self._tag_lock
+            elif handler is None and message_name.lower().startswith('tdmsreader'):
+                handler, lock = self._query_data, self._channel_lock
+            if handler is None:
+                response = '{}'
+            else:
+                with lock:
+                    # Serialized under the lock, since the response shares the stored dicts
+                    response = json.dumps(handler(body), default=str)
+        finally:
+            with self._counter_lock:
+                self.active_count -= 1
+        if timed_out:
+            return None
+        header = MessageHeader(message_name=message_name.replace('Request', 'Response'),
+                               content_type='application/json')
+        return GenericMessage(header=header, body=response)
+
+    def publish_routed_message(self, message):
+        """
+        Accept a message that has no response.
+
+        :param message: The message.
+        """
+        message_name, body = _decode(message)
+        with self._counter_lock:
+            self.routed_count += 1
+        if message_name.startswith('Tag'):
+            with self._tag_lock:
+                self._tags_request(body)
+        elif message_name == 'TestMonitorDeleteAllResultsRoutedMessage':
+            with self._test_monitor_lock:
+                self.results.clear()
+                self.steps.clear()
+
+    publish_broadcast_message = publish_routed_message
+
+    def add_channel(self, file_id, group_name, channel_name, data):
+        """
+        Add the numeric data of a TDMS channel answered to TDMS reader requests.
+
+        :param file_id: The id of the TDMS file.
+        :type file_id: str
+        :param group_name: The name of the group.
+        :type group_name: str
+        :param channel_name: The name of the channel.
+        :type channel_name: str
+        :param data: The numeric data of the channel.
+        :type data: list(float) or numpy.ndarray
+        """
+        with self._channel_lock:
+            self.channels[(file_id, group_name, channel_name)] = [float(value) for value in data]
+
+    def _wait(self, timeout=None):
+        """
+        Sleep for the latency of one request, at most ``timeout`` seconds.
+
+        :return: Whether the reply would have arrived after ``timeout``.
+        :rtype: bool
+        """
+        if not self.latency and not self.jitter:
+            return False
+        with self._random_lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))
+            return True
+        if delay > 0:
+            time.sleep(delay)
+        return False
+
+    def _create_results(self, body):
+        created = []
+        for result in body.get('results', []):
+            result = dict(result, id=result.get('id') or str(uuid.uuid4()), updatedAt=_now())
+            self.results[result['id']] = result
+            created.append(result)
+        return {'results': created, 'failed': []}
+
+    def _update_results(self, body):
+        updated = []
+        for update in body.get('results', []):
+            result = self.results.get(update.get('id'))
+            if result is None:
+                continue
+            _apply_result_update(result, update, body.get('replace', False))
+            updated.append(result)
+        return {'results': updated, 'failed': []}
+
+    def _delete_results(self, body):
+        for result_id in body.get('ids', []):
+            self.results.pop(result_id, None)
+        if body.get('deleteSteps', True):
+            deleted = set(body.get('ids', []))
+            for key in [key for key in self.steps if key[0] in deleted]:
+                del self.steps[key]
+        return {}
+
+    def _query_results(self, body):
+        query = body.get('query') or {}
+        results = list(self.results.values())
+        if query.get('ids'):
+            ids = set(query['ids'])
+            results = [result for result in results if result['id'] in ids]
+        return _page(results, 'results', body)
+
+    def _create_steps(self, body):
+        created = []
+        for step in _flatten(body.get('steps', [])):
+            step = dict(step, stepId=step.get('stepId') or str(uuid.uuid4()), updatedAt=_now())
+            self.steps[(step.get('resultId'), step['stepId'])] = step
+            created.append(step)
+        return {'steps': created, 'failed': []}
+
+    def _update_steps(self, body):
+        updated = []
+        for update in body.get('steps', []):
+            step = self.steps.get((update.get('resultId'), update.get('stepId')))
+            if step is not None:
+                step.update(update, updatedAt=_now())
+                updated.append(step)
+        return {'steps': updated, 'failed': []}
+
+    def _delete_steps(self, body):
+        for step in body.get('steps', []):
+            self.steps.pop((step.get('resultId'), step.get('stepId')), None)
+        return {}
+
+    def _query_steps(self, body):
+        query = body.get('query') or {}
+        steps = list(self.steps.values())
+        if query.get('resultIds'):
+            result_ids = set(query['resultIds'])
+            steps = [step for step in steps if step.get('resultId') in result_ids]
+        return _page(steps, 'steps', body)
+
+    def _query_assets(self, body):
+        assets = self.assets
+        # Only the delta filter of AssetIndex is understood
+        match = re.match(r'LastUpdatedTimestamp >= "(.*)"$', body.get('filter') or '')
+        if match:
+            assets = [asset for asset in assets
+                      if (asset.get('lastUpdatedTimestamp') or '') >= match.group(1)]
+        return _page(assets, 'assets', body)
+
+    def _start_utilization(self, body):
+        record = body.get('startUtilizationRecord', {})
+        self.utilizations[record.get('utilizationId')] = dict(record)
+        return {}
+
+    def _end_utilization(self, body):
+        utilization = self.utilizations.get(body.get('utilizationId'))
+        if utilization is not None:
+            utilization['endTimestamp'] = body.get('utilizationTimestamp')
+        return {}
+
+    def _utilization_heartbeat(self, body):
+        for utilization_id in body.get('utilizationIds', [body.get('utilizationId')]):
+            utilization = self.utilizations.get(utilization_id)
+            if utilization is not None:
+                utilization['heartbeatTimestamp'] = _now()
+        return {}
+
+    def _query_data(self, body):
+        """
+        Return the data window of the requested channels, one ``y`` entry per channel.
+        """
+        specifications = body.get('channelSpecs') or body.get('channels') or {}
+        window = body.get('dataWindow') or body.get('window') or {}
+        start = window.get('start') or 0
+        end = window.get('end')
+        data = []
+        for xy_channels in specifications.get('xyChannels', []):
+            rows = []
+            for channel in xy_channels.get('y', []):
+                values = self.channels.get((channel.get('fileId'), channel.get('groupName'),
+                                            channel.get('channelName')), [])
+                rows.append({'name': channel.get('channelName'),
+                             'numericData': values[start:end]})
+            data.append({'x': None, 'y': rows})
+        return {'data': data}
+
+    def _tags_request(self, body):
+        """
+        Store the tags and values of a Tag service request and return the requested ones.
+        """
+        tags = body.get('tags') or body.get('updates') or []
+        for tag in tags:
+            path = tag.get('path')
+            if path is not None:
+                self.tags.setdefault(path, {}).update(tag)
+        paths = body.get('paths') or []
+        return {'tags': [self.tags[path] for path in paths if path in self.tags]}
+
+
+def _decode(message):
+    """
+    Return the name and decoded body of a request.
+
+    :rtype: tuple(str, dict)
+    """
+    header = getattr(message, 'header', None)
+    message_name = getattr(header, 'message_name', None) or type(message).__name__
+    if hasattr(message, 'to_dict'):
+        return message_name, message.to_dict()
+    body = getattr(message, 'body', None)
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    if isinstance(body, str):
+        return message_name, json.loads(body) if body else {}
+    return message_name, body or {}
+
+
+def _apply_result_update(result, update, replace):
+    """
+    Apply an update to a result as the Test Monitor service does.
+
+    The fields of the update replace the fields of the result, except
+    ``properties``, which are merged, and ``keywords`` and ``fileIds``, which
+    are added to, unless ``replace`` is set.
+    """
+    for field, value in update.items():
+        current = result.get(field)
+        if replace or value is None or current is None:
+            result[field] = value
+        elif field == 'properties':
+            result[field] = dict(current, **value)
+        elif field in ('keywords', 'fileIds'):
+            result[field] = current + [item for item in value if item not in current]
+        else:
+            result[field] = value
+    result['updatedAt'] = _now()
+
+
+def _flatten(steps):
+    for step in steps:
+        yield step
+        for child in _flatten(step.get('children') or []):
+            yield child
+
+
+def _page(items, key, body):
+    skip = body.get('skip') or 0
+    take = body.get('take')
+    if take is None or take < 0:
+        take = len(items)
+    return {key: items[skip:skip + take], 'totalCount': len(items)}
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat() + 'Z'
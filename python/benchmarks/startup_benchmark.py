@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: import time and time to first message of a one-shot script.
+
+Each measurement runs in a fresh interpreter, as a station script would.
+With ``--station``, the time to hand a call to a running station daemon
+(``python/station/station.py serve``) is measured as well.
+
+Example::
+
+    python startup_benchmark.py --runs 10 --station
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+_STATION_DIR = os.path.join(os.path.dirname(_BENCHMARKS_DIR), 'station')
+
+# Each snippet prints the time, in seconds, from its first line to its end.
+IMPORT_CLIENT = '''
+import time
+start = time.perf_counter()
+import systemlink.testmonclient
+print(time.perf_counter() - start)
+'''
+
+FIRST_MESSAGE = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {benchmarks_dir!r})
+from systemlink.testmonclient import TestMonitorClient
+from fake_message_service import FakeMessageService
+client = TestMonitorClient(message_service=FakeMessageService())
+client.query_results(None, 0, 1)
+print(time.perf_counter() - start)
+'''
+
+STATION_HANDOFF = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {station_dir!r})
+from station import StationClient
+with StationClient() as station:
+    station.call('testmon', 'query_results', None, 0, 1)
+print(time.perf_counter() - start)
+'''
+
+
+def measure(snippet, runs):
+    """
+    Run a snippet in ``runs`` fresh interpreters
+
+    :param snippet: Python code that prints the time it measured, in seconds.
+    :type snippet: str
+    :param runs: Number of interpreters to run.
+    :type runs: int
+    :return: The median ``in_process`` time printed by the snippet and the
+        median ``wall`` time of the whole interpreter, in seconds.
+    :rtype: dict
+    """
+    in_process = []
+    wall = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', snippet], check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        wall.append(time.perf_counter() - start)
+        in_process.append(float(output.strip().splitlines()[-1]))
+    return {'in_process': statistics.median(in_process), 'wall': statistics.median(wall)}
+
+
+def main(argv=None):
+    """
+    Print the median startup times of a one-shot script.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--station', action='store_true',
+                        help='Also measure a call handed to a running station daemon')
+    args = parser.parse_args(argv)
+
+    snippets = [
+        ('import testmonclient', IMPORT_CLIENT),
+        ('first message (fake bus)', FIRST_MESSAGE.format(benchmarks_dir=_BENCHMARKS_DIR)),
+    ]
+    if args.station:
+        snippets.append(('station handoff', STATION_HANDOFF.format(station_dir=_STATION_DIR)))
+
+    print('{:<28}{:>16}{:>16}'.format('measurement', 'in-process (ms)', 'process (ms)'))
+    for name, snippet in snippets:
+        times = measure(snippet, args.runs)
+        print('{:<28}{:>16.1f}{:>16.1f}'.format(
+            name, times['in_process'] * 1000, times['wall'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
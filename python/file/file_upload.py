@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming, chunked uploads of buffers, generators and TDMS writers to the File service.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import contextlib
+import logging
+import threading
+import time
+
+# Import third party libs
+# pylint: disable=import-error
+import requests
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Upload session routes of the File service HTTP API
+_SESSIONS_ROUTE = '/nifile/v1/service-groups/Default/upload-sessions'
+_FINISH_ROUTE = _SESSIONS_ROUTE + '/finish'
+
+
+class FileUploader():
+    """
+    Upload files to the File service in chunks, without staging them on disk.
+
+    Each upload is an upload session of the File service: the content is cut
+    into ``chunk_size`` chunks, up to ``max_workers`` chunks are sent at the
+    same time, and the session is then finished under the file name. At most
+    ``max_workers + 1`` chunks are held in memory, whatever the size of the
+    upload. A chunk that fails is retried on its own, with exponential
+    backoff, up to ``retries`` times; the chunks that were already accepted
+    are not sent again. An upload that is aborted cancels its session, so
+    the server discards the chunks it received.
+
+    :class:`requests.Session` is not documented as safe to share between
+    threads, so each request uses a session no other request is using. Idle
+    sessions, and their connections, are reused; there are at most as many
+    as requests sent at the same time, ``max_workers + 1`` per upload.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 server_url,
+                 api_key=None,
+                 auth=None,
+                 verify=True,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_workers=4,
+                 retries=3):
+        """
+        :param server_url: The URL of the SystemLink server, such as
+            ``https://systemlink.example.com``.
+        :type server_url: str
+        :param api_key: An API key to authenticate with, or ``None``.
+        :type api_key: str or None
+        :param auth: The user name and password to authenticate with, or ``None``.
+        :type auth: tuple(str, str) or None
+        :param verify: Whether to verify the server certificate, or the path of
+            the CA bundle to verify it with.
+        :type verify: bool or str
+        :param chunk_size: Number of bytes sent per request.
+        :type chunk_size: int
+        :param max_workers: Maximum number of chunks sent at the same time.
+        :type max_workers: int
+        :param retries: Number of times a failed request is retried.
+        :type retries: int
+        """
+        self._server_url = server_url.rstrip('/')
+        self._verify = verify
+        self._api_key = api_key
+        self._auth = auth
+        self._sessions_lock = threading.Lock()
+        self._sessions = []
+        self._idle_sessions = []
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the HTTP connections.
+        """
+        with self._sessions_lock:
+            sessions = self._sessions
+            self._sessions = []
+            self._idle_sessions = []
+        for session in sessions:
+            session.close()
+
+    def upload_stream(self, source, name, properties=None):
+        """
+        Upload the content of a file object or of an iterable of chunks
+
+        :param source: A binary file object, or an iterable of ``bytes`` chunks
+            such as a generator.
+        :type source: io.BufferedIOBase or iterable(bytes)
+        :param name: The name of the file in the File service.
+        :type name: str
+        :param properties: Properties of the file, or ``None``.
+        :type properties: dict(str, str) or None
+        :return: The id of the uploaded file.
+        :rtype: str
+        """
+        with self.open_upload(name, properties) as upload:
+            if hasattr(source, 'read'):
+                while True:
+                    data = source.read(self.chunk_size)
+                    if not data:
+                        break
+                    upload.write(data)
+            else:
+                for data in source:
+                    upload.write(data)
+        return upload.file_id
+
+    def open_upload(self, name, properties=None):
+        """
+        Return a binary file object, and context manager, that uploads what is written to it
+
+        The upload is finished when the ``with`` block exits without an
+        exception, and the id of the file is then available as the
+        ``file_id`` attribute of the file object. A :class:`nptdms.TdmsWriter`
+        can stream segments to it directly::
+
+            with FileUploader(server_url, api_key) as uploader:
+                with uploader.open_upload('sine_wave.tdms') as upload:
+                    with TdmsWriter(upload) as tdms_writer:
+                        tdms_writer.write_segment([root, group, channel])
+                print(upload.file_id)
+
+        :param name: The name of the file in the File service.
+        :type name: str
+        :param properties: Properties of the file, or ``None``.
+        :type properties: dict(str, str) or None
+        :rtype: ChunkedUpload
+        """
+        return ChunkedUpload(self, name, properties)
+
+    def _request(self, method, route, **kwargs):
+        """
+        Send one request, retrying it with exponential backoff.
+
+        Connection errors and server errors are retried; client errors are not.
+
+        :return: The response.
+        :rtype: requests.Response
+        """
+        url = self._server_url + route
+        with self._checkout_session() as session:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = session.request(method, url, **kwargs)
+                except requests.RequestException as exc:
+                    error = exc
+                else:
+                    if response.status_code < 500:
+                        response.raise_for_status()
+                        return response
+                    error = requests.HTTPError(
+                        '{} {}'.format(response.status_code, response.reason), response=response)
+                if attempt == self.retries:
+                    raise error
+                delay = min(2 ** attempt, 30)
+                LOGGER.warning('%s %s failed, retrying in %d s: %s', method, route, delay, error)
+                time.sleep(delay)
+        return None
+
+    @contextlib.contextmanager
+    def _checkout_session(self):
+        """
+        Return a context manager that yields an HTTP session no other request is using.
+        """
+        with self._sessions_lock:
+            session = self._idle_sessions.pop() if self._idle_sessions else None
+        if session is None:
+            session = requests.Session()
+            session.verify = self._verify
+            if self._api_key is not None:
+                session.headers['x-ni-api-key'] = self._api_key
+            if self._auth is not None:
+                session.auth = self._auth
+            with self._sessions_lock:
+                self._sessions.append(session)
+        try:
+            yield session
+        finally:
+            with self._sessions_lock:
+                if session in self._sessions:
+                    self._idle_sessions.append(session)
+
+    def _start_session(self):
+        return self._request('POST', _SESSIONS_ROUTE).json()['sessionId']
+
+    def _send_chunk(self, session_id, index, data, last):
+        self._request('PUT', '{}/{}'.format(_SESSIONS_ROUTE, session_id),
+                      params={'chunkIndex': index, 'close': 'true' if last else 'false'},
+                      files={'file': ('chunk', data, 'application/octet-stream')})
+
+    def _cancel_session(self, session_id):
+        self._request('DELETE', '{}/{}'.format(_SESSIONS_ROUTE, session_id))
+
+    def _finish_session(self, session_id, name, properties):
+        body = {'sessionId': session_id, 'fileName': name}
+        if properties:
+            body['properties'] = properties
+        uri = self._request('POST', _FINISH_ROUTE, json=body).json()['uri']
+        return uri.rstrip('/').rsplit('/', 1)[-1]
+
+
+class ChunkedUpload():
+    """
+    Write-only binary file object returned by :meth:`FileUploader.open_upload`.
+
+    Written bytes are buffered until a chunk is full; full chunks are sent in
+    the background and :meth:`write` blocks while ``max_workers`` chunks are
+    in flight. The last chunk is sent, and the file created, by :meth:`close`.
+    """
+    def __init__(self, uploader, name, properties=None):
+        self._uploader = uploader
+        self._name = name
+        self._properties = properties
+        self._buffer = bytearray()
+        self._position = 0
+        self._chunk_count = 0
+        self._in_flight = threading.BoundedSemaphore(uploader.max_workers)
+        self._futures = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=uploader.max_workers, thread_name_prefix='ChunkedUpload')
+        self._session_id = uploader._start_session()  # pylint: disable=protected-access
+        self.closed = False
+        self.file_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self):  # pylint: disable=no-self-use
+        """
+        Return ``True``; the upload can be written to.
+        """
+        return True
+
+    def seekable(self):  # pylint: disable=no-self-use
+        """
+        Return ``False``; the upload is written sequentially.
+        """
+        return False
+
+    def tell(self):
+        """
+        Return the number of bytes written.
+
+        :rtype: int
+        """
+        return self._position
+
+    def flush(self):
+        """
+        Do nothing; chunks are sent as soon as they are full.
+        """
+
+    def write(self, data):
+        """
+        Append bytes to the upload.
+
+        :param data: The bytes to append.
+        :type data: bytes or bytearray or memoryview
+        :return: The number of bytes written.
+        :rtype: int
+        """
+        if self.closed:
+            raise ValueError('write to a closed upload')
+        self._raise_failed_chunk()
+        self._buffer += data
+        self._position += len(data)
+        chunk_size = self._uploader.chunk_size
+        # A full chunk is only sent once more data follows it, so that the
+        # last chunk is always sent by close()
+        while len(self._buffer) > chunk_size:
+            self._submit(bytes(self._buffer[:chunk_size]))
+            del self._buffer[:chunk_size]
+        return len(data)
+
+    def close(self):
+        """
+        Send the last chunk, wait for all the chunks and create the file.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            for future in concurrent.futures.as_completed(self._futures):
+                future.result()
+            # pylint: disable=protected-access
+            self._uploader._send_chunk(self._session_id, self._chunk_count,
+                                       bytes(self._buffer), True)
+            self.file_id = self._uploader._finish_session(
+                self._session_id, self._name, self._properties)
+            # pylint: enable=protected-access
+        finally:
+            self._buffer = bytearray()
+            self._executor.shutdown(wait=True)
+        LOGGER.debug('Uploaded %s (%d bytes in %d chunks) as %s', self._name, self._position,
+                     self._chunk_count + 1, self.file_id)
+
+    def abort(self):
+        """
+        Stop the upload without creating the file, and cancel its session.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._buffer = bytearray()
+        try:
+            self._uploader._cancel_session(self._session_id)  # pylint: disable=protected-access
+        except Exception as exc:  # pylint: disable=broad-except
+            # The server expires the session; the error that aborted the upload matters more
+            LOGGER.warning('Failed to cancel the upload session of %s: %s', self._name, exc)
+
+    def _submit(self, data):
+        self._in_flight.acquire()
+        index = self._chunk_count
+        self._chunk_count += 1
+        try:
+            future = self._executor.submit(
+                self._uploader._send_chunk,  # pylint: disable=protected-access
+                self._session_id, index, data, False)
+        except Exception:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(future)
+
+    def _raise_failed_chunk(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._futures = [future for future in self._futures if not future.done()]
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Station helper daemon that keeps warm, connected SystemLink clients for one-shot scripts.
+
+Start the daemon once per station::
+
+    python station.py serve
+
+Scripts then hand their calls to it instead of importing and connecting the
+clients themselves::
+
+    from station import StationClient
+    with StationClient() as station:
+        minion_id = station.minion_id()
+        station.call('testmon', 'create_results', results)
+        station.call('tag', 'update_tag', minion_id + '.foo', 'DOUBLE', 3.14, wait=False)
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import argparse
+import concurrent.futures
+import functools
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MINION_ID_PATH = 'C:/ProgramData/National Instruments/salt/conf/minion_id'
+DEFAULT_ADDRESS = ('localhost', 47474)
+DEFAULT_AUTHKEY_PATH = os.path.join(os.path.expanduser('~'), '.systemlink', 'station.key')
+
+
+@functools.lru_cache(maxsize=None)
+def minion_id(path=DEFAULT_MINION_ID_PATH):
+    """
+    Return the minion id of this system, read once per process.
+
+    The cache only lasts as long as the process. Scripts that hand their calls
+    to the daemon get the minion id the daemon read with
+    :meth:`StationClient.minion_id` instead.
+
+    :param path: The file the minion id is stored in.
+    :type path: str
+    :rtype: str
+    """
+    with open(path) as minion_id_file:
+        return minion_id_file.read().strip()
+
+
+def authkey(path=DEFAULT_AUTHKEY_PATH):
+    """
+    Return the key the daemon and its clients authenticate with, creating it if needed.
+
+    The key is stored in a file that only the current user can read.
+
+    :param path: The file the key is stored in.
+    :type path: str
+    :rtype: bytes
+    """
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, 'w') as key_file:
+            key_file.write(secrets.token_hex(32))
+    with open(path) as key_file:
+        return key_file.read().strip().encode('ascii')
+
+
+def default_client_factories():
+    """
+    Return the factories of the clients served by default.
+
+    Each client is created on its first call and then kept connected.
+
+    :rtype: dict(str, callable)
+    """
+    def testmon():
+        # pylint: disable=import-error,import-outside-toplevel
+        from systemlink.testmonclient import TestMonitorClient
+        return TestMonitorClient(service_name='StationTestMonitorClient')
+
+    def tag():
+        # pylint: disable=import-error,import-outside-toplevel
+        from systemlink.tagclient import TagClient
+        return TagClient(service_name='StationTagClient')
+
+    def fileingestion():
+        # pylint: disable=import-error,import-outside-toplevel
+        from systemlink.fileingestionclient import FileIngestionClient
+        return FileIngestionClient(service_name='StationFileIngestionClient')
+
+    return {'testmon': testmon, 'tag': tag, 'fileingestion': fileingestion,
+            'station': StationInfo}
+
+
+class StationInfo():
+    """
+    Facts about the station that the daemon reads once and serves to every script.
+    """
+    def minion_id(self):  # pylint: disable=no-self-use
+        """
+        Return the minion id of this system.
+
+        :rtype: str
+        """
+        return minion_id()
+
+
+class StationDaemon():
+    """
+    Serve calls to SystemLink clients over an authenticated local connection.
+
+    The clients are created on their first call and stay connected for the
+    life of the daemon, so a script that hands its calls to the daemon does
+    not pay for importing the client stacks and connecting to the broker.
+    Calls made with ``wait=False`` are acknowledged immediately and run in
+    the background.
+
+    The clients are not documented as safe to use from several threads, so
+    the calls to one client are made one at a time, whichever script or
+    background worker makes them. Calls to different clients run at the
+    same time.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, key=None, client_factories=None, max_workers=4):
+        """
+        :param address: The address to listen on.
+        :type address: tuple(str, int) or str
+        :param key: The authentication key, or ``None`` for :func:`authkey`.
+        :type key: bytes or None
+        :param client_factories: Callables that create each client, by client
+            name, or ``None`` for :func:`default_client_factories`.
+        :type client_factories: dict(str, callable) or None
+        :param max_workers: Maximum number of ``wait=False`` calls made at the same time.
+        :type max_workers: int
+        """
+        self._listener = Listener(address, authkey=key if key is not None else authkey())
+        self._factories = (client_factories if client_factories is not None
+                           else default_client_factories())
+        # Client and the lock its calls are made under, by client name
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='StationDaemon')
+        self._closing = False
+
+    @property
+    def address(self):
+        """
+        The address the daemon listens on.
+        """
+        return self._listener.address
+
+    def serve_forever(self):
+        """
+        Accept connections until :meth:`close` is called.
+        """
+        LOGGER.info('Station daemon listening on %s', self.address)
+        while not self._closing:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                if self._closing:
+                    break
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.warning('Rejected station connection: %s', exc)
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def close(self):
+        """
+        Stop accepting connections, finish the background calls and close the clients.
+        """
+        if self._closing:
+            return
+        self._closing = True
+        self._listener.close()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for client, client_lock in self._clients.values():
+                # Waits for the call the client is making, if any
+                with client_lock:
+                    if hasattr(client, 'close'):
+                        client.close()
+            self._clients.clear()
+
+    def _client(self, name):
+        """
+        Return a client, created on first use, and the lock to make its calls under.
+
+        :rtype: tuple(object, threading.Lock)
+        """
+        with self._lock:
+            entry = self._clients.get(name)
+            if entry is None:
+                factory = self._factories.get(name)
+                if factory is None:
+                    raise ValueError('Unknown client {!r}'.format(name))
+                entry = self._clients[name] = (factory(), threading.Lock())
+            return entry
+
+    def _call(self, client_name, method_name, args, kwargs):
+        if method_name.startswith('_'):
+            raise ValueError('{!r} is not a public method'.format(method_name))
+        client, client_lock = self._client(client_name)
+        with client_lock:
+            return _plain(getattr(client, method_name)(*args, **kwargs))
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    client_name, method_name, args, kwargs, wait = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if not wait:
+                    self._executor.submit(self._call_logged, client_name, method_name,
+                                          args, kwargs)
+                    connection.send(('queued', None))
+                    continue
+                try:
+                    connection.send(('ok', self._call(client_name, method_name, args, kwargs)))
+                except Exception as exc:  # pylint: disable=broad-except
+                    connection.send(('error', '{}: {}'.format(type(exc).__name__, exc)))
+
+    def _call_logged(self, client_name, method_name, args, kwargs):
+        try:
+            self._call(client_name, method_name, args, kwargs)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.warning('Background %s.%s failed: %s', client_name, method_name, exc)
+
+
+class StationClient():
+    """
+    Connection from a one-shot script to the :class:`StationDaemon`.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, key=None):
+        """
+        :param address: The address of the daemon.
+        :type address: tuple(str, int) or str
+        :param key: The authentication key, or ``None`` for :func:`authkey`.
+        :type key: bytes or None
+        """
+        self._connection = Client(address, authkey=key if key is not None else authkey())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection. Calls made with ``wait=False`` still complete.
+        """
+        self._connection.close()
+
+    def minion_id(self):
+        """
+        Return the minion id of this system, as read once by the daemon.
+
+        :rtype: str
+        """
+        return self.call('station', 'minion_id')
+
+    def call(self, client_name, method_name, *args, **kwargs):
+        """
+        Call a method of one of the daemon's clients
+
+        :param client_name: The name of the client, such as ``'testmon'`` or ``'tag'``.
+        :type client_name: str
+        :param method_name: The name of the method, such as ``'create_results'``.
+        :type method_name: str
+        :param args: The positional arguments of the method.
+        :param kwargs: The keyword arguments of the method, and ``wait``: whether
+            to wait for the result (the default) or only for the daemon to
+            accept the call.
+        :return: The result of the method, with messages converted to dicts,
+            or ``None`` if ``wait`` is ``False``.
+        """
+        wait = kwargs.pop('wait', True)
+        self._connection.send((client_name, method_name, args, kwargs, wait))
+        status, value = self._connection.recv()
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+
+
+def _plain(value):
+    """
+    Convert a client result to built-in types that can be sent to the script.
+    """
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_plain(item) for item in value)
+    return value
+
+
+def main(argv=None):
+    """
+    Run the daemon, or make one call through it.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    commands.add_parser('serve', help='Run the daemon')
+    call_parser = commands.add_parser('call', help='Call a client method through the daemon')
+    call_parser.add_argument('client')
+    call_parser.add_argument('method')
+    call_parser.add_argument('arguments', nargs='*', help='JSON-encoded positional arguments')
+    call_parser.add_argument('--no-wait', action='store_true')
+    args = parser.parse_args(argv)
+    address = (DEFAULT_ADDRESS[0], args.port)
+
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        daemon = StationDaemon(address)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.close()
+        return
+    with StationClient(address) as station:
+        result = station.call(args.client, args.method,
+                              *[json.loads(argument) for argument in args.arguments],
+                              wait=not args.no_wait)
+    json.dump(result, sys.stdout, default=str)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
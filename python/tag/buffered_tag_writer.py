@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing tag writer that publishes high-rate tag values in timed batches.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import logging
+import threading
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# How the values written to one path between two flushes are reduced to the published value.
+LAST = 'last'
+MEAN = 'mean'
+MIN = 'min'
+MAX = 'max'
+
+NUMERIC_TAG_TYPES = frozenset(['DOUBLE', 'INT', 'U_INT64'])
+
+# Indices in a buffer entry
+_TYPE, _VALUE, _COUNT, _SUM, _MIN, _MAX, _ATTEMPTS = range(7)
+
+
+class BufferedTagWriter():
+    """
+    Buffer tag values and publish them with one ``update_tags`` call per flush.
+
+    Only one value per tag path is kept between two flushes: the last value
+    written or, for numeric tags, the mean, minimum or maximum of the values
+    written. A background thread flushes every ``flush_interval`` seconds or
+    as soon as ``max_paths`` distinct paths are buffered.
+
+    When ``update_tags`` fails, the values of the flush are merged back into
+    the buffer, behind the values written meanwhile, and sent again with the
+    next flush. Values are only dropped once they failed ``max_attempts``
+    flushes, or when the writer is closed.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 tag_client,
+                 flush_interval=1.0,
+                 max_paths=1000,
+                 reduce=LAST,
+                 max_attempts=3):
+        """
+        :param tag_client: The client used to publish the tag values.
+        :type tag_client: systemlink.tagclient.TagClient
+        :param flush_interval: Time, in seconds, between two flushes.
+        :type flush_interval: float or int
+        :param max_paths: Number of buffered paths that triggers a flush.
+        :type max_paths: int
+        :param reduce: One of :data:`LAST`, :data:`MEAN`, :data:`MIN` or :data:`MAX`.
+        :type reduce: str
+        :param max_attempts: Number of flushes that may fail to publish a value
+            before it is dropped.
+        :type max_attempts: int
+        """
+        if reduce not in (LAST, MEAN, MIN, MAX):
+            raise ValueError('reduce must be one of {}'.format((LAST, MEAN, MIN, MAX)))
+        self._tag_client = tag_client
+        self._flush_interval = flush_interval
+        self._max_paths = max_paths
+        self._reduce = reduce
+        self._max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = False
+        self._buffer = {}
+        self._written_count = 0
+        self._coalesced_count = 0
+        self._published_count = 0
+        self._dropped_count = 0
+        self._flush_count = 0
+
+        self._thread = threading.Thread(target=self._run, name='BufferedTagWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def statistics(self):
+        """
+        Return the counters of this writer.
+
+        :return: ``written`` values received, ``coalesced`` values merged into
+            a buffered value, ``published`` values sent, ``dropped`` values
+            lost because ``update_tags`` failed ``max_attempts`` times or
+            still failed on close, and the number of ``flushes``.
+        :rtype: dict(str, int)
+        """
+        with self._lock:
+            return {
+                'written': self._written_count,
+                'coalesced': self._coalesced_count,
+                'published': self._published_count,
+                'dropped': self._dropped_count,
+                'flushes': self._flush_count,
+            }
+
+    def close(self):
+        """
+        Publish the buffered values and stop the background thread.
+
+        Values that cannot be published are dropped.
+        """
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            buffer = self._buffer
+            self._buffer = {}
+        if buffer:
+            self._drop(buffer)
+
+    def update_tag(self, path, tag_type, value):
+        """
+        Buffer one tag value
+
+        :param path: The tag path.
+        :type path: str
+        :param tag_type: The tag type, such as ``'DOUBLE'`` or ``'STRING'``.
+        :type tag_type: str
+        :param value: The tag value.
+        """
+        with self._lock:
+            if self._closing:
+                raise RuntimeError('BufferedTagWriter is closed')
+            self._add(path, tag_type, value)
+            full = len(self._buffer) >= self._max_paths
+        if full:
+            self._wake.set()
+
+    def update_tags(self, tags):
+        """
+        Buffer several tag values
+
+        :param tags: A list of dicts with the ``path``, ``type`` and ``value`` keys,
+            as accepted by ``TagClient.update_tags``.
+        :type tags: list(dict)
+        """
+        with self._lock:
+            if self._closing:
+                raise RuntimeError('BufferedTagWriter is closed')
+            for tag in tags:
+                self._add(tag['path'], tag['type'], tag['value'])
+            full = len(self._buffer) >= self._max_paths
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Publish the buffered values now.
+
+        If publishing fails, the values are kept for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                buffer = self._buffer
+                self._buffer = {}
+            if not buffer:
+                return
+            tags = [{'path': path, 'type': entry[_TYPE], 'value': self._reduced_value(entry)}
+                    for path, entry in buffer.items()]
+            try:
+                self._tag_client.update_tags(tags)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.warning('BufferedTagWriter failed to publish %d tag values: %s',
+                               len(tags), exc)
+                self._requeue(buffer)
+                return
+            with self._lock:
+                self._published_count += len(tags)
+                self._flush_count += 1
+
+    def _requeue(self, buffer):
+        """
+        Merge the entries of a failed flush back into the buffer.
+
+        Values written since the flush are newer, so they win for :data:`LAST`
+        and are aggregated with the failed values otherwise.
+        """
+        dropped = {}
+        with self._lock:
+            for path, entry in buffer.items():
+                entry[_ATTEMPTS] += 1
+                if entry[_ATTEMPTS] >= self._max_attempts:
+                    dropped[path] = entry
+                    continue
+                newer = self._buffer.get(path)
+                if newer is not None:
+                    entry[_TYPE] = newer[_TYPE]
+                    entry[_VALUE] = newer[_VALUE]
+                    entry[_COUNT] += newer[_COUNT]
+                    if entry[_SUM] is not None and newer[_SUM] is not None:
+                        entry[_SUM] += newer[_SUM]
+                        entry[_MIN] = min(entry[_MIN], newer[_MIN])
+                        entry[_MAX] = max(entry[_MAX], newer[_MAX])
+                    else:
+                        # As in _add, a path whose values cannot all be aggregated keeps the last
+                        entry[_SUM] = entry[_MIN] = entry[_MAX] = None
+                self._buffer[path] = entry
+        if dropped:
+            self._drop(dropped)
+
+    def _drop(self, buffer):
+        count = sum(entry[_COUNT] for entry in buffer.values())
+        LOGGER.warning('BufferedTagWriter dropped %d tag values of %d paths',
+                       count, len(buffer))
+        with self._lock:
+            self._dropped_count += count
+
+    def _add(self, path, tag_type, value):
+        self._written_count += 1
+        entry = self._buffer.get(path)
+        aggregate = self._reduce != LAST and tag_type in NUMERIC_TAG_TYPES
+        if entry is None:
+            number = float(value) if aggregate else None
+            self._buffer[path] = [tag_type, value, 1, number, number, number, 0]
+            return
+        self._coalesced_count += 1
+        entry[_TYPE] = tag_type
+        entry[_VALUE] = value
+        entry[_COUNT] += 1
+        if aggregate and entry[_SUM] is not None:
+            number = float(value)
+            entry[_SUM] += number
+            entry[_MIN] = min(entry[_MIN], number)
+            entry[_MAX] = max(entry[_MAX], number)
+
+    def _reduced_value(self, entry):
+        if self._reduce == LAST or entry[_SUM] is None:
+            return entry[_VALUE]
+        if self._reduce == MEAN:
+            value = entry[_SUM] / entry[_COUNT]
+        elif self._reduce == MIN:
+            value = entry[_MIN]
+        else:
+            value = entry[_MAX]
+        if entry[_TYPE] != 'DOUBLE':
+            value = int(round(value))
+        return value
+
+    def _run(self):
+        while not self._closing:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            if self._closing:
+                return
+            self.flush()
@@ -1,9 +1,16 @@
+import os
+import sys
+
 from systemlink.tagclient import TagClient
-from systemlink.tagclient import messages
+
+from tag_registry import create_tags
+
+# The station helpers are in the station directory next to this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'station'))
+import station
 
 # minion_id is a unique identifier for every system that should be prepended to any tag path to avoid collisions
-file = open("C:\\ProgramData\\National Instruments\\salt\\conf\\minion_id","r")
-minion_id = file.read()
+minion_id = station.minion_id()
 
 with TagClient(service_name='TagGenerator') as tag_client:
     tags = [{
@@ -24,8 +31,8 @@ with TagClient(service_name='TagGenerator') as tag_client:
     tag_keywords = ""
     tag_collect_aggregates = True
 
-    for tag in tags:
-        print (tag)
-        tag_client.create_tag(tag['path'], tag['type'], tag_properties, tag_keywords, tag_collect_aggregates)
+    # Only tags that were not created before with the same definition are sent to the Tag service
+    created = create_tags(tag_client, tags, tag_properties, tag_keywords, tag_collect_aggregates)
+    print (created)
 
     tag_client.update_tags(tags)
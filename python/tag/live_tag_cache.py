@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory cache of current tag values with NumPy snapshots.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import fnmatch
+import logging
+import threading
+
+# Import third party libs
+import numpy as np
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Characters of fnmatch patterns
+GLOB_CHARACTERS = '*?['
+
+
+class LiveTagCache():
+    """
+    Keep the current value and min/max/mean aggregates of many numeric tags.
+
+    Values are stored in NumPy arrays indexed by tag path, so reads are
+    served from memory without a Tag service round trip. The cache is fed
+    incrementally: pass :meth:`apply_update` as the callback of a tag
+    subscription, or let the cache refresh every tracked path with a single
+    ``query_current_values`` call every ``refresh_interval`` seconds.
+    """
+    def __init__(self, tag_client=None, paths=None, refresh_interval=None, capacity=64):
+        """
+        :param tag_client: The client used by :meth:`refresh` or ``None`` if the
+            cache is only fed through :meth:`apply_update`.
+        :type tag_client: systemlink.tagclient.TagClient or None
+        :param paths: The tag paths to track.
+        :type paths: list(str) or None
+        :param refresh_interval: Time, in seconds, between two background
+            refreshes or ``None`` to not refresh in the background.
+        :type refresh_interval: float or int or None
+        :param capacity: Initial number of paths the arrays can hold. The arrays
+            grow as needed.
+        :type capacity: int
+        """
+        self._tag_client = tag_client
+        self._lock = threading.Lock()
+        self._index = {}
+        self._paths = []
+        capacity = max(capacity, 1)
+        self._values = np.full(capacity, np.nan)
+        self._minimum = np.full(capacity, np.nan)
+        self._maximum = np.full(capacity, np.nan)
+        self._total = np.zeros(capacity)
+        self._count = np.zeros(capacity, dtype=np.int64)
+        self._server_mean = np.full(capacity, np.nan)
+        self.add_paths(paths or [])
+
+        self._stop = threading.Event()
+        self._thread = None
+        if refresh_interval is not None:
+            self._thread = threading.Thread(
+                target=self._run, args=(refresh_interval,), name='LiveTagCache', daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def paths(self):
+        """
+        The tracked tag paths, in slot order.
+
+        :rtype: list(str)
+        """
+        with self._lock:
+            return list(self._paths)
+
+    def close(self):
+        """
+        Stop the background refresh.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def add_paths(self, paths):
+        """
+        Start tracking more tag paths.
+
+        :param paths: The tag paths to track. ``query_current_values`` only
+            accepts exact paths, so glob patterns raise :class:`ValueError`.
+        :type paths: list(str)
+        """
+        patterns = [path for path in paths if _is_pattern(path)]
+        if patterns:
+            raise ValueError('Glob patterns cannot be tracked, add the paths they match '
+                             'instead: {}'.format(', '.join(patterns)))
+        with self._lock:
+            for path in paths:
+                self._slot(path)
+
+    def apply_update(self, path, value):
+        """
+        Record a new value for one tag, for example from a subscription callback.
+
+        :param path: The tag path.
+        :type path: str
+        :param value: The new value, as a number or as the string sent by the Tag service.
+        """
+        number = _to_float(value)
+        with self._lock:
+            slot = self._slot(path)
+            self._values[slot] = number
+            if number == number:  # pylint: disable=comparison-with-itself
+                self._total[slot] += number
+                self._count[slot] += 1
+                self._minimum[slot] = np.fmin(self._minimum[slot], number)
+                self._maximum[slot] = np.fmax(self._maximum[slot], number)
+
+    def refresh(self):
+        """
+        Update every tracked path with one ``query_current_values`` call.
+
+        Aggregates collected by the Tag service replace the aggregates
+        computed from the updates received so far. Tags are matched by the
+        path they are returned with, since the Tag service leaves out the
+        tags that do not exist.
+        """
+        paths = self.paths
+        if not paths:
+            return
+        tags = self._tag_client.query_current_values(paths)
+        with self._lock:
+            for tag in tags:
+                slot = self._index.get(_tag_path(tag))
+                if slot is None:
+                    LOGGER.debug('Ignoring untracked tag %s', _tag_path(tag))
+                    continue
+                current = getattr(tag, 'current', None)
+                if current is not None and current.value is not None:
+                    self._values[slot] = _to_float(current.value.value)
+                aggregates = getattr(tag, 'aggregates', None)
+                if aggregates is not None:
+                    self._minimum[slot] = _to_float(aggregates.min)
+                    self._maximum[slot] = _to_float(aggregates.max)
+                    self._server_mean[slot] = _to_float(aggregates.avg)
+
+    def snapshot(self, paths=None):
+        """
+        Return the current values of tags.
+
+        :param paths: Tag paths or glob patterns, such as
+            ``'localhost.Health.CPU.*.UsePercentage'``, or ``None`` for all
+            tracked paths.
+        :type paths: list(str) or str or None
+        :return: The current values, ``nan`` for tags without a numeric value.
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            slots = self._slots(paths)
+            return self._values[slots]
+
+    def aggregates(self, paths=None):
+        """
+        Return the min, max and mean values of tags.
+
+        :param paths: Tag paths or glob patterns, or ``None`` for all tracked paths.
+        :type paths: list(str) or str or None
+        :return: A ``(3, n)`` array with the min, max and mean rows.
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            slots = self._slots(paths)
+            count = self._count[slots]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(count > 0, self._total[slots] / count, np.nan)
+            server_mean = self._server_mean[slots]
+            mean = np.where(np.isnan(server_mean), mean, server_mean)
+            return np.vstack((self._minimum[slots], self._maximum[slots], mean))
+
+    def _slot(self, path):
+        slot = self._index.get(path)
+        if slot is not None:
+            return slot
+        slot = len(self._paths)
+        if slot == len(self._values):
+            self._grow()
+        self._index[path] = slot
+        self._paths.append(path)
+        return slot
+
+    def _grow(self):
+        size = len(self._values)
+        self._values = np.concatenate((self._values, np.full(size, np.nan)))
+        self._minimum = np.concatenate((self._minimum, np.full(size, np.nan)))
+        self._maximum = np.concatenate((self._maximum, np.full(size, np.nan)))
+        self._total = np.concatenate((self._total, np.zeros(size)))
+        self._count = np.concatenate((self._count, np.zeros(size, dtype=np.int64)))
+        self._server_mean = np.concatenate((self._server_mean, np.full(size, np.nan)))
+
+    def _slots(self, paths):
+        if paths is None:
+            return np.arange(len(self._paths))
+        if isinstance(paths, str):
+            paths = [paths]
+        slots = []
+        for path in paths:
+            if path in self._index:
+                slots.append(self._index[path])
+            elif _is_pattern(path):
+                slots.extend(self._index[match]
+                             for match in fnmatch.filter(self._paths, path))
+            else:
+                raise KeyError('Tag {} is not tracked by the cache'.format(path))
+        return np.array(slots, dtype=np.intp)
+
+    def _run(self, refresh_interval):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.warning('LiveTagCache refresh failed: %s', exc)
+            self._stop.wait(refresh_interval)
+
+
+def _is_pattern(path):
+    """
+    Return whether a tag path is a glob pattern.
+
+    :param path: The tag path.
+    :type path: str
+    :rtype: bool
+    """
+    return any(char in path for char in GLOB_CHARACTERS)
+
+
+def _tag_path(tag):
+    """
+    Return the path of a tag returned by ``query_current_values``.
+
+    :param tag: The tag, with its path either on its ``tag`` attribute or on itself.
+    :rtype: str or None
+    """
+    return getattr(getattr(tag, 'tag', None), 'path', None) or getattr(tag, 'path', None)
+
+
+def _to_float(value):
+    """
+    Convert a tag value to a float, ``nan`` if the value is not numeric.
+
+    :param value: A number or the string representation of a tag value.
+    :rtype: float
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered == 'true':
+            return 1.0
+        if lowered == 'false':
+            return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
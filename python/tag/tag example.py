@@ -1,11 +1,17 @@
-import time
+import os
+import sys
+
 from systemlink.tagclient import TagClient
-from systemlink.tagclient import messages
+
+from tag_registry import create_tags
+
+# The station helpers are in the station directory next to this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'station'))
+import station
 
 
 # minion_id is a unique identifier for every system that should be prepended to any tag path to avoid collisions
-file = open("C:\\ProgramData\\National Instruments\\salt\\conf\\minion_id","r")
-minion_id = file.read()
+minion_id = station.minion_id()
 
 update = 3.14
 
@@ -13,5 +19,5 @@ with TagClient(service_name='TagGenerator') as tag_client:
     tag_path = minion_id + ".foo" 
     tag_type = "DOUBLE" 
     tag_properties = {"nitagRetention":"COUNT"}
-    tag_client.create_tag(tag_path, tag_type,tag_properties)
+    create_tags(tag_client, [{'path': tag_path, 'type': tag_type}], tag_properties)
     tag_client.update_tag(tag_path, tag_type, update)
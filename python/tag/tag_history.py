@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk reader that decodes retained tag values into NumPy time series.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import datetime
+import logging
+import re
+
+# Import third party libs
+import numpy as np
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# NumPy dtype of the values of each tag type
+TAG_TYPE_DTYPES = {
+    'DOUBLE': np.float64,
+    'INT': np.int32,
+    'U_INT64': np.uint64,
+    'BOOLEAN': np.bool_,
+    'DATE_TIME': 'datetime64[ns]',
+    'STRING': object,
+}
+
+# Time zone designator at the end of an ISO 8601 timestamp
+_TIME_ZONE = re.compile(r'(?:Z|([+-])(\d{2}):?(\d{2}))$')
+
+# Tag history routes of the Tag Historian service HTTP API
+_QUERY_HISTORY_ROUTE = '/nitaghistorian/v2/tags/query-history'
+_QUERY_DECIMATED_HISTORY_ROUTE = '/nitaghistorian/v2/tags/query-decimated-history'
+
+
+class TagHistoryReader():
+    """
+    Read the retained values of many tags over a time range.
+
+    Values are requested page by page through ``fetch_page`` and each page is
+    decoded into typed arrays right away, so only one page of Python objects
+    per tag exists at a time. Up to ``max_workers`` tags are read at the same
+    time. ``fetch_page`` is called as
+    ``fetch_page(path, start, end, continuation, take, **options)``, where
+    ``continuation`` is ``None`` for the first page, and must return the
+    list of ``(timestamp, value)`` pairs of the page, in time order, and the
+    continuation of the next page or ``None`` after the last page.
+    ``timestamp`` is an ISO 8601 string or :class:`datetime.datetime` and
+    ``value`` is the string the Tag service stores.
+    :meth:`TagHistorianSource.fetch_page` reads from the Tag Historian service.
+    """
+    def __init__(self, fetch_page, page_size=10000, max_workers=8):
+        """
+        :param fetch_page: The callable that returns one page of retained values.
+        :type fetch_page: callable
+        :param page_size: Number of values to request per page.
+        :type page_size: int
+        :param max_workers: Maximum number of tags read at the same time.
+        :type max_workers: int
+        """
+        if page_size <= 0:
+            raise ValueError('page_size must be a positive integer')
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._max_workers = max_workers
+
+    def read(self,  # pylint: disable=too-many-arguments
+             paths,
+             start,
+             end,
+             tag_types=None,
+             buckets=None,
+             decimation=None):
+        """
+        Read the retained values of tags
+
+        :param paths: The tag paths.
+        :type paths: list(str)
+        :param start: Start of the time range.
+        :type start: datetime.datetime
+        :param end: End of the time range.
+        :type end: datetime.datetime
+        :param tag_types: Tag type by path, such as ``{'a.b': 'INT'}``. Paths
+            that are not listed are read as ``'DOUBLE'``.
+        :type tag_types: dict(str, str) or None
+        :param buckets: If not ``None``, downsample each numeric series on the
+            client to this many buckets with :func:`downsample`.
+        :type buckets: int or None
+        :param decimation: If not ``None``, passed to ``fetch_page`` as the
+            ``decimation`` option so the server returns fewer values.
+        :type decimation: int or None
+        :return: ``(timestamps, values)`` by path. ``timestamps`` is
+            ``datetime64[ns]`` in UTC and ``values`` has the dtype of the tag
+            type. If ``buckets`` is set, ``values`` is the ``(3, buckets)``
+            array returned by :func:`downsample`.
+        :rtype: dict(str, tuple(numpy.ndarray, numpy.ndarray))
+        """
+        tag_types = tag_types or {}
+        options = {}
+        if decimation is not None:
+            options['decimation'] = decimation
+
+        def read_one(path):
+            timestamps, values = self._read_one(
+                path, start, end, tag_types.get(path, 'DOUBLE'), options)
+            if buckets is not None and values.dtype.kind in 'biuf':
+                timestamps, values = downsample(timestamps, values, buckets)
+            return timestamps, values
+
+        paths = list(paths)
+        if len(paths) <= 1 or self._max_workers <= 1:
+            return dict((path, read_one(path)) for path in paths)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self._max_workers, len(paths))) as executor:
+            return dict(zip(paths, executor.map(read_one, paths)))
+
+    def _read_one(self, path, start, end, tag_type, options):  # pylint: disable=too-many-arguments
+        dtype = TAG_TYPE_DTYPES.get(tag_type, object)
+        timestamp_pages = []
+        value_pages = []
+        count = 0
+        continuation = None
+        while True:
+            page, continuation = self._fetch_page(
+                path, start, end, continuation, self._page_size, **options)
+            if page:
+                timestamps, values = zip(*page)
+                timestamp_pages.append(decode_timestamps(timestamps))
+                value_pages.append(decode_values(values, dtype))
+                count += len(page)
+            if continuation is None:
+                break
+        LOGGER.debug('Read %d values of %s in %d pages', count, path, len(value_pages))
+        if not value_pages:
+            return np.empty(0, dtype='datetime64[ns]'), np.empty(0, dtype=dtype)
+        return np.concatenate(timestamp_pages), np.concatenate(value_pages)
+
+
+class TagHistorianSource():
+    """
+    Page source of :class:`TagHistoryReader` that reads the Tag Historian service.
+
+    Each page is one ``query-history`` request of the Tag Historian HTTP API,
+    and the pages of a tag are chained by the continuation token the service
+    returns. With the ``decimation`` option, the whole decimated series of a
+    tag is returned by one ``query-decimated-history`` request. The HTTP
+    connections are pooled, so the concurrent reads of
+    :class:`TagHistoryReader` each reuse an open connection.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 server_url,
+                 api_key=None,
+                 auth=None,
+                 verify=True,
+                 workspace=None,
+                 max_connections=8):
+        """
+        :param server_url: The URL of the SystemLink server, such as
+            ``https://systemlink.example.com``.
+        :type server_url: str
+        :param api_key: An API key to authenticate with, or ``None``.
+        :type api_key: str or None
+        :param auth: The user name and password to authenticate with, or ``None``.
+        :type auth: tuple(str, str) or None
+        :param verify: Whether to verify the server certificate, or the path of
+            the CA bundle to verify it with.
+        :type verify: bool or str
+        :param workspace: The workspace of the tags, or ``None`` for the default one.
+        :type workspace: str or None
+        :param max_connections: Maximum number of open HTTP connections.
+        :type max_connections: int
+        """
+        # pylint: disable=import-error,import-outside-toplevel
+        import requests
+        import requests.adapters
+        # pylint: enable=import-error,import-outside-toplevel
+
+        self._server_url = server_url.rstrip('/')
+        self._workspace = workspace
+        self._session = requests.Session()
+        self._session.verify = verify
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_connections)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        if api_key is not None:
+            self._session.headers['x-ni-api-key'] = api_key
+        if auth is not None:
+            self._session.auth = auth
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the HTTP connections.
+        """
+        self._session.close()
+
+    def fetch_page(self,  # pylint: disable=too-many-arguments
+                   path,
+                   start,
+                   end,
+                   continuation,
+                   take,
+                   decimation=None):
+        """
+        Return one page of the retained values of a tag
+
+        See :class:`TagHistoryReader` for the parameters and return value.
+
+        :param decimation: If not ``None``, the number of intervals the time
+            range is divided in; the service returns the first, last, minimum
+            and maximum values of each interval, in one page.
+        :type decimation: int or None
+        """
+        body = {'startTime': _iso_timestamp(start), 'endTime': _iso_timestamp(end),
+                'sortOrder': 'ASCENDING'}
+        if self._workspace is not None:
+            body['workspace'] = self._workspace
+        if decimation is not None:
+            body.update({'paths': [path], 'decimation': decimation})
+            response = self._post(_QUERY_DECIMATED_HISTORY_ROUTE, body)
+            values = (response.get('results') or {}).get(path, {}).get('values', [])
+            return [(value['timestamp'], value['value']) for value in values], None
+        body.update({'path': path, 'take': take})
+        if continuation is not None:
+            body['continuationToken'] = continuation
+        response = self._post(_QUERY_HISTORY_ROUTE, body)
+        values = response.get('values', [])
+        return ([(value['timestamp'], value['value']) for value in values],
+                response.get('continuationToken') if values else None)
+
+    def _post(self, route, body):
+        response = self._session.post(self._server_url + route, json=body)
+        response.raise_for_status()
+        return response.json()
+
+
+def decode_timestamps(timestamps):
+    """
+    Decode timestamps into a ``datetime64[ns]`` array in UTC.
+
+    :param timestamps: ISO 8601 strings, with a ``Z`` or ``+hh:mm`` time zone
+        designator or in UTC, or :class:`datetime.datetime` objects, naive in
+        UTC or time zone aware.
+    :type timestamps: sequence
+    :rtype: numpy.ndarray
+    """
+    if not len(timestamps):  # pylint: disable=len-as-condition
+        return np.empty(0, dtype='datetime64[ns]')
+    if not isinstance(timestamps[0], str):
+        return np.array([_utc_naive(timestamp) for timestamp in timestamps],
+                        dtype='datetime64[ns]')
+    # numpy does not parse time zone designators, so they are removed and
+    # applied as an offset
+    offsets = np.zeros(len(timestamps), dtype='timedelta64[m]')
+    local = []
+    for index, timestamp in enumerate(timestamps):
+        match = _TIME_ZONE.search(timestamp, timestamp.find('T') + 1)
+        if match is None:
+            local.append(timestamp)
+            continue
+        local.append(timestamp[:match.start()])
+        if match.group(1):
+            minutes = int(match.group(2)) * 60 + int(match.group(3))
+            offsets[index] = minutes if match.group(1) == '+' else -minutes
+    return np.array(local, dtype='datetime64[ns]') - offsets
+
+
+def decode_values(values, dtype):
+    """
+    Decode tag value strings into an array of the tag's dtype.
+
+    :param values: Values as sent by the Tag service.
+    :type values: sequence(str)
+    :param dtype: The dtype of the result, from :data:`TAG_TYPE_DTYPES`.
+    :rtype: numpy.ndarray
+    """
+    if dtype is object:
+        return np.array(values, dtype=object)
+    if dtype is np.bool_:
+        return np.char.lower(np.array(values, dtype=str)) == 'true'
+    if dtype == 'datetime64[ns]':
+        return decode_timestamps(values)
+    return np.array(values, dtype=str).astype(dtype)
+
+
+def downsample(timestamps, values, buckets):
+    """
+    Reduce a time series to per-bucket min, max and mean values.
+
+    The series is split into ``buckets`` runs of consecutive values of (almost)
+    equal length.
+
+    :param timestamps: The ``datetime64`` timestamps of the series.
+    :type timestamps: numpy.ndarray
+    :param values: The numeric values of the series.
+    :type values: numpy.ndarray
+    :param buckets: Number of buckets. Series shorter than this are not reduced.
+    :type buckets: int
+    :return: The timestamp of the first value in each bucket and a
+        ``(3, buckets)`` array with the min, max and mean rows.
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = len(values)
+    if count == 0:
+        return timestamps, np.empty((3, 0))
+    buckets = min(buckets, count)
+    edges = np.linspace(0, count, buckets + 1).astype(np.intp)
+    starts = edges[:-1]
+    minimum = np.minimum.reduceat(values, starts)
+    maximum = np.maximum.reduceat(values, starts)
+    mean = np.add.reduceat(values, starts) / np.diff(edges)
+    return timestamps[starts], np.vstack((minimum, maximum, mean))
+
+
+def _utc_naive(timestamp):
+    """
+    Return a time zone aware :class:`datetime.datetime` as a naive one in UTC.
+    """
+    if isinstance(timestamp, datetime.datetime) and timestamp.tzinfo is not None:
+        return timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _iso_timestamp(timestamp):
+    """
+    Return a timestamp as the ISO 8601 string in UTC sent to the service.
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return _utc_naive(timestamp).isoformat() + 'Z'
+    return timestamp
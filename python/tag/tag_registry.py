@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Idempotent bulk tag creation backed by a local registry of known tags.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.expanduser('~'), '.systemlink', 'known_tags.json')
+
+# Time, in seconds, after which a known tag is created again
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+# Time, in seconds, after which the lock file of a registry is considered left by a dead process
+STALE_LOCK_AGE = 30
+
+
+class KnownTagRegistry():
+    """
+    Persistent record of the tags this system already created, per server.
+
+    Each entry holds the definition the tag was created with: its type,
+    properties (including retention), keywords and whether aggregates are
+    collected. A tag whose definition is unchanged does not need to be
+    created again. Entries are kept separately for each ``server``, so a
+    registry shared by several servers or brokers does not skip tags that
+    were only created on another one. Entries older than ``max_age`` are no
+    longer trusted, so a tag that was deleted on the server is created
+    again within ``max_age``.
+
+    Several processes may share the registry file. :meth:`save` holds a lock
+    file next to it while it merges the changes of this instance into the
+    file as it is on disk, so the entries saved by other processes are kept.
+    """
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, server=None, max_age=DEFAULT_MAX_AGE):
+        """
+        :param path: The JSON file the registry is loaded from and saved to.
+        :type path: str
+        :param server: Identifies the server the tags are created on, such as
+            the host name of its message broker, or ``None`` for
+            :func:`default_server`.
+        :type server: str or None
+        :param max_age: Time, in seconds, an entry is trusted, or ``None`` to
+            trust entries until they are forgotten.
+        :type max_age: float or int or None
+        """
+        self._path = path
+        self._server = server if server is not None else default_server()
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        # Entries added (path to entry) and forgotten (path to None) since the last save
+        self._changes = {}
+        self._cleared = False
+        self._tags = self._load().get(self._server, {})
+
+    @property
+    def server(self):
+        """
+        The server the entries of this registry were created on.
+
+        :rtype: str
+        """
+        return self._server
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._tags
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tags)
+
+    def is_known(self, definition):
+        """
+        Return whether a tag was created with this definition less than ``max_age`` ago.
+
+        :param definition: The tag definition, as returned by :func:`tag_definition`.
+        :type definition: dict
+        :rtype: bool
+        """
+        with self._lock:
+            entry = self._tags.get(definition['path'])
+        if entry is None or entry.get('definition') != definition:
+            return False
+        return self._max_age is None or time.time() - entry['created'] < self._max_age
+
+    def add(self, definition):
+        """
+        Record that a tag was created with this definition.
+
+        :param definition: The tag definition, as returned by :func:`tag_definition`.
+        :type definition: dict
+        """
+        with self._lock:
+            entry = {'definition': definition, 'created': time.time()}
+            self._tags[definition['path']] = self._changes[definition['path']] = entry
+
+    def forget(self, paths):
+        """
+        Remove tags from the registry, for example after deleting them.
+
+        :param paths: The paths of the tags to remove.
+        :type paths: list(str)
+        """
+        with self._lock:
+            for path in paths:
+                self._tags.pop(path, None)
+                self._changes[path] = None
+
+    def clear(self):
+        """
+        Remove all tags of the server from the registry.
+        """
+        with self._lock:
+            self._tags.clear()
+            self._changes.clear()
+            self._cleared = True
+
+    def save(self):
+        """
+        Merge the changes since the registry was loaded or saved into its file.
+
+        The entries of the file are reloaded, so the entries saved meanwhile
+        by other processes are kept and visible to this instance afterwards.
+        """
+        with self._lock:
+            if not self._changes and not self._cleared:
+                return
+            directory = os.path.dirname(self._path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with _file_lock(self._path + '.lock'):
+                servers = self._load()
+                tags = {} if self._cleared else servers.get(self._server, {})
+                for path, entry in self._changes.items():
+                    if entry is None:
+                        tags.pop(path, None)
+                    elif entry['created'] >= tags.get(path, {}).get('created', 0):
+                        tags[path] = entry
+                servers[self._server] = tags
+                temp_path = '{}.{}.tmp'.format(self._path, os.getpid())
+                with open(temp_path, 'w') as registry_file:
+                    json.dump(servers, registry_file, sort_keys=True)
+                os.replace(temp_path, self._path)
+            self._tags = tags
+            self._changes = {}
+            self._cleared = False
+
+    def _load(self):
+        """
+        Return the entries of every server in the registry file.
+
+        :rtype: dict(str, dict)
+        """
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path) as registry_file:
+                return json.load(registry_file)
+        except (OSError, ValueError) as exc:
+            LOGGER.warning('Ignoring unreadable tag registry %s: %s', self._path, exc)
+            return {}
+
+
+@contextlib.contextmanager
+def _file_lock(path, poll_interval=0.05):
+    """
+    Hold a lock shared with other processes by creating a file.
+
+    A lock file older than :data:`STALE_LOCK_AGE` was left by a process that
+    died while holding it, and is removed.
+
+    :param path: The lock file.
+    :type path: str
+    :param poll_interval: Time, in seconds, between attempts to take the lock.
+    :type poll_interval: float
+    """
+    while True:
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > STALE_LOCK_AGE:
+                    LOGGER.warning('Removing stale tag registry lock %s', path)
+                    os.remove(path)
+                    continue
+            except OSError:
+                # The lock was released meanwhile
+                continue
+            time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+
+def default_server():
+    """
+    Return the host and port of the message broker of the default configuration.
+
+    :return: ``host:port``, or ``'default'`` if the configuration cannot be read.
+    :rtype: str
+    """
+    try:
+        # pylint: disable=import-error,import-outside-toplevel
+        from systemlink.messagebus.amqp_configuration_manager import AmqpConfigurationManager
+        configuration = AmqpConfigurationManager.get_configuration()
+        return '{}:{}'.format(configuration.host, configuration.port)
+    except Exception as exc:  # pylint: disable=broad-except
+        LOGGER.warning('Cannot identify the message broker, the tag registry is not '
+                       'kept per server: %s', exc)
+        return 'default'
+
+
+def tag_definition(tag, properties=None, keywords=None, collect_aggregates=False):
+    """
+    Return the definition a tag is created with.
+
+    :param tag: A dict with at least the ``path`` and ``type`` keys. The
+        ``properties``, ``keywords`` and ``collectAggregates`` keys, if
+        present, override the defaults.
+    :type tag: dict
+    :param properties: Default tag properties, such as ``{'nitagRetention': 'COUNT'}``.
+    :type properties: dict or None
+    :param keywords: Default tag keywords.
+    :type keywords: list(str) or str or None
+    :param collect_aggregates: Default for whether the Tag service collects aggregates.
+    :type collect_aggregates: bool
+    :rtype: dict
+    """
+    return {
+        'path': tag['path'],
+        'type': tag['type'],
+        'properties': tag.get('properties', properties) or {},
+        'keywords': tag.get('keywords', keywords) or [],
+        'collectAggregates': bool(tag.get('collectAggregates', collect_aggregates)),
+    }
+
+
+def create_tags(tag_client,  # pylint: disable=too-many-arguments
+                tags,
+                properties=None,
+                keywords=None,
+                collect_aggregates=False,
+                registry=None):
+    """
+    Create the tags that do not exist yet with the same definition
+
+    Tags recorded in ``registry`` with an identical definition are skipped
+    without contacting the Tag service. The others are created concurrently,
+    one request in flight per client of ``tag_client``: the message service
+    of a client is not documented as safe for concurrent publishes, so each
+    client creates one tag at a time. The registry is saved once, after all
+    tags have been processed, including when a creation fails.
+
+    :param tag_client: The client used to create the tags, or several clients
+        to create as many tags at the same time.
+    :type tag_client: systemlink.tagclient.TagClient or list(systemlink.tagclient.TagClient)
+    :param tags: A list of dicts with at least the ``path`` and ``type`` keys.
+        Other keys, such as ``value``, are ignored.
+    :type tags: list(dict)
+    :param properties: Default tag properties, such as ``{'nitagRetention': 'COUNT'}``.
+    :type properties: dict or None
+    :param keywords: Default tag keywords.
+    :type keywords: list(str) or str or None
+    :param collect_aggregates: Default for whether the Tag service collects aggregates.
+    :type collect_aggregates: bool
+    :param registry: The registry of known tags or ``None`` to use the registry
+        at :data:`DEFAULT_REGISTRY_PATH` for :func:`default_server`.
+    :type registry: KnownTagRegistry or None
+    :return: The paths of the tags that were created.
+    :rtype: list(str)
+    """
+    if registry is None:
+        registry = KnownTagRegistry()
+    clients = list(tag_client) if isinstance(tag_client, (list, tuple)) else [tag_client]
+    definitions = [tag_definition(tag, properties, keywords, collect_aggregates) for tag in tags]
+    definitions = [definition for definition in definitions if not registry.is_known(definition)]
+    idle_clients = queue.Queue()
+    for client in clients:
+        idle_clients.put(client)
+
+    def create(definition):
+        client = idle_clients.get()
+        try:
+            client.create_tag(definition['path'],
+                              definition['type'],
+                              definition['properties'],
+                              definition['keywords'],
+                              definition['collectAggregates'])
+        finally:
+            idle_clients.put(client)
+        registry.add(definition)
+        return definition['path']
+
+    created = []
+    try:
+        if len(clients) == 1:
+            for definition in definitions:
+                created.append(create(definition))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                futures = [executor.submit(create, definition) for definition in definitions]
+                errors = []
+                for future in futures:
+                    try:
+                        created.append(future.result())
+                    except Exception as exc:  # pylint: disable=broad-except
+                        errors.append(exc)
+                if errors:
+                    LOGGER.warning('Failed to create %d of %d tags', len(errors), len(futures))
+                    raise errors[0]
+    finally:
+        registry.save()
+    LOGGER.debug('Created %d of %d tags', len(created), len(tags))
+    return created
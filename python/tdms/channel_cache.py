@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache of TDMS channel data, memory-mapped on read.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# Import third party libs
+import numpy as np
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.fileingestionclient import messages as fileingestion_messages
+# pylint: enable=import-error
+from tdms_channels import read_channel_arrays
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+_INDEX_FILE_NAME = 'index.json'
+
+
+class ChannelCache():
+    """
+    Cache channel data read through the TDMReader service on the local disk.
+
+    Entries are keyed by file id, group, channel and data window and stored
+    as raw ``.npy`` arrays that are memory-mapped when read, so a cache hit
+    costs no network transfer and no copy. Each entry records the version of
+    the file it was read from, taken from the file's metadata in the File
+    service; entries of a file that changed are read again. When the cache
+    grows above ``max_bytes``, the least recently used entries are removed.
+
+    Arrays returned by :meth:`get` and :meth:`read` stay mapped after their
+    entry is replaced or removed, and a mapped file cannot be overwritten or
+    deleted on Windows. Each array is therefore written to a new file name,
+    and the files that could not be deleted, which no entry refers to, are
+    deleted when the cache is next opened.
+
+    The index of the entries is written to disk once per :meth:`read`,
+    :meth:`put` or :meth:`invalidate`. The access times recorded by
+    :meth:`get` are written with the next of these calls, or by :meth:`flush`.
+    """
+    def __init__(self, directory, max_bytes=1 << 30, fileingestionclient=None):
+        """
+        :param directory: The directory the cache is stored in.
+        :type directory: str
+        :param max_bytes: Maximum total size of the cached arrays.
+        :type max_bytes: int
+        :param fileingestionclient: The client used to look up file versions
+            in :meth:`read`, or ``None`` to not validate entries.
+        :type fileingestionclient: systemlink.fileingestionclient.FileIngestionClient or None
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._fileingestionclient = fileingestionclient
+        self._lock = threading.Lock()
+        self._dirty = False
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._index = {}
+        index_path = os.path.join(directory, _INDEX_FILE_NAME)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path) as index_file:
+                    self._index = json.load(index_file)
+            except (OSError, ValueError) as exc:
+                LOGGER.warning('Ignoring unreadable channel cache index %s: %s', index_path, exc)
+        self._sweep()
+
+    @property
+    def size(self):
+        """
+        Total size, in bytes, of the cached arrays.
+
+        :rtype: int
+        """
+        with self._lock:
+            return sum(entry['size'] for entry in self._index.values())
+
+    def get(self,  # pylint: disable=too-many-arguments
+            file_id,
+            group_name,
+            channel_name,
+            data_window,
+            version=None):
+        """
+        Return cached channel data, or ``None`` if it is not cached.
+
+        :param file_id: The id of the TDMS file in the File service.
+        :type file_id: str
+        :param group_name: The name of the group that holds the channel.
+        :type group_name: str
+        :param channel_name: The name of the channel.
+        :type channel_name: str
+        :param data_window: The window of samples.
+        :type data_window: systemlink.tdmsreaderclient.messages.DataWindow
+        :param version: The current version of the file, as returned by
+            :func:`file_version`, or ``None`` to accept any version.
+        :type version: str or None
+        :return: A read-only memory-mapped array, or ``None``.
+        :rtype: numpy.memmap or None
+        """
+        key = entry_key(file_id, group_name, channel_name, data_window)
+        with self._lock:
+            return self._get(key, version)
+
+    def put(self,  # pylint: disable=too-many-arguments
+            file_id,
+            group_name,
+            channel_name,
+            data_window,
+            data,
+            version=None):
+        """
+        Store channel data in the cache.
+
+        :param data: The channel data.
+        :type data: numpy.ndarray
+        :param version: The version of the file the data was read from.
+        :type version: str or None
+
+        See :meth:`get` for the other parameters.
+        """
+        key = entry_key(file_id, group_name, channel_name, data_window)
+        with self._lock:
+            self._put(key, file_id, data, version)
+            self._evict()
+            self._save_index()
+
+    def invalidate(self, file_id):
+        """
+        Remove every entry of a file.
+
+        :param file_id: The id of the TDMS file in the File service.
+        :type file_id: str
+        """
+        with self._lock:
+            for key in [key for key, entry in self._index.items() if entry['fileId'] == file_id]:
+                self._remove(key)
+            self._save_index()
+
+    def flush(self):
+        """
+        Write the index to disk if it changed since it was last written.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def read(self,  # pylint: disable=too-many-arguments
+             tdmsreaderclient,
+             file_id,
+             group_name,
+             channel_names,
+             data_window):
+        """
+        Read channels through the cache
+
+        Channels that are cached for the current version of the file are
+        memory-mapped from disk. The others are read with one
+        :func:`tdms_channels.read_channel_arrays` request and added to the
+        cache, each with the length of its channel. The index is written once.
+
+        :param tdmsreaderclient: The client used to read missing channels.
+        :type tdmsreaderclient: systemlink.tdmsreaderclient.TDMSReaderClient
+        :param file_id: The id of the TDMS file in the File service.
+        :type file_id: str
+        :param group_name: The name of the group that holds the channels.
+        :type group_name: str
+        :param channel_names: The names of the channels.
+        :type channel_names: list(str)
+        :param data_window: The window of samples.
+        :type data_window: systemlink.tdmsreaderclient.messages.DataWindow
+        :return: The data of each channel, in the order of ``channel_names``.
+        :rtype: list(numpy.ndarray)
+        """
+        version = None
+        if self._fileingestionclient is not None:
+            version = file_version(self._fileingestionclient, file_id)
+        keys = [entry_key(file_id, group_name, channel_name, data_window)
+                for channel_name in channel_names]
+        with self._lock:
+            channels = [self._get(key, version) for key in keys]
+        missing = [index for index, data in enumerate(channels) if data is None]
+        LOGGER.debug('Channel cache: %d hits, %d misses',
+                     len(channels) - len(missing), len(missing))
+        if missing:
+            rows = read_channel_arrays(tdmsreaderclient, file_id, group_name,
+                                       [channel_names[index] for index in missing], data_window)
+            for row, index in zip(rows, missing):
+                channels[index] = row
+        with self._lock:
+            for index in missing:
+                self._put(keys[index], file_id, channels[index], version)
+            if missing:
+                self._evict()
+            if self._dirty:
+                self._save_index()
+        return channels
+
+    def _get(self, key, version):
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if version is not None and entry['version'] != version:
+            self._remove(key)
+            return None
+        try:
+            data = np.load(self._path(entry, key), mmap_mode='r')
+        except (OSError, ValueError):
+            self._remove(key)
+            return None
+        entry['lastAccess'] = time.time()
+        self._dirty = True
+        return data
+
+    def _put(self, key, file_id, data, version):
+        data = np.ascontiguousarray(data)
+        self._remove(key)
+        file_name = '{}.{}.npy'.format(key, uuid.uuid4().hex)
+        np.save(os.path.join(self._directory, file_name), data)
+        self._index[key] = {
+            'fileName': file_name,
+            'fileId': file_id,
+            'version': version,
+            'size': int(data.nbytes),
+            'lastAccess': time.time(),
+        }
+        self._dirty = True
+
+    def _path(self, entry, key):
+        return os.path.join(self._directory, entry.get('fileName', key + '.npy'))
+
+    def _remove(self, key):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._dirty = True
+        try:
+            os.remove(self._path(entry, key))
+        except OSError as exc:
+            # Still mapped on Windows; deleted by _sweep when the cache is next opened
+            LOGGER.debug('Cannot delete cached channel %s yet: %s', key, exc)
+
+    def _sweep(self):
+        """
+        Delete the array files no entry refers to.
+        """
+        indexed = set(os.path.basename(self._path(entry, key))
+                      for key, entry in self._index.items())
+        for file_name in os.listdir(self._directory):
+            if file_name.endswith('.npy') and file_name not in indexed:
+                try:
+                    os.remove(os.path.join(self._directory, file_name))
+                except OSError as exc:
+                    LOGGER.debug('Cannot delete unused cache file %s: %s', file_name, exc)
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['lastAccess']):
+            if total <= self._max_bytes:
+                break
+            total -= entry['size']
+            self._remove(key)
+
+    def _save_index(self):
+        index_path = os.path.join(self._directory, _INDEX_FILE_NAME)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self._index, index_file)
+        os.replace(temp_path, index_path)
+        self._dirty = False
+
+
+def entry_key(file_id, group_name, channel_name, data_window):
+    """
+    Return the cache key of a channel and data window.
+
+    :rtype: str
+    """
+    if hasattr(data_window, 'to_dict'):
+        window = data_window.to_dict()
+    else:
+        window = repr(data_window)
+    identity = json.dumps([file_id, group_name, channel_name, window], sort_keys=True, default=str)
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def file_version(fileingestionclient, file_id):
+    """
+    Return a token that changes whenever the metadata of a file changes.
+
+    :param fileingestionclient: The client used to query the file.
+    :type fileingestionclient: systemlink.fileingestionclient.FileIngestionClient
+    :param file_id: The id of the file in the File service.
+    :type file_id: str
+    :return: The token, or ``None`` if the file does not exist.
+    :rtype: str or None
+    """
+    equal_op = fileingestion_messages.QueryOperator(fileingestion_messages.QueryOperator.EQUAL)
+    query = fileingestion_messages.StringQueryEntry('Id', file_id, equal_op)
+    res = fileingestionclient.query_files(properties_query=[query])
+    if not res.available_files:
+        return None
+    metadata = json.dumps(res.available_files[0].to_dict(), sort_keys=True, default=str)
+    return hashlib.sha1(metadata.encode('utf-8')).hexdigest()
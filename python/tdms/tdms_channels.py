@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Batched and decimated reads of many TDMS channels into NumPy arrays.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import logging
+
+# Import third party libs
+import numpy as np
+
+# Import local libs
+# pylint: disable=import-error
+from systemlink.tdmsreaderclient import messages as tdmsreader_messages
+# pylint: enable=import-error
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+def read_channels(tdmsreaderclient,  # pylint: disable=too-many-arguments
+                  file_id,
+                  group_name,
+                  channel_names,
+                  data_window,
+                  chunk_size=None,
+                  max_workers=4):
+    """
+    Read the numeric data of several channels of a TDMS file into one array
+
+    See :func:`read_channel_arrays` for the parameters.
+
+    :return: A C-contiguous ``(n_channels, n_samples)`` ``float64`` array, one
+        row per channel in the order of ``channel_names``. Channels shorter
+        than the longest one are padded with ``nan``.
+    :rtype: numpy.ndarray
+    """
+    rows = read_channel_arrays(tdmsreaderclient, file_id, group_name, channel_names,
+                               data_window, chunk_size, max_workers)
+    if not rows:
+        return np.empty((0, 0))
+    n_samples = max(len(row) for row in rows)
+    data = np.full((len(rows), n_samples), np.nan)
+    for index, row in enumerate(rows):
+        data[index, :len(row)] = row
+    return data
+
+
+def read_channel_arrays(tdmsreaderclient,  # pylint: disable=too-many-arguments
+                        file_id,
+                        group_name,
+                        channel_names,
+                        data_window,
+                        chunk_size=None,
+                        max_workers=4):
+    """
+    Read the numeric data of several channels of a TDMS file
+
+    All channels are requested in one ``query_data`` call, or in one call per
+    ``chunk_size`` channels issued concurrently, instead of one call per
+    channel.
+
+    :param tdmsreaderclient: The client used to read the data.
+    :type tdmsreaderclient: systemlink.tdmsreaderclient.TDMSReaderClient
+    :param file_id: The id of the TDMS file in the File service.
+    :type file_id: str
+    :param group_name: The name of the group that holds the channels.
+    :type group_name: str
+    :param channel_names: The names of the channels to read.
+    :type channel_names: list(str)
+    :param data_window: The window of samples to read.
+    :type data_window: systemlink.tdmsreaderclient.messages.DataWindow
+    :param chunk_size: Maximum number of channels per request, or ``None`` to
+        read all channels in one request.
+    :type chunk_size: int or None
+    :param max_workers: Maximum number of requests in flight at the same time.
+    :type max_workers: int
+    :return: One ``float64`` array per channel, in the order of
+        ``channel_names``, each as long as the data of its channel.
+    :rtype: list(numpy.ndarray)
+    """
+    channel_names = list(channel_names)
+    if not channel_names:
+        return []
+    chunk_size = chunk_size or len(channel_names)
+    chunks = [channel_names[start:start + chunk_size]
+              for start in range(0, len(channel_names), chunk_size)]
+
+    def query_chunk(names):
+        return _query_numeric_data(tdmsreaderclient, file_id, group_name, names, data_window)
+
+    if len(chunks) == 1:
+        rows = query_chunk(chunks[0])
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            rows = [row for chunk_rows in executor.map(query_chunk, chunks) for row in chunk_rows]
+    LOGGER.debug('Read %d channels in %d requests', len(rows), len(chunks))
+    return [np.asarray(row, dtype=np.float64) for row in rows]
+
+
+def sample_window(start, count):
+    """
+    Return the data window of ``count`` samples starting at sample ``start``.
+
+    This generalizes the ``DataWindow(0, 1000, False, 0, 1000, False, 0, 0,
+    False, False)`` window of the TDMReader example to any range of samples.
+
+    :param start: Index of the first sample.
+    :type start: int
+    :param count: Number of samples.
+    :type count: int
+    :rtype: systemlink.tdmsreaderclient.messages.DataWindow
+    """
+    end = start + count
+    return tdmsreader_messages.DataWindow(start, end, False, start, end, False, 0, 0, False, False)
+
+
+def read_envelope(tdmsreaderclient,  # pylint: disable=too-many-arguments,too-many-locals
+                  file_id,
+                  group_name,
+                  channel_names,
+                  n_samples,
+                  width,
+                  chunk_samples=100000,
+                  window_factory=sample_window):
+    """
+    Read the per-bucket min, max and mean of several TDMS channels
+
+    The ``n_samples`` samples of each channel are split into ``width`` buckets
+    of (almost) equal length, for example one per horizontal pixel of a plot.
+    The samples are read ``chunk_samples`` at a time with :func:`read_channels`
+    and reduced as they arrive, so memory is bounded by one chunk no matter
+    how long the channels are. The next chunk is requested while the current
+    one is reduced.
+
+    :param tdmsreaderclient: The client used to read the data.
+    :type tdmsreaderclient: systemlink.tdmsreaderclient.TDMSReaderClient
+    :param file_id: The id of the TDMS file in the File service.
+    :type file_id: str
+    :param group_name: The name of the group that holds the channels.
+    :type group_name: str
+    :param channel_names: The names of the channels to read.
+    :type channel_names: list(str)
+    :param n_samples: Number of samples per channel.
+    :type n_samples: int
+    :param width: Number of buckets.
+    :type width: int
+    :param chunk_samples: Number of samples per channel read per request.
+    :type chunk_samples: int
+    :param window_factory: Callable that takes the first sample and the number
+        of samples of a chunk and returns its data window.
+    :type window_factory: callable
+    :return: The index of the first sample of each bucket, and the
+        ``(n_channels, width)`` min, max and mean arrays. Buckets without
+        samples are ``nan``.
+    :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    channel_names = list(channel_names)
+    if n_samples <= 0:
+        empty = np.empty((len(channel_names), 0))
+        return np.empty(0, dtype=np.int64), empty, empty.copy(), empty.copy()
+    width = max(min(width, n_samples), 1)
+    edges = np.linspace(0, n_samples, width + 1).astype(np.int64)
+    minimum = np.full((len(channel_names), width), np.nan)
+    maximum = np.full((len(channel_names), width), np.nan)
+    total = np.zeros((len(channel_names), width))
+    count = np.zeros(width, dtype=np.int64)
+
+    def read_chunk(start):
+        chunk_count = min(chunk_samples, n_samples - start)
+        return start, read_channels(tdmsreaderclient, file_id, group_name, channel_names,
+                                    window_factory(start, chunk_count))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        starts = iter(range(0, n_samples, chunk_samples))
+        future = executor.submit(read_chunk, next(starts))
+        while future is not None:
+            start, chunk = future.result()
+            next_start = next(starts, None)
+            future = executor.submit(read_chunk, next_start) if next_start is not None else None
+            if chunk.size == 0:
+                continue
+            end = start + chunk.shape[1]
+            # Buckets that overlap [start, end) and the chunk offsets where each one begins
+            first = np.searchsorted(edges, start, side='right') - 1
+            last = np.searchsorted(edges, end - 1, side='right') - 1
+            offsets = np.concatenate(([0], edges[first + 1:last + 1] - start))
+            buckets = slice(first, last + 1)
+            minimum[:, buckets] = np.fmin(minimum[:, buckets],
+                                          np.fmin.reduceat(chunk, offsets, axis=1))
+            maximum[:, buckets] = np.fmax(maximum[:, buckets],
+                                          np.fmax.reduceat(chunk, offsets, axis=1))
+            total[:, buckets] += np.add.reduceat(chunk, offsets, axis=1)
+            count[buckets] += np.diff(np.concatenate((offsets, [end - start])))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return edges[:-1], minimum, maximum, mean
+
+
+def _query_numeric_data(tdmsreaderclient, file_id, group_name, channel_names, data_window):
+    """
+    Read several channels with one ``query_data`` request.
+
+    :return: The numeric data of each channel, in the order of ``channel_names``.
+    :rtype: list(list(float))
+    """
+    channel_specifiers = [
+        tdmsreader_messages.OneChannelSpecifier(file_id, group_name, channel_name)
+        for channel_name in channel_names]
+    xy_channels = tdmsreader_messages.XYChannels(None, channel_specifiers)
+    channel_spec = tdmsreader_messages.ChannelSpecifications([xy_channels])
+    channel_and_window = tdmsreader_messages.ChannelSpecificationsAndWindow(
+        channel_spec, data_window)
+    response = tdmsreaderclient.query_data(channel_and_window)
+    return [channel.numeric_data for channel in response.data[0].y]
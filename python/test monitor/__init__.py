@@ -5,32 +5,82 @@ API to create, update, delete and query Skyline Test Monitor results and steps.
 from __future__ import absolute_import
 
 # Import python libs
-import datetime
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import importlib
+import itertools
+import json
 import logging
+import threading
 
 # Import local libs
-# pylint: disable=import-error
-from systemlink.messagebus.amqp_connection_manager import AmqpConnectionManager
-from systemlink.messagebus.exceptions import SystemLinkException
-from systemlink.messagebus.message_service import MessageService
-from systemlink.messagebus.message_service_builder import MessageServiceBuilder
-from . import messages as testmon_messages  # pylint: disable=no-name-in-module
-# pylint: enable=import-error
+# The message bus and the message classes are imported when they are first used,
+# so that scripts that only make a few calls start quickly.
+from .instrumentation import RequestMetrics
 
 # Set up logging
 LOGGER = logging.getLogger(__name__)
 
 
+class _LazyModule():
+    """
+    Stand-in for a module that imports it on first attribute access.
+    """
+    def __init__(self, name, package=None):
+        self._name = name
+        self._package = package
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name, self._package)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
+
+
+testmon_messages = _LazyModule('.messages', __name__)  # pylint: disable=invalid-name
+
+# Public classes of the submodules, imported on first access (PEP 562)
+_SUBMODULE_EXPORTS = {
+    'AnalyticsStore': 'analytics_store',
+    'AsyncTestMonitorClient': 'async_client',
+    'ConnectionPool': 'connection_pool',
+    'ResultWriter': 'result_writer',
+    'StepRecorder': 'step_recorder',
+}
+
+# Default columns of query_results_frame and query_steps_frame
+RESULT_FRAME_COLUMNS = ['status', 'startedAt', 'updatedAt', 'programName', 'id', 'systemId',
+                        'operator', 'serialNumber', 'totalTimeInSeconds']
+STEP_FRAME_COLUMNS = ['name', 'stepType', 'stepId', 'parentId', 'resultId', 'status',
+                      'startedAt', 'totalTimeInSeconds']
+
+_CATEGORICAL_COLUMNS = frozenset(['status', 'programName', 'name', 'stepType'])
+_DATETIME_COLUMNS = frozenset(['startedAt', 'updatedAt'])
+_NUMERIC_COLUMNS = frozenset(['totalTimeInSeconds'])
+
+
 class TestMonitorClient():
     """
     Class to publicly access the Test Monitor Client.
+
+    A client can be used from several threads, including the background
+    threads of :meth:`iter_results` and :meth:`query_steps_for_results`. The
+    message service is not documented as safe for concurrent publishes, so
+    the requests of one client are published one at a time.
     """
     def __init__(self,  # pylint: disable=too-many-arguments
                  message_service=None,
                  service_name='TestMonitorClient',
                  config=None,
                  connection_timeout=5,
-                 auto_reconnect=True):
+                 auto_reconnect=True,
+                 metrics=None,
+                 connection_pool=None):
         """
         :param message_service: An instance of the message
             service to use or ``None`` to allow this object to create and own
@@ -47,19 +97,47 @@ class TestMonitorClient():
         :param connection_timeout: Timeout, in seconds, to use
             when trying to connect to the message broker.
         :type connection_timeout: float or int
+        :param metrics: The object that collects request statistics or ``None`` to
+            create one for this client.
+        :type metrics: RequestMetrics or None
+        :param connection_pool: If ``message_service`` is ``None``, the pool the
+            broker connection is shared from, or ``None`` to create and own a
+            connection for this client. The ``connection_timeout`` and
+            ``auto_reconnect`` of the client that opened a shared connection
+            apply to all the clients that share it. See :class:`ConnectionPool`
+            for when a connection can be shared.
+        :type connection_pool: ConnectionPool or None
         """
         self._closing = False
+        self._request_options = threading.local()
+        self._publish_lock = threading.Lock()
+        self._metrics = metrics if metrics is not None else RequestMetrics()
         self._own_message_service = False
         self._connection_manager = None
+        self._connection_pool = None
         if message_service:
             self._message_service = message_service
         else:
-            self._connection_manager = AmqpConnectionManager(config=config)
-            self._connection_manager.connection_timeout = connection_timeout
-            self._connection_manager.auto_reconnect = auto_reconnect
-            message_service_builder = MessageServiceBuilder(service_name)
-            message_service_builder.connection_manager = self._connection_manager
-            self._message_service = MessageService(message_service_builder)
+            if connection_pool is not None:
+                self._connection_manager = connection_pool.acquire(
+                    config, connection_timeout, auto_reconnect)
+                self._connection_pool = connection_pool
+            else:
+                # pylint: disable=import-error,import-outside-toplevel
+                from systemlink.messagebus.amqp_connection_manager import AmqpConnectionManager
+                self._connection_manager = AmqpConnectionManager(config=config)
+                self._connection_manager.connection_timeout = connection_timeout
+                self._connection_manager.auto_reconnect = auto_reconnect
+            try:
+                # pylint: disable=import-error,import-outside-toplevel
+                from systemlink.messagebus.message_service import MessageService
+                from systemlink.messagebus.message_service_builder import MessageServiceBuilder
+                message_service_builder = MessageServiceBuilder(service_name)
+                message_service_builder.connection_manager = self._connection_manager
+                self._message_service = MessageService(message_service_builder)
+            except BaseException:
+                self._release_connection_manager()
+                raise
             self._own_message_service = True
 
     def __enter__(self):
@@ -80,8 +158,48 @@ class TestMonitorClient():
         self._closing = True
         if self._own_message_service:
             self._message_service.close()
+            self._release_connection_manager()
+
+    def _release_connection_manager(self):
+        """
+        Release the connection manager to its pool, or close it if this client owns it.
+        """
+        if self._connection_pool is not None:
+            self._connection_pool.release(self._connection_manager)
+        else:
             self._connection_manager.close()
 
+    @contextlib.contextmanager
+    def request_timeout(self, timeout):
+        """
+        Return a context manager that sets the reply timeout of the requests of this thread
+
+        Requests published by the current thread inside the ``with`` block wait
+        at most ``timeout`` seconds for their reply and then raise
+        ``Skyline.RequestTimedOut``. The request is still delivered to the
+        service, so a request that timed out may have been applied.
+
+        :param timeout: Timeout, in seconds, or ``None`` for the message
+            service's default.
+        :type timeout: float or int or None
+        :rtype: contextlib.AbstractContextManager
+        """
+        previous = getattr(self._request_options, 'timeout', None)
+        self._request_options.timeout = timeout
+        try:
+            yield
+        finally:
+            self._request_options.timeout = previous
+
+    @property
+    def metrics(self):
+        """
+        Latency, payload and error statistics of the requests published by this client.
+
+        :rtype: RequestMetrics
+        """
+        return self._metrics
+
     def create_results(self, results):
         """
         Create one or more test results
@@ -111,27 +229,40 @@ class TestMonitorClient():
                     List of fileIds associated with the result.
         :type results: list(dict)
         """
-        result_create_requests = []
-        for test in results:
-            test_status = test['status']
-            if isinstance(test_status, str):
-                test_status = testmon_messages.Status(
-                    testmon_messages.StatusType.from_string(test_status.upper()), test_status)
-                test['status'] = test_status.to_dict()
-            result_create_request = testmon_messages.ResultCreateRequest.from_dict(test)
-            result_create_requests.append(result_create_request)
-
-        request = testmon_messages.TestMonitorCreateTestResultsRequest(result_create_requests)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorCreateTestResultsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
-
-        return res
+        def build_request():
+            result_create_requests = []
+            for test in results:
+                _convert_status(test)
+                result_create_request = testmon_messages.ResultCreateRequest.from_dict(test)
+                result_create_requests.append(result_create_request)
+            return testmon_messages.TestMonitorCreateTestResultsRequest(result_create_requests)
+
+        return self._dispatch('create_results', build_request,
+                              testmon_messages.TestMonitorCreateTestResultsResponse)
+
+    def create_results_from_frame(self, frame, chunk_size=1000):
+        """
+        Create test results from columnar data
+
+        Status columns are converted once per distinct status name and the
+        caller's data is not modified.
+
+        :param frame: A :class:`pandas.DataFrame` or a dict of column name to
+            column values (list or :class:`numpy.ndarray`). Column names are
+            the keys accepted by :meth:`create_results`. Datetime columns are
+            sent in ISO 8601 format.
+        :type frame: pandas.DataFrame or dict
+        :param chunk_size: Maximum number of results sent in one request.
+        :type chunk_size: int
+        :return: The response of each request, in order.
+        :rtype: list(systemlink.testmonclient.messages.TestMonitorCreateTestResultsResponse)
+        """
+        return [self._dispatch('create_results',
+                               functools.partial(
+                                   testmon_messages.TestMonitorCreateTestResultsRequest, chunk),
+                               testmon_messages.TestMonitorCreateTestResultsResponse)
+                for chunk in _requests_from_frame(
+                    frame, testmon_messages.ResultCreateRequest, chunk_size)]
 
     def update_results(self, updates, replace=False, determine_status_from_steps=False):
         """
@@ -166,31 +297,19 @@ class TestMonitorClient():
             status of the related steps.
         :type determine_status_from_steps: bool
         """
-        result_update_requests = []
-        for update in updates:
-            test_status = update['status']
-            if isinstance(test_status, str):
-                test_status = testmon_messages.Status(
-                    testmon_messages.StatusType.from_string(test_status.upper()),
-                    test_status)
-                update['status'] = test_status.to_dict()
-            result_update_request = testmon_messages.ResultUpdateRequest.from_dict(update)
-            result_update_requests.append(result_update_request)
-
-        request = testmon_messages.TestMonitorUpdateTestResultsRequest(
-            result_update_requests,
-            replace,
-            determine_status_from_steps)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorUpdateTestResultsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
-
-        return res
+        def build_request():
+            result_update_requests = []
+            for update in updates:
+                _convert_status(update)
+                result_update_request = testmon_messages.ResultUpdateRequest.from_dict(update)
+                result_update_requests.append(result_update_request)
+            return testmon_messages.TestMonitorUpdateTestResultsRequest(
+                result_update_requests,
+                replace,
+                determine_status_from_steps)
+
+        return self._dispatch('update_results', build_request,
+                              testmon_messages.TestMonitorUpdateTestResultsResponse)
 
     def delete_results(self, ids, delete_steps=True):
         """
@@ -201,24 +320,23 @@ class TestMonitorClient():
         :param delete_steps: Whether or not to delete the results corresponding steps.
         :type delete_steps: bool
         """
-        request = testmon_messages.TestMonitorDeleteResultsRequest(ids, delete_steps)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorDeleteResultsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
-
-        return res
+        return self._dispatch('delete_results',
+                              functools.partial(testmon_messages.TestMonitorDeleteResultsRequest,
+                                                ids, delete_steps),
+                              testmon_messages.TestMonitorDeleteResultsResponse)
 
     def delete_all_results(self):
         """
         Delete all results
         """
-        routed_message = testmon_messages.TestMonitorDeleteAllResultsRoutedMessage()
-        self._message_service.publish_routed_message(routed_message)
+        with self._metrics.measure('delete_all_results') as record:
+            routed_message = testmon_messages.TestMonitorDeleteAllResultsRoutedMessage()
+            if self._metrics.measures_request_bytes:
+                record.request_bytes = _message_size(routed_message)
+            record.serialized()
+            with self._publish_lock:
+                self._message_service.publish_routed_message(routed_message)
+            record.published()
 
     def query_results(self, query=None, skip=0, take=-1):
         """
@@ -233,18 +351,51 @@ class TestMonitorClient():
         :return: Results that matched the query.
         :rtype: tuple(list(systemlink.testmonclient.messages.ResultResponse), int)
         """
-        request = testmon_messages.TestMonitorQueryResultsRequest(query, skip, take)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorQueryResultsResponse.from_message(generic_message)
+        res = self._dispatch('query_results',
+                             functools.partial(testmon_messages.TestMonitorQueryResultsRequest,
+                                               query, skip, take),
+                             testmon_messages.TestMonitorQueryResultsResponse)
         LOGGER.debug('TotalCount: %d', res.total_count)
 
         return res.results, res.total_count
 
+    def iter_results(self, query=None, page_size=1000):
+        """
+        Iterate over results that match query, one page at a time
+
+        The next page is requested in the background while the caller consumes
+        the current one, so at most two pages are held in memory.
+
+        :param query: Object indicating query parameters.
+        :type query: systemlink.testmonclient.messages.ResultQuery
+        :param page_size: Number of results to request per page.
+        :type page_size: int
+        :return: Results that matched the query.
+        :rtype: iterator(systemlink.testmonclient.messages.ResultResponse)
+        """
+        return self._iter_pages(self.query_results, query, page_size)
+
+    def query_results_frame(self, query=None, columns=None, page_size=1000):
+        """
+        Return results that match query as a :class:`pandas.DataFrame`
+
+        Results are fetched page by page and decoded straight into columns.
+        ``status`` and ``programName`` are categorical and timestamp columns
+        are ``datetime64``.
+
+        :param query: Object indicating query parameters.
+        :type query: systemlink.testmonclient.messages.ResultQuery
+        :param columns: Names of the result fields to include, as accepted by
+            :meth:`create_results`, or ``None`` for the default set.
+        :type columns: list(str) or None
+        :param page_size: Number of results to request per page.
+        :type page_size: int
+        :return: One row per result that matched the query.
+        :rtype: pandas.DataFrame
+        """
+        return _frame_from_items(self.iter_results(query, page_size),
+                                 columns or RESULT_FRAME_COLUMNS)
+
     def create_steps(self, steps):
         """
         Create one or more step results
@@ -277,28 +428,40 @@ class TestMonitorClient():
                     A list of step ids that define other steps in the request that are children of
                     this step.  The ids in this list must exist as objects in the in the request.
         """
-        step_create_requests = []
-        for step in steps:
-            step_status = step['status']
-            if isinstance(step_status, str):
-                step_status = testmon_messages.Status(
-                    testmon_messages.StatusType.from_string(step_status.upper()),
-                    step_status)
-                step['status'] = step_status.to_dict()
-            step_create_request = testmon_messages.StepCreateRequest.from_dict(step)
-            step_create_requests.append(step_create_request)
-
-        request = testmon_messages.TestMonitorCreateTestStepsRequest(step_create_requests)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorCreateTestStepsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
-
-        return res
+        def build_request():
+            step_create_requests = []
+            for step in steps:
+                _convert_status(step)
+                step_create_request = testmon_messages.StepCreateRequest.from_dict(step)
+                step_create_requests.append(step_create_request)
+            return testmon_messages.TestMonitorCreateTestStepsRequest(step_create_requests)
+
+        return self._dispatch('create_steps', build_request,
+                              testmon_messages.TestMonitorCreateTestStepsResponse)
+
+    def create_steps_from_frame(self, frame, chunk_size=1000):
+        """
+        Create step results from columnar data
+
+        Status columns are converted once per distinct status name and the
+        caller's data is not modified.
+
+        :param frame: A :class:`pandas.DataFrame` or a dict of column name to
+            column values (list or :class:`numpy.ndarray`). Column names are
+            the keys accepted by :meth:`create_steps`. Datetime columns are
+            sent in ISO 8601 format.
+        :type frame: pandas.DataFrame or dict
+        :param chunk_size: Maximum number of steps sent in one request.
+        :type chunk_size: int
+        :return: The response of each request, in order.
+        :rtype: list(systemlink.testmonclient.messages.TestMonitorCreateTestStepsResponse)
+        """
+        return [self._dispatch('create_steps',
+                               functools.partial(
+                                   testmon_messages.TestMonitorCreateTestStepsRequest, chunk),
+                               testmon_messages.TestMonitorCreateTestStepsResponse)
+                for chunk in _requests_from_frame(
+                    frame, testmon_messages.StepCreateRequest, chunk_size)]
 
     def update_steps(self, steps):
         """
@@ -333,28 +496,16 @@ class TestMonitorClient():
                     A list of step ids that define other steps in the request that are children of
                     this step.  The ids in this list must exist as objects in the in the request.
         """
-        step_update_requests = []
-        for step in steps:
-            if 'status' in step:
-                step_status = step['status']
-                if isinstance(step_status, str):
-                    step_status = testmon_messages.Status(
-                        testmon_messages.StatusType.from_string(step_status.upper()),
-                        step_status)
-                    step['status'] = step_status.to_dict()
-            step_update_request = testmon_messages.StepUpdateRequest.from_dict(step)
-            step_update_requests.append(step_update_request)
-        request = testmon_messages.TestMonitorUpdateTestStepsRequest(step_update_requests)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorUpdateTestStepsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
+        def build_request():
+            step_update_requests = []
+            for step in steps:
+                _convert_status(step)
+                step_update_request = testmon_messages.StepUpdateRequest.from_dict(step)
+                step_update_requests.append(step_update_request)
+            return testmon_messages.TestMonitorUpdateTestStepsRequest(step_update_requests)
 
-        return res
+        return self._dispatch('update_steps', build_request,
+                              testmon_messages.TestMonitorUpdateTestStepsResponse)
 
     def delete_steps(self, steps):
         """
@@ -367,23 +518,15 @@ class TestMonitorClient():
                     Identifier for the result that this step is associated with.
         :type steps: list(dict)
         """
-        delete_steps = []
-
-        for step in steps:
-            delete_step = testmon_messages.StepDeleteRequest.from_dict(step)
-            delete_steps.append(delete_step)
+        def build_request():
+            delete_steps = []
+            for step in steps:
+                delete_step = testmon_messages.StepDeleteRequest.from_dict(step)
+                delete_steps.append(delete_step)
+            return testmon_messages.TestMonitorDeleteStepsRequest(delete_steps)
 
-        request = testmon_messages.TestMonitorDeleteStepsRequest(delete_steps)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorDeleteStepsResponse.from_message(generic_message)
-        LOGGER.debug('message = %s', res)
-
-        return res
+        return self._dispatch('delete_steps', build_request,
+                              testmon_messages.TestMonitorDeleteStepsResponse)
 
     def query_steps(self, query=None, skip=0, take=-1):
         """
@@ -398,15 +541,381 @@ class TestMonitorClient():
         :return: Results that matched the query.
         :rtype: tuple(list(systemlink.testmonclient.messages.StepResponse), int)
         """
-
-        request = testmon_messages.TestMonitorQueryStepsRequest(query, skip, take)
-        generic_message = self._message_service.publish_synchronous_message(request)
-        if generic_message is None:
-            raise SystemLinkException.from_name('Skyline.RequestTimedOut')
-        if generic_message.has_error():
-            raise SystemLinkException(error=generic_message.error)
-        LOGGER.debug('generic_message = %s', generic_message)
-        res = testmon_messages.TestMonitorQueryStepsResponse.from_message(generic_message)
+        res = self._dispatch('query_steps',
+                             functools.partial(testmon_messages.TestMonitorQueryStepsRequest,
+                                               query, skip, take),
+                             testmon_messages.TestMonitorQueryStepsResponse)
         LOGGER.debug('TotalCount: %d', res.total_count)
 
         return res.steps, res.total_count
+
+    def iter_steps(self, query=None, page_size=1000):
+        """
+        Iterate over steps that match query, one page at a time
+
+        The next page is requested in the background while the caller consumes
+        the current one, so at most two pages are held in memory.
+
+        :param query: Object indicating query parameters.
+        :type query: systemlink.testmonclient.messages.StepQuery
+        :param page_size: Number of steps to request per page.
+        :type page_size: int
+        :return: Steps that matched the query.
+        :rtype: iterator(systemlink.testmonclient.messages.StepResponse)
+        """
+        return self._iter_pages(self.query_steps, query, page_size)
+
+    def query_steps_frame(self, query=None, columns=None, page_size=1000):
+        """
+        Return steps that match query as a :class:`pandas.DataFrame`
+
+        Steps are fetched page by page and decoded straight into columns.
+        ``status``, ``name`` and ``stepType`` are categorical and timestamp
+        columns are ``datetime64``.
+
+        :param query: Object indicating query parameters.
+        :type query: systemlink.testmonclient.messages.StepQuery
+        :param columns: Names of the step fields to include, as accepted by
+            :meth:`create_steps`, or ``None`` for the default set.
+        :type columns: list(str) or None
+        :param page_size: Number of steps to request per page.
+        :type page_size: int
+        :return: One row per step that matched the query.
+        :rtype: pandas.DataFrame
+        """
+        return _frame_from_items(self.iter_steps(query, page_size),
+                                 columns or STEP_FRAME_COLUMNS)
+
+    def query_steps_for_results(self,  # pylint: disable=too-many-arguments
+                                result_ids,
+                                query=None,
+                                chunk_size=500,
+                                clients=(),
+                                as_frame=False,
+                                columns=None):
+        """
+        Return the steps of many results
+
+        ``result_ids`` is split into chunks that are queried one after another
+        on this client. Since a message service serves one request at a time,
+        chunks are only queried concurrently on other clients, each with its own
+        message service, given in ``clients``. The request timeout of the caller
+        applies to every client. Steps are returned in the order of the chunks,
+        so the output is the same for the same input.
+
+        :param result_ids: IDs of the results whose steps to return.
+        :type result_ids: list(str)
+        :param query: Object indicating additional query parameters or ``None``.
+            Its result ids are replaced by each chunk.
+        :type query: systemlink.testmonclient.messages.StepQuery or None
+        :param chunk_size: Maximum number of result ids per request.
+        :type chunk_size: int
+        :param clients: Other clients that query chunks at the same time as this one.
+        :type clients: list(TestMonitorClient)
+        :param as_frame: Whether to return a :class:`pandas.DataFrame` as with
+            :meth:`query_steps_frame` instead of a list of steps.
+        :type as_frame: bool
+        :param columns: If ``as_frame`` is ``True``, the step fields to include.
+        :type columns: list(str) or None
+        :return: Steps that matched the query and the total count over all chunks.
+        :rtype: tuple(list(systemlink.testmonclient.messages.StepResponse), int) or
+            tuple(pandas.DataFrame, int)
+        """
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be a positive integer')
+        result_ids = list(result_ids)
+        chunk_queries = []
+        for start in range(0, len(result_ids), chunk_size):
+            chunk = result_ids[start:start + chunk_size]
+            if query is None:
+                chunk_query = testmon_messages.StepQuery(
+                    None, None, None, chunk, None, None, None, None, None, None)
+            else:
+                chunk_query = copy.copy(query)
+                chunk_query.result_ids = chunk
+            chunk_queries.append(chunk_query)
+
+        timeout = getattr(self._request_options, 'timeout', None)
+        workers = [self] + list(clients)
+        responses = [None] * len(chunk_queries)
+
+        def query_chunks(index):
+            # Each client queries every len(workers)-th chunk, one at a time
+            client = workers[index]
+            with client.request_timeout(timeout):
+                for position in range(index, len(chunk_queries), len(workers)):
+                    responses[position] = client.query_steps(chunk_queries[position])
+
+        if len(workers) == 1 or len(chunk_queries) <= 1:
+            query_chunks(0)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(workers)) as executor:
+                # list() raises the first error of the workers
+                list(executor.map(query_chunks, range(min(len(workers), len(chunk_queries)))))
+        steps = [step for chunk_steps, _ in responses for step in chunk_steps]
+        total_count = sum(chunk_total_count for _, chunk_total_count in responses)
+        LOGGER.debug('TotalCount: %d over %d chunks', total_count, len(responses))
+        if as_frame:
+            return _frame_from_items(steps, columns or STEP_FRAME_COLUMNS), total_count
+        return steps, total_count
+
+    def _dispatch(self, operation, build_request, response_class):
+        """
+        Publish a request and decode its reply.
+
+        :param operation: Name of the public method that issues the request.
+        :type operation: str
+        :param build_request: A callable that returns the request message.
+        :type build_request: callable
+        :param response_class: The message class of the reply.
+        :return: The decoded reply.
+        """
+        with self._metrics.measure(operation) as record:
+            request = build_request()
+            if self._metrics.measures_request_bytes:
+                record.request_bytes = _message_size(request)
+            record.serialized()
+            timeout = getattr(self._request_options, 'timeout', None)
+            with self._publish_lock:
+                if timeout is None:
+                    generic_message = self._message_service.publish_synchronous_message(request)
+                else:
+                    generic_message = self._message_service.publish_synchronous_message(
+                        request, timeout)
+            record.published()
+            if generic_message is None:
+                record.timed_out = True
+                raise _exception_class().from_name('Skyline.RequestTimedOut')
+            if generic_message.has_error():
+                raise _exception_class()(error=generic_message.error)
+            LOGGER.debug('generic_message = %s', generic_message)
+            record.response_bytes = len(generic_message.body_bytes or b'')
+            res = response_class.from_message(generic_message)
+            record.deserialized()
+            LOGGER.debug('message = %s', res)
+
+        return res
+
+    def _with_request_options(self, function):
+        """
+        Bind a function to the request options of the calling thread.
+
+        The request options, such as the timeout set with
+        :meth:`request_timeout`, are per thread; the returned function applies
+        the caller's options on the thread it runs on.
+
+        :param function: The function that publishes requests.
+        :type function: callable
+        :rtype: callable
+        """
+        timeout = getattr(self._request_options, 'timeout', None)
+
+        def call(*args, **kwargs):
+            with self.request_timeout(timeout):
+                return function(*args, **kwargs)
+        return call
+
+    def _iter_pages(self, query_method, query, page_size):
+        """
+        Walk ``skip``/``take`` pages of a query, prefetching the next page.
+
+        The pages are requested with the request options of the calling thread.
+
+        :param query_method: Either :meth:`query_results` or :meth:`query_steps`.
+        :type query_method: callable
+        :param query: Object indicating query parameters.
+        :param page_size: Number of items to request per page.
+        :type page_size: int
+        :return: The items of every page, in order.
+        :rtype: iterator
+        """
+        if page_size <= 0:
+            raise ValueError('page_size must be a positive integer')
+        return self._iter_pages_with(self._with_request_options(query_method), query, page_size)
+
+    @staticmethod
+    def _iter_pages_with(query_method, query, page_size):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            skip = 0
+            future = executor.submit(query_method, query, skip, page_size)
+            while future is not None:
+                items, total_count = future.result()
+                skip += len(items)
+                if items and skip < total_count:
+                    future = executor.submit(query_method, query, skip, page_size)
+                else:
+                    future = None
+                for item in items:
+                    yield item
+
+
+def _message_size(message):
+    """
+    Return the size of the JSON body of a message.
+
+    :param message: A message class instance or a
+        :class:`systemlink.messagebus.generic_message.GenericMessage`.
+    :return: The size, in bytes, or 0 if the message cannot be serialized here.
+    :rtype: int
+    """
+    body_bytes = getattr(message, 'body_bytes', None)
+    if body_bytes is not None:
+        return len(body_bytes)
+    if not hasattr(message, 'to_dict'):
+        return 0
+    return len(json.dumps(message.to_dict(), default=str).encode('utf-8'))
+
+
+def _convert_status(item):
+    """
+    Replace a status name in a result or step dict by the serialized status.
+
+    :param item: The result or step dict. It is modified in place.
+    :type item: dict
+    """
+    status = item.get('status')
+    if isinstance(status, str):
+        item['status'] = dict(_status_from_name(status))
+
+
+@functools.lru_cache(maxsize=None)
+def _status_from_name(status_name):
+    """
+    Return the serialized :class:`systemlink.testmonclient.messages.Status` for a status name.
+
+    :param status_name: Status name, such as ``'Passed'`` or ``'RUNNING'``.
+    :type status_name: str
+    :rtype: dict
+    """
+    return testmon_messages.Status(
+        testmon_messages.StatusType.from_string(status_name.upper()), status_name).to_dict()
+
+
+def _column_values(column):
+    """
+    Convert one column to a list of values that can be serialized.
+
+    Missing values, ``NaN``, ``NaT`` and the ``pd.NA`` of the nullable
+    pandas dtypes, are converted to ``None``, since they are not valid JSON.
+
+    :param column: A :class:`pandas.Series`, :class:`numpy.ndarray` or list.
+    :rtype: list
+    """
+    dtype = getattr(column, 'dtype', None)
+    if dtype is not None and dtype.kind == 'M':
+        if not hasattr(column, 'dt'):
+            # numpy only converts datetime64 values down to microseconds to datetime objects
+            column = column.astype('datetime64[us]')
+        # NaT compares unequal to itself
+        # pylint: disable=comparison-with-itself
+        return [value.isoformat() if value is not None and value == value else None
+                for value in column.tolist()]
+    values = column.tolist() if hasattr(column, 'tolist') else list(column)
+    if hasattr(column, 'isna'):
+        # pandas finds the missing values of every dtype, Int64, boolean and string included
+        return [None if missing else value
+                for value, missing in zip(values, column.isna().tolist())]
+    if dtype is not None and dtype.kind not in 'fcO':
+        return values
+    # NaN compares unequal to itself
+    # pylint: disable=comparison-with-itself
+    return [None if isinstance(value, float) and value != value else value for value in values]
+
+
+def _requests_from_frame(frame, create_request_class, chunk_size):
+    """
+    Yield lists of create requests built from columnar data.
+
+    :param frame: A :class:`pandas.DataFrame` or a dict of column name to column values.
+    :param create_request_class: Either
+        :class:`systemlink.testmonclient.messages.ResultCreateRequest` or
+        :class:`systemlink.testmonclient.messages.StepCreateRequest`.
+    :param chunk_size: Maximum number of requests per list.
+    :type chunk_size: int
+    :rtype: iterator(list)
+    """
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be a positive integer')
+    names = list(frame.keys())
+    columns = [_column_values(frame[name]) for name in names]
+    if 'status' in names:
+        index = names.index('status')
+        statuses = columns[index]
+        lookup = {status: _status_from_name(status)
+                  for status in set(statuses) if isinstance(status, str)}
+        columns[index] = [lookup.get(status, status) if isinstance(status, str) else status
+                          for status in statuses]
+    rows = zip(*columns)
+    while True:
+        chunk = [create_request_class.from_dict(dict(zip(names, row)))
+                 for row in itertools.islice(rows, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def _frame_from_items(items, columns):
+    """
+    Decode results or steps into a :class:`pandas.DataFrame`.
+
+    :param items: Results or steps.
+    :type items: iterator
+    :param columns: camelCase names of the fields to include.
+    :type columns: list(str)
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd  # pylint: disable=import-error,import-outside-toplevel
+
+    attributes = [_snake_case(column) for column in columns]
+    values = [[] for _ in columns]
+    for item in items:
+        for attribute, column_values in zip(attributes, values):
+            column_values.append(getattr(item, attribute, None))
+
+    data = {}
+    for column, column_values in zip(columns, values):
+        if column == 'status':
+            column_values = [status.status_name if status is not None else None
+                             for status in column_values]
+        if column in _CATEGORICAL_COLUMNS:
+            data[column] = pd.Categorical(column_values)
+        elif column in _DATETIME_COLUMNS:
+            data[column] = pd.to_datetime(column_values, utc=True)
+        elif column in _NUMERIC_COLUMNS:
+            data[column] = pd.to_numeric(pd.Series(column_values, dtype=object), errors='coerce')
+        else:
+            data[column] = column_values
+    return pd.DataFrame(data, columns=columns)
+
+
+def _snake_case(name):
+    """
+    Convert a camelCase field name to the matching message attribute name.
+
+    :param name: camelCase name, such as ``'totalTimeInSeconds'``.
+    :type name: str
+    :rtype: str
+    """
+    return ''.join('_' + char.lower() if char.isupper() else char for char in name)
+
+
+def _exception_class():
+    """
+    Return :class:`systemlink.messagebus.exceptions.SystemLinkException`.
+    """
+    # pylint: disable=import-error,import-outside-toplevel
+    from systemlink.messagebus.exceptions import SystemLinkException
+    return SystemLinkException
+
+
+def __getattr__(name):
+    submodule = _SUBMODULE_EXPORTS.get(name)
+    if submodule is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + submodule, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULE_EXPORTS))
@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+Local SQLite mirror of Skyline Test Monitor results and steps with incremental aggregates.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import datetime
+import itertools
+import logging
+import sqlite3
+import threading
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Version of _SCHEMA. A database of another version is emptied and mirrored again.
+SCHEMA_VERSION = 2
+
+# Tables of _SCHEMA, dropped with their triggers when the schema version changes
+_TABLES = ('results', 'steps', 'program_status_counts', 'step_failure_counts',
+           'duration_histogram')
+
+# Aggregates are maintained by triggers, so every insert and delete keeps them
+# up to date without scanning the mirrored tables. They count status types,
+# such as 'FAILED', since status names are free text.
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY, status TEXT, statusType TEXT, startedAt TEXT, updatedAt TEXT,
+    programName TEXT, systemId TEXT, operator TEXT, serialNumber TEXT,
+    totalTimeInSeconds REAL);
+CREATE INDEX IF NOT EXISTS results_updated_at ON results (updatedAt);
+CREATE TABLE IF NOT EXISTS steps (
+    resultId TEXT, stepId TEXT, parentId TEXT, name TEXT, stepType TEXT, status TEXT,
+    statusType TEXT, startedAt TEXT, updatedAt TEXT, totalTimeInSeconds REAL,
+    PRIMARY KEY (resultId, stepId));
+CREATE INDEX IF NOT EXISTS steps_step_id ON steps (stepId);
+CREATE TABLE IF NOT EXISTS program_status_counts (
+    programName TEXT, statusType TEXT, count INTEGER, PRIMARY KEY (programName, statusType));
+CREATE TABLE IF NOT EXISTS step_failure_counts (name TEXT PRIMARY KEY, count INTEGER);
+CREATE TABLE IF NOT EXISTS duration_histogram (
+    programName TEXT, bucket INTEGER, count INTEGER, PRIMARY KEY (programName, bucket));
+
+CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+    INSERT OR IGNORE INTO program_status_counts VALUES (NEW.programName, NEW.statusType, 0);
+    UPDATE program_status_counts SET count = count + 1
+        WHERE programName IS NEW.programName AND statusType IS NEW.statusType;
+    INSERT OR IGNORE INTO duration_histogram
+        SELECT NEW.programName, CAST(NEW.totalTimeInSeconds / value AS INTEGER), 0
+        FROM settings WHERE key = 'bucketWidth' AND NEW.totalTimeInSeconds IS NOT NULL;
+    UPDATE duration_histogram SET count = count + 1
+        WHERE programName IS NEW.programName AND bucket = (
+            SELECT CAST(NEW.totalTimeInSeconds / value AS INTEGER)
+            FROM settings WHERE key = 'bucketWidth');
+END;
+CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+    UPDATE program_status_counts SET count = count - 1
+        WHERE programName IS OLD.programName AND statusType IS OLD.statusType;
+    UPDATE duration_histogram SET count = count - 1
+        WHERE programName IS OLD.programName AND bucket = (
+            SELECT CAST(OLD.totalTimeInSeconds / value AS INTEGER)
+            FROM settings WHERE key = 'bucketWidth');
+END;
+CREATE TRIGGER IF NOT EXISTS steps_insert AFTER INSERT ON steps
+        WHEN NEW.statusType = 'FAILED' AND NEW.stepType IS NOT 'SequenceCall' BEGIN
+    INSERT OR IGNORE INTO step_failure_counts VALUES (NEW.name, 0);
+    UPDATE step_failure_counts SET count = count + 1 WHERE name IS NEW.name;
+END;
+CREATE TRIGGER IF NOT EXISTS steps_delete AFTER DELETE ON steps
+        WHEN OLD.statusType = 'FAILED' AND OLD.stepType IS NOT 'SequenceCall' BEGIN
+    UPDATE step_failure_counts SET count = count - 1 WHERE name IS OLD.name;
+END;
+'''
+
+_RESULT_COLUMNS = ('id', 'status', 'statusType', 'startedAt', 'updatedAt', 'programName',
+                   'systemId', 'operator', 'serialNumber', 'totalTimeInSeconds')
+_STEP_COLUMNS = ('resultId', 'stepId', 'parentId', 'name', 'stepType', 'status', 'statusType',
+                 'startedAt', 'updatedAt', 'totalTimeInSeconds')
+
+# Index of updatedAt in the rows of each table
+_RESULT_UPDATED_AT = _RESULT_COLUMNS.index('updatedAt')
+_STEP_UPDATED_AT = _STEP_COLUMNS.index('updatedAt')
+
+# Maximum number of ids in one IN clause, below the default limit of SQLite
+_MAX_PARAMETERS = 500
+
+
+class AnalyticsStore():
+    """
+    Mirror test results and steps into a SQLite database and keep aggregates up to date.
+
+    :meth:`sync` fetches only the results updated since the watermark of the
+    previous sync, replaces them and their steps in the database, and moves
+    the watermark forward. Results updated at exactly the watermark are
+    fetched again, so a result that shares its ``updatedAt`` with the newest
+    mirrored result is never missed; the ones that did not change are
+    skipped. Each page of results is written, with its steps, in a
+    transaction that also moves the watermark, so memory does not grow with
+    the size of the delta and an interrupted sync resumes after the last
+    written page. Steps that change without their result are mirrored the
+    same way, with a watermark of their own, when ``step_delta_query`` is
+    given. Pass/fail counts per
+    program, failure counts per step name and duration histograms per
+    program are updated incrementally by database triggers, so the
+    dashboards of ``TestMonitorServiceExample.ipynb`` become local queries
+    after a delta sync instead of a download of the whole history.
+    """
+    def __init__(self, path, client, delta_query, bucket_width=1.0, step_delta_query=None):
+        """
+        :param path: The SQLite database file, created if needed. A database
+            created with another :data:`SCHEMA_VERSION` is emptied, and
+            mirrored again by the next sync.
+        :type path: str
+        :param client: The client used to query the results and steps.
+        :type client: TestMonitorClient
+        :param delta_query: Callable that takes the watermark, the ``updatedAt``
+            of the newest mirrored result as an ISO 8601 string or ``None`` on
+            the first sync, and returns the
+            :class:`systemlink.testmonclient.messages.ResultQuery` of the results
+            whose ``updatedAt`` is at or after the watermark, oldest first, since
+            the watermark is moved after each page. On the first sync, it may
+            return ``None`` to query all results.
+        :type delta_query: callable
+        :param bucket_width: Width, in seconds, of the duration histogram buckets.
+            Changing it on an existing database rebuilds the histogram.
+        :type bucket_width: float or int
+        :param step_delta_query: Callable that takes the step watermark, the
+            ``updatedAt`` of the newest mirrored step or ``None``, and returns
+            the :class:`systemlink.testmonclient.messages.StepQuery` of the
+            steps whose ``updatedAt`` is at or after it, oldest first. ``None``
+            to only mirror the steps of the results that changed, so that steps
+            updated on their own are not picked up.
+        :type step_delta_query: callable or None
+        """
+        self._client = client
+        self._delta_query = delta_query
+        self._step_delta_query = step_delta_query
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)')
+            version = self._setting('schemaVersion')
+            if version != SCHEMA_VERSION:
+                self._drop_mirror(version)
+            self._connection.executescript(_SCHEMA)
+            if self._setting('bucketWidth') != bucket_width:
+                self._set_setting('bucketWidth', bucket_width)
+                self._rebuild_histogram()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._connection.close()
+
+    @property
+    def watermark(self):
+        """
+        ``updatedAt`` of the newest mirrored result, or ``None`` before the first sync.
+
+        :rtype: str or None
+        """
+        with self._lock:
+            return self._setting('watermark')
+
+    @property
+    def step_watermark(self):
+        """
+        ``updatedAt`` of the newest mirrored step, or ``None`` before the first sync.
+
+        :rtype: str or None
+        """
+        with self._lock:
+            return self._setting('stepWatermark')
+
+    def sync(self, page_size=1000):
+        """
+        Fetch the results updated since the last sync and their steps, then the updated steps
+
+        :param page_size: Number of results, or steps, to request per page and
+            to write per transaction.
+        :type page_size: int
+        :return: The number of results that were added or changed, or whose
+            steps were.
+        :rtype: int
+        """
+        watermark = self.watermark
+        step_watermark = self.step_watermark
+        changed_ids = set()
+        results = self._client.iter_results(self._delta_query(watermark), page_size)
+        for page in _pages(results, page_size):
+            rows = [tuple(_value(result, column) for column in _RESULT_COLUMNS)
+                    for result in page]
+            changed_ids.update(self._write_results(rows, watermark))
+        # The first sync mirrors every step with the results
+        if self._step_delta_query is not None and watermark is not None:
+            steps = self._client.iter_steps(self._step_delta_query(step_watermark), page_size)
+            for page in _pages(steps, page_size):
+                rows = [tuple(_value(step, column) for column in _STEP_COLUMNS)
+                        for step in page]
+                changed_ids.update(self._write_steps(rows, step_watermark))
+        LOGGER.debug('Synced %d results', len(changed_ids))
+        return len(changed_ids)
+
+    def pass_fail_counts(self, program_name=None):
+        """
+        Return the number of results per status type.
+
+        :param program_name: The program to count the results of, or ``None`` for all.
+        :type program_name: str or None
+        :return: The count of each status type, such as ``'PASSED'`` or ``'FAILED'``.
+        :rtype: dict(str, int)
+        """
+        if program_name is None:
+            rows = self.query('SELECT statusType, SUM(count) FROM program_status_counts '
+                              'GROUP BY statusType')
+        else:
+            rows = self.query('SELECT statusType, count FROM program_status_counts '
+                              'WHERE programName = ?', (program_name,))
+        return dict((status_type, count) for status_type, count in rows if count)
+
+    def step_failures(self):
+        """
+        Return the failure count per step name, most failed first, for a Pareto chart.
+
+        Steps count as failed when their status type is ``'FAILED'``. Steps of
+        type ``SequenceCall`` are not counted.
+
+        :rtype: list(tuple(str, int))
+        """
+        return self.query('SELECT name, count FROM step_failure_counts WHERE count > 0 '
+                          'ORDER BY count DESC, name')
+
+    def duration_histogram(self, program_name=None):
+        """
+        Return the number of results per duration bucket.
+
+        :param program_name: The program to count the results of, or ``None`` for all.
+        :type program_name: str or None
+        :return: The start, in seconds, of each non-empty bucket and its count.
+        :rtype: list(tuple(float, int))
+        """
+        width = self._setting('bucketWidth')
+        if program_name is None:
+            rows = self.query('SELECT bucket, SUM(count) FROM duration_histogram '
+                              'GROUP BY bucket HAVING SUM(count) > 0 ORDER BY bucket')
+        else:
+            rows = self.query('SELECT bucket, count FROM duration_histogram '
+                              'WHERE programName = ? AND count > 0 ORDER BY bucket',
+                              (program_name,))
+        return [(bucket * width, count) for bucket, count in rows]
+
+    def query(self, sql, parameters=()):
+        """
+        Run a query on the local database.
+
+        :param sql: The SQL statement. The tables are ``results``, ``steps``,
+            ``program_status_counts``, ``step_failure_counts`` and
+            ``duration_histogram``.
+        :type sql: str
+        :param parameters: The parameters of the statement.
+        :type parameters: tuple or dict
+        :rtype: list(tuple)
+        """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _write_results(self, rows, watermark):
+        """
+        Replace the changed results of one page, and their steps, and move the watermark.
+
+        :param rows: The result rows of the page.
+        :type rows: list(tuple)
+        :param watermark: The watermark the sync started from.
+        :type watermark: str or None
+        :return: The ids of the results that were added or changed.
+        :rtype: list(str)
+        """
+        if watermark is not None:
+            rows = [row for row in rows if row[_RESULT_UPDATED_AT] is not None and
+                    row[_RESULT_UPDATED_AT] >= watermark]
+        # Results fetched again at the watermark, or after an interrupted sync
+        stored = self._stored_updated_at('SELECT id, updatedAt FROM results WHERE id IN ({})',
+                                         [row[0] for row in rows])
+        rows = [row for row in rows if stored.get(row[:1], ()) != row[_RESULT_UPDATED_AT]]
+        if not rows:
+            return []
+        result_ids = [row[0] for row in rows]
+        steps, _ = self._client.query_steps_for_results(result_ids)
+        step_rows = [tuple(_value(step, column) for column in _STEP_COLUMNS) for step in steps]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM steps WHERE resultId = ?', ((result_id,) for result_id in result_ids))
+            self._connection.executemany(
+                'DELETE FROM results WHERE id = ?', ((result_id,) for result_id in result_ids))
+            self._connection.executemany(
+                'INSERT INTO results VALUES ({})'.format(', '.join('?' * len(_RESULT_COLUMNS))),
+                rows)
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO steps VALUES ({})'.format(
+                    ', '.join('?' * len(_STEP_COLUMNS))),
+                step_rows)
+            self._advance('watermark', (row[_RESULT_UPDATED_AT] for row in rows))
+            if self._setting('stepWatermark') is None:
+                # Only from the steps of the first page: a step that changes after it
+                # was fetched is then newer than the watermark, whatever page it is in
+                self._advance('stepWatermark', (row[_STEP_UPDATED_AT] for row in step_rows))
+        LOGGER.debug('Wrote %d results and %d steps', len(rows), len(step_rows))
+        return result_ids
+
+    def _write_steps(self, rows, step_watermark):
+        """
+        Replace the changed steps of one page and move the step watermark.
+
+        :param rows: The step rows of the page.
+        :type rows: list(tuple)
+        :param step_watermark: The step watermark the sync started from.
+        :type step_watermark: str or None
+        :return: The ids of the results of the steps that were added or changed.
+        :rtype: set(str)
+        """
+        if step_watermark is not None:
+            rows = [row for row in rows if row[_STEP_UPDATED_AT] is not None and
+                    row[_STEP_UPDATED_AT] >= step_watermark]
+        stored = self._stored_updated_at(
+            'SELECT resultId, stepId, updatedAt FROM steps WHERE stepId IN ({})',
+            [row[1] for row in rows])
+        rows = [row for row in rows if stored.get(row[:2], ()) != row[_STEP_UPDATED_AT]]
+        if not rows:
+            return set()
+        with self._lock, self._connection:
+            # Deleted first, since the triggers do not run for the rows REPLACE deletes
+            self._connection.executemany('DELETE FROM steps WHERE resultId = ? AND stepId = ?',
+                                         (row[:2] for row in rows))
+            self._connection.executemany(
+                'INSERT INTO steps VALUES ({})'.format(', '.join('?' * len(_STEP_COLUMNS))),
+                rows)
+            self._advance('stepWatermark', (row[_STEP_UPDATED_AT] for row in rows))
+        LOGGER.debug('Wrote %d updated steps', len(rows))
+        return set(row[0] for row in rows)
+
+    def _stored_updated_at(self, sql, ids):
+        """
+        Return the ``updatedAt`` of the mirrored rows with one of ``ids``.
+
+        :param sql: The query of the key columns and ``updatedAt`` of the rows,
+            with a ``{}`` placeholder for the parameters of the ``IN`` clause.
+        :type sql: str
+        :param ids: The ids to look for.
+        :type ids: list(str)
+        :return: ``updatedAt`` by the tuple of the key columns.
+        :rtype: dict(tuple, str)
+        """
+        stored = {}
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMETERS):
+                chunk = ids[start:start + _MAX_PARAMETERS]
+                for row in self._connection.execute(
+                        sql.format(', '.join('?' * len(chunk))), chunk):
+                    stored[row[:-1]] = row[-1]
+        return stored
+
+    def _advance(self, key, updated_ats):
+        """
+        Move a watermark forward to the newest of ``updated_ats``.
+
+        A value older than the watermark means the delta query does not return
+        the oldest changes first, and an interrupted sync may then miss changes.
+        """
+        current = self._setting(key)
+        updated_ats = [updated_at for updated_at in updated_ats if updated_at is not None]
+        if not updated_ats:
+            return
+        if current is not None and min(updated_ats) < current:
+            LOGGER.warning('The delta query of %s does not return the oldest changes first',
+                           key)
+        newest = max(updated_ats)
+        if current is None or newest > current:
+            self._set_setting(key, newest)
+
+    def _setting(self, key):
+        row = self._connection.execute('SELECT value FROM settings WHERE key = ?',
+                                       (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_setting(self, key, value):
+        self._connection.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (key, value))
+
+    def _drop_mirror(self, version):
+        """
+        Drop the mirrored tables and the watermarks of another schema version.
+        """
+        if self._setting('watermark') is not None:
+            LOGGER.info('Mirroring the results again for schema version %d (was %s)',
+                        SCHEMA_VERSION, version)
+        for table in _TABLES:
+            self._connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+        self._connection.execute(
+            "DELETE FROM settings WHERE key IN ('watermark', 'stepWatermark', 'bucketWidth')")
+        self._set_setting('schemaVersion', SCHEMA_VERSION)
+
+    def _rebuild_histogram(self):
+        self._connection.execute('DELETE FROM duration_histogram')
+        self._connection.execute(
+            'INSERT INTO duration_histogram '
+            'SELECT programName, CAST(totalTimeInSeconds / value AS INTEGER), COUNT(*) '
+            'FROM results, settings WHERE key = \'bucketWidth\' '
+            'AND totalTimeInSeconds IS NOT NULL '
+            'GROUP BY programName, CAST(totalTimeInSeconds / value AS INTEGER)')
+
+
+def _pages(items, page_size):
+    """
+    Split an iterator into lists of at most ``page_size`` items.
+
+    :rtype: iterator(list)
+    """
+    items = iter(items)
+    while True:
+        page = list(itertools.islice(items, page_size))
+        if not page:
+            return
+        yield page
+
+
+def _value(item, column):
+    """
+    Return a field of a result or step in the form it is stored in the database.
+    """
+    if column == 'statusType':
+        status = getattr(item, 'status', None)
+        # As serialized, such as 'FAILED'
+        return status.to_dict().get('statusType') if status is not None else None
+    value = getattr(item, ''.join('_' + char.lower() if char.isupper() else char
+                                  for char in column), None)
+    if column == 'status':
+        return value.status_name if value is not None else None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
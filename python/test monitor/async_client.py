@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio API to create, update, delete and query Skyline Test Monitor results and steps.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import queue
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncTestMonitorClient():
+    """
+    Class to publicly access the Test Monitor Client from asyncio code, over a pool of clients.
+
+    Every operation is an awaitable that runs a request of a synchronous
+    :class:`TestMonitorClient` on a worker thread. Replies are not
+    correlated on one message service: a message service waits for the
+    reply of one request at a time and is not documented as safe for
+    concurrent publishes. Requests are therefore not pipelined on one
+    connection; concurrency comes from a pool of clients, each used by one
+    request at a time:
+
+    * When this object creates its clients, it creates a pool of
+      ``pool_size`` of them, each with its own message service and broker
+      connection, and up to ``pool_size`` requests are outstanding at the
+      same time. Each client costs one broker connection, so keep the pool
+      small.
+    * When ``client`` is given, the pool holds only that client: the
+      requests are serialized on it and ``pool_size`` is ignored.
+
+    The timeout of a request is passed to the message service, so a request
+    that times out frees its client and worker as soon as it expires. The
+    request is still delivered to the service, so a create, update or delete
+    that timed out may have been applied.
+    """
+    def __init__(self, client=None, pool_size=4, timeout=None, **kwargs):
+        """
+        :param client: An instance of the Test Monitor client to publish requests
+            with or ``None`` to allow this object to create and own a pool of clients.
+        :type client: TestMonitorClient or None
+        :param pool_size: Number of clients, and therefore of broker
+            connections, created when ``client`` is ``None``. This is the
+            maximum number of requests waiting for a reply at the same time;
+            further requests are queued until a reply arrives or a request
+            times out.
+        :type pool_size: int
+        :param timeout: Default timeout, in seconds, for each request or ``None``
+            to use the default of the message service.
+        :type timeout: float or int or None
+        :param kwargs: If ``client`` is ``None``, the keyword arguments used to
+            create each :class:`TestMonitorClient`.
+        """
+        # pylint: disable=import-outside-toplevel
+        from . import TestMonitorClient
+
+        self._closing = False
+        self._own_clients = not client
+        if client:
+            clients = [client]
+        else:
+            kwargs.setdefault('service_name', 'AsyncTestMonitorClient')
+            # Each client owns its connection, so that no connection manager is
+            # used by two threads at the same time
+            kwargs['connection_pool'] = None
+            clients = [TestMonitorClient(**kwargs) for _ in range(pool_size)]
+        self._clients = clients
+        self._idle_clients = queue.Queue()
+        for each_client in clients:
+            self._idle_clients.put(each_client)
+        self._timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(clients),
+            thread_name_prefix='AsyncTestMonitorClient')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """
+        Wait for the requests in flight and close all associated resources
+        without blocking the event loop.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        """
+        Wait for the requests in flight and close all associated resources.
+
+        This blocks until the requests in flight are answered or time out;
+        from a coroutine, await :meth:`aclose` instead.
+        """
+        if self._closing:
+            return
+        self._closing = True
+        self._executor.shutdown(wait=True)
+        if self._own_clients:
+            for client in self._clients:
+                client.close()
+
+    def _run(self, operation, args, kwargs, timeout):
+        """
+        Run one synchronous client operation on an idle client.
+
+        Runs on a worker thread; there are as many workers as clients, so an
+        idle client is always available.
+        """
+        client = self._idle_clients.get()
+        try:
+            with client.request_timeout(timeout):
+                return getattr(client, operation)(*args, **kwargs)
+        finally:
+            self._idle_clients.put(client)
+
+    async def _call(self, operation, args, kwargs):
+        """
+        Run one synchronous client operation on the request pool.
+
+        :param operation: The name of the :class:`TestMonitorClient` method to call.
+        :type operation: str
+        :param args: Positional arguments for ``operation``.
+        :type args: tuple
+        :param kwargs: Keyword arguments for ``operation``. The ``timeout`` key,
+            if present, overrides the default request timeout.
+        :type kwargs: dict
+        :return: The return value of ``operation``.
+        """
+        if self._closing:
+            raise RuntimeError('AsyncTestMonitorClient is closed')
+        timeout = kwargs.pop('timeout', self._timeout)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self._run, operation, args, kwargs, timeout))
+
+    async def create_results(self, results, **kwargs):
+        """
+        Create one or more test results
+
+        See :meth:`TestMonitorClient.create_results`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('create_results', (results,), kwargs)
+
+    async def update_results(self, updates, **kwargs):
+        """
+        Update one or more test results
+
+        See :meth:`TestMonitorClient.update_results`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('update_results', (updates,), kwargs)
+
+    async def delete_results(self, ids, **kwargs):
+        """
+        Delete one or more test results
+
+        See :meth:`TestMonitorClient.delete_results`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('delete_results', (ids,), kwargs)
+
+    async def query_results(self, query=None, **kwargs):
+        """
+        Return results that match query
+
+        See :meth:`TestMonitorClient.query_results`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('query_results', (query,), kwargs)
+
+    async def create_steps(self, steps, **kwargs):
+        """
+        Create one or more step results
+
+        See :meth:`TestMonitorClient.create_steps`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('create_steps', (steps,), kwargs)
+
+    async def update_steps(self, steps, **kwargs):
+        """
+        Update one or more steps
+
+        See :meth:`TestMonitorClient.update_steps`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('update_steps', (steps,), kwargs)
+
+    async def delete_steps(self, steps, **kwargs):
+        """
+        Delete one or more steps
+
+        See :meth:`TestMonitorClient.delete_steps`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('delete_steps', (steps,), kwargs)
+
+    async def query_steps(self, query=None, **kwargs):
+        """
+        Return steps that match query
+
+        See :meth:`TestMonitorClient.query_steps`.
+
+        :param timeout: Timeout, in seconds, for this request.
+        :type timeout: float or int or None
+        """
+        return await self._call('query_steps', (query,), kwargs)
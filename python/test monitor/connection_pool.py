@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in pool of message broker connections shared by several SystemLink clients.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import contextlib
+import logging
+import threading
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class ConnectionPool():
+    """
+    Reference-counted connection managers, one per broker configuration.
+
+    Each client normally creates and owns its own :class:`AmqpConnectionManager`,
+    so a process that uses four services opens four broker connections. Clients
+    that :meth:`acquire` their connection manager from a pool instead share one
+    connection per configuration. Each client still has its own
+    :class:`MessageService`, and therefore its own channel and reply queue,
+    on that connection. The connection is closed when the last client
+    :meth:`release` s it, and reconnects once for all clients.
+
+    Pooling is opt-in: a :class:`systemlink.testmonclient.TestMonitorClient`
+    only shares a connection when it is given a pool as ``connection_pool``,
+    and clients of other packages, such as ``TagClient``, when they are given
+    a message service from :meth:`message_service`. The pool only shares the
+    connection; requests are not multiplexed and replies are still routed
+    by each message service. The connection manager is not documented as
+    safe for concurrent use, so only share a connection between clients that
+    are used from the same thread.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @property
+    def connection_count(self):
+        """
+        Number of open connection managers.
+
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._entries)
+
+    def acquire(self, config=None, connection_timeout=5, auto_reconnect=True):
+        """
+        Return the connection manager of a configuration and add a reference to it.
+
+        :param config: The configuration to connect with, or ``None`` for the
+            default configuration.
+        :type config: systemlink.messagebus.amqp_configuration.AmqpConfiguration or None
+        :param connection_timeout: Timeout, in seconds, to use when trying to
+            connect to the message broker. Only used when the connection
+            manager is created; a warning is logged when it differs from the
+            timeout of the existing connection manager.
+        :type connection_timeout: float or int
+        :param auto_reconnect: Whether the connection manager reconnects when the
+            connection is lost. Only used when the connection manager is created;
+            a warning is logged when it differs from the existing connection manager.
+        :type auto_reconnect: bool
+        :rtype: systemlink.messagebus.amqp_connection_manager.AmqpConnectionManager
+        """
+        # The entry holds a reference to the configuration, so its id is not reused
+        key = None if config is None else id(config)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # pylint: disable=import-error,import-outside-toplevel
+                from systemlink.messagebus.amqp_connection_manager import AmqpConnectionManager
+                connection_manager = AmqpConnectionManager(config=config)
+                connection_manager.connection_timeout = connection_timeout
+                connection_manager.auto_reconnect = auto_reconnect
+                entry = self._entries[key] = [config, connection_manager, 0]
+                LOGGER.debug('Created shared connection manager (%d open)', len(self._entries))
+            elif (entry[1].connection_timeout != connection_timeout or
+                  entry[1].auto_reconnect != auto_reconnect):
+                LOGGER.warning('Sharing a connection manager with connection_timeout=%s and '
+                               'auto_reconnect=%s; the requested connection_timeout=%s and '
+                               'auto_reconnect=%s are ignored',
+                               entry[1].connection_timeout, entry[1].auto_reconnect,
+                               connection_timeout, auto_reconnect)
+            entry[2] += 1
+            return entry[1]
+
+    def release(self, connection_manager):
+        """
+        Remove a reference to a connection manager and close it if it was the last one.
+
+        :param connection_manager: A connection manager returned by :meth:`acquire`.
+        :type connection_manager: AmqpConnectionManager
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry[1] is connection_manager:
+                    entry[2] -= 1
+                    if entry[2] > 0:
+                        return
+                    del self._entries[key]
+                    break
+            else:
+                return
+        connection_manager.close()
+        LOGGER.debug('Closed shared connection manager')
+
+    @contextlib.contextmanager
+    def message_service(self, service_name, config=None, connection_timeout=5,
+                        auto_reconnect=True):
+        """
+        Return a context manager that yields a message service on a shared connection
+
+        The message service can be passed as ``message_service`` to any client,
+        for example ``TagClient(message_service=message_service)``. It is closed
+        and its connection released when the ``with`` block exits.
+
+        :param service_name: The name of the message service.
+        :type service_name: str
+        :rtype: contextlib.AbstractContextManager
+
+        See :meth:`acquire` for the other parameters.
+        """
+        # pylint: disable=import-error,import-outside-toplevel
+        from systemlink.messagebus.message_service import MessageService
+        from systemlink.messagebus.message_service_builder import MessageServiceBuilder
+
+        connection_manager = self.acquire(config, connection_timeout, auto_reconnect)
+        try:
+            message_service_builder = MessageServiceBuilder(service_name)
+            message_service_builder.connection_manager = connection_manager
+            message_service = MessageService(message_service_builder)
+            try:
+                yield message_service
+            finally:
+                message_service.close()
+        finally:
+            self.release(connection_manager)
+
+
+# A pool for the clients of a single-threaded script to opt into
+DEFAULT_POOL = ConnectionPool()
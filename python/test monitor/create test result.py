@@ -1,16 +1,17 @@
 #Imports
 import datetime
+import os
 import socket
-from io import StringIO
+import sys
 
-from systemlink.testmonclient import TestMonitorClient, testmon_messages
-from systemlink.fileingestionclient import FileIngestionClient, fileingestion_messages
+from systemlink.testmonclient import StepRecorder, TestMonitorClient
+
+# The station helpers are in the station directory next to this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'station'))
+import station
 
 # Get Minion ID
-filename = 'C:/ProgramData/National Instruments/salt/conf/minion_id'
-minion_id = ''
-with open(filename) as f:
-    minion_id = f.read()
+minion_id = station.minion_id()
 print (minion_id)
 
 # Create a Test Monitor Client instance
@@ -34,32 +35,14 @@ with TestMonitorClient(service_name='TestMonitorClient') as testmonclient:
     result_response = testmonclient.create_results(results)
     #print (result_response.results[0].to_dict())
 
-    # Create test steps
-    steps = [{
-            'name': 'MainSequence Callback',
-            'stepType': 'SequenceCall',
-            'stepId': '',
-            'parentId': None,
-            'resultId': result_response.results[0].id,
-            'status': {'statusType':'PASSED', 'statusName':'Passed'},
-            'totalTimeInSeconds': 5,
-            'startedAt': datetime.datetime.now().isoformat(),
-            'dataModel': 'TestStand',
-            'data': {
-                "text": None,
-                "parameters": []
-            },
-            'children': [{
-                'name': 'Video Test',
-                'stepType': 'NumericLimit',
-                'stepId': None,
-                'parentId': None,
-                'resultId': result_response.results[0].id,
-                'status': {'statusType':'FAILED', 'statusName':'Failed'},
-                'totalTimeInSeconds': 29.9,
-                'startedAt': datetime.datetime.now().isoformat(),
-                'dataModel': 'TestStand',
-                'data': {
+    # Record test steps while the sequence runs. Steps are sent in batches in the
+    # background, and a step with children is created before its first child.
+    result_id = result_response.results[0].id
+    with StepRecorder(result_id, client=testmonclient) as recorder:
+        with recorder.step('MainSequence Callback', 'SequenceCall'):
+            with recorder.step('Video Test', 'NumericLimit') as step:
+                step['status'] = 'Failed'
+                step['data'] = {
                     "text": None,
                     "parameters": [{
                         "name": "Video Test",
@@ -71,20 +54,9 @@ with TestMonitorClient(service_name='TestMonitorClient') as testmonclient:
                         "highLimit": "10",
                         "comparisonType": "GTLT"
                     }]
-                },
-                'children': None
-            },
-            {
-                'name': 'ROM Test',
-                'stepType': 'PassFailTest',
-                'stepId': None,
-                'parentId': None,
-                'resultId': result_response.results[0].id,
-                'status': {'statusType':'PASSED', 'statusName':'Passed'},
-                'totalTimeInSeconds': 8.7,
-                'startedAt': datetime.datetime.now().isoformat(),
-                'dataModel': 'TestStand',
-                "data": {
+                }
+            with recorder.step('ROM Test', 'PassFailTest') as step:
+                step['data'] = {
                     "text": None,
                     "parameters": [{
                         "name": "ROM Test",
@@ -96,14 +68,7 @@ with TestMonitorClient(service_name='TestMonitorClient') as testmonclient:
                         "highLimit": None,
                         "comparisonType": None
                     }]
-                },
-                'children': None
-            }]
-            }
-            ]
-
-    steps_response = testmonclient.create_steps(steps)
-    #print (steps_response.steps[0].to_dict())
+                }
 
     #Update the result to completed state
     result_update = result_response.results[0].to_dict()
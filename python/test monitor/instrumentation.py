@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Latency, payload and error statistics for Skyline Test Monitor requests.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import bisect
+import contextlib
+import logging
+import threading
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket is unbounded.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phases of a request that are timed separately.
+PHASES = ('serialize', 'round_trip', 'deserialize')
+
+
+class RequestRecord():
+    """
+    Timings and outcome of one request.
+
+    Instances are created by :meth:`RequestMetrics.measure` and passed to the
+    hooks once the request has completed.
+    """
+    def __init__(self, operation):
+        """
+        :param operation: Name of the client method that issued the request.
+        :type operation: str
+        """
+        self.operation = operation
+        self.start_time = time.perf_counter()
+        self.durations = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.timed_out = False
+        self.error = None
+        self._phase_start = self.start_time
+
+    @property
+    def total_time(self):
+        """
+        Time, in seconds, spent in all phases of the request.
+
+        :rtype: float
+        """
+        return sum(self.durations.values())
+
+    def serialized(self):
+        """
+        Mark the end of building the request message.
+        """
+        self._end_phase('serialize')
+
+    def published(self):
+        """
+        Mark the arrival of the reply, or the end of publishing for messages without reply.
+        """
+        self._end_phase('round_trip')
+
+    def deserialized(self):
+        """
+        Mark the end of decoding the reply.
+        """
+        self._end_phase('deserialize')
+
+    def _end_phase(self, phase):
+        now = time.perf_counter()
+        self.durations[phase] = now - self._phase_start
+        self._phase_start = now
+
+
+class OperationStatistics():
+    """
+    Accumulated statistics of one client operation.
+    """
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.timeout_count = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.total_times = dict((phase, 0.0) for phase in PHASES)
+        self.histograms = dict((phase, [0] * (len(LATENCY_BUCKETS) + 1)) for phase in PHASES)
+
+    def add(self, record):
+        """
+        Add one completed request.
+
+        :param record: The completed request.
+        :type record: RequestRecord
+        """
+        self.count += 1
+        if record.timed_out:
+            self.timeout_count += 1
+        elif record.error is not None:
+            self.error_count += 1
+        self.request_bytes += record.request_bytes
+        self.response_bytes += record.response_bytes
+        for phase, duration in record.durations.items():
+            self.total_times[phase] += duration
+            self.histograms[phase][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+    def to_dict(self):
+        """
+        Return the statistics as a dict.
+
+        :rtype: dict
+        """
+        return {
+            'count': self.count,
+            'errorCount': self.error_count,
+            'timeoutCount': self.timeout_count,
+            'requestBytes': self.request_bytes,
+            'responseBytes': self.response_bytes,
+            'totalTimeInSeconds': dict(self.total_times),
+            'histograms': dict((phase, list(counts))
+                               for phase, counts in self.histograms.items()),
+        }
+
+
+class RequestMetrics():
+    """
+    Collect per-operation statistics for every request a client publishes.
+
+    Hooks are called with the :class:`RequestRecord` of each completed
+    request. A span factory, such as ``tracer.start_as_current_span`` of an
+    OpenTelemetry tracer, is entered for the duration of each request.
+
+    The message service serializes requests itself, so the client can only
+    size a request by encoding it a second time. Request sizes are therefore
+    only measured while a hook or span factory is set, see
+    :attr:`measures_request_bytes`.
+    """
+    def __init__(self, span_factory=None):
+        """
+        :param span_factory: A callable that takes a span name and returns a
+            context manager, or ``None`` to not create spans.
+        :type span_factory: callable or None
+        """
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._hooks = []
+        self.span_factory = span_factory
+
+    @property
+    def measures_request_bytes(self):
+        """
+        Whether the size of requests is measured, which is only the case while
+        a hook or span factory is set.
+
+        :rtype: bool
+        """
+        return bool(self._hooks) or self.span_factory is not None
+
+    def add_hook(self, hook):
+        """
+        Call ``hook`` with the :class:`RequestRecord` of each completed request.
+
+        :param hook: The callable to add.
+        :type hook: callable
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Stop calling a hook added with :meth:`add_hook`.
+
+        :param hook: The callable to remove.
+        :type hook: callable
+        """
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def statistics(self):
+        """
+        Return a snapshot of the statistics of every operation.
+
+        :return: The statistics, by operation name, as returned by
+            :meth:`OperationStatistics.to_dict`.
+        :rtype: dict(str, dict)
+        """
+        with self._lock:
+            return dict((operation, statistics.to_dict())
+                        for operation, statistics in self._operations.items())
+
+    def reset(self):
+        """
+        Discard all statistics collected so far.
+        """
+        with self._lock:
+            self._operations = {}
+
+    @contextlib.contextmanager
+    def measure(self, operation):
+        """
+        Measure one request.
+
+        :param operation: Name of the client method that issues the request.
+        :type operation: str
+        :return: A context manager that yields the :class:`RequestRecord` to
+            mark the phases of the request on.
+        """
+        span = self.span_factory(operation) if self.span_factory else None
+        if span is not None:
+            span.__enter__()
+        record = RequestRecord(operation)
+        exc_info = (None, None, None)
+        try:
+            yield record
+        except BaseException as exc:
+            record.error = exc
+            exc_info = (type(exc), exc, exc.__traceback__)
+            raise
+        finally:
+            self._complete(record)
+            if span is not None:
+                span.__exit__(*exc_info)
+
+    def _complete(self, record):
+        with self._lock:
+            statistics = self._operations.get(record.operation)
+            if statistics is None:
+                statistics = self._operations[record.operation] = OperationStatistics()
+            statistics.add(record)
+            hooks = list(self._hooks)
+        for hook in hooks:
+            try:
+                hook(record)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Request metrics hook %r failed', hook)
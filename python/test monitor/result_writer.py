@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered writer that batches Skyline Test Monitor result and step requests.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class ResultWriter():
+    """
+    Queue test result and step creates/updates and publish them in batches.
+
+    A background thread publishes one request per operation type whenever
+    ``batch_size`` items are queued, ``flush_interval`` seconds have elapsed,
+    or :meth:`flush` is called. Repeated updates to the same result or step
+    are merged into a single update. Every queuing method returns a
+    :class:`concurrent.futures.Future` that completes when its batch has
+    been acknowledged by the service.
+    """
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 client=None,
+                 batch_size=100,
+                 flush_interval=1.0,
+                 max_pending=10000,
+                 **kwargs):
+        """
+        :param client: An instance of the Test Monitor client to publish batches
+            with or ``None`` to allow this object to create and own the client.
+        :type client: TestMonitorClient or None
+        :param batch_size: Number of queued items that triggers a flush. Also the
+            maximum number of items sent in one request.
+        :type batch_size: int
+        :param flush_interval: Maximum time, in seconds, an item stays queued.
+        :type flush_interval: float or int
+        :param max_pending: Number of queued items at which the queuing methods
+            block until the background thread has taken the current batch.
+        :type max_pending: int
+        :param kwargs: If ``client`` is ``None``, the keyword arguments used to
+            create the :class:`TestMonitorClient`.
+        """
+        # pylint: disable=import-outside-toplevel
+        from . import TestMonitorClient
+
+        self._own_client = False
+        if client:
+            self._client = client
+        else:
+            kwargs.setdefault('service_name', 'ResultWriter')
+            self._client = TestMonitorClient(**kwargs)
+            self._own_client = True
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+
+        self._condition = threading.Condition()
+        self._closing = False
+        self._pending = 0
+        self._flush_generation = 0
+        self._flushed_generation = 0
+        self._coalesced_count = 0
+        self._request_count = 0
+        self._reset_batch()
+
+        self._thread = threading.Thread(target=self._run, name='ResultWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def coalesced_count(self):
+        """
+        Number of updates that were merged into an already queued update.
+
+        :rtype: int
+        """
+        return self._coalesced_count
+
+    @property
+    def request_count(self):
+        """
+        Number of requests published so far.
+
+        :rtype: int
+        """
+        return self._request_count
+
+    def close(self):
+        """
+        Publish everything that is still queued and close all associated resources.
+        """
+        with self._condition:
+            if self._closing:
+                return
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+        if self._own_client:
+            self._client.close()
+
+    def flush(self):
+        """
+        Block until everything queued before this call has been published.
+        """
+        with self._condition:
+            self._flush_generation += 1
+            generation = self._flush_generation
+            self._condition.notify_all()
+            while self._flushed_generation < generation and self._thread.is_alive():
+                self._condition.wait()
+
+    def create_results(self, results):
+        """
+        Queue one or more test results for creation
+
+        :param results: A list of dicts, as accepted by
+            :meth:`TestMonitorClient.create_results`.
+        :type results: list(dict)
+        :return: A future for the list of created
+            :class:`systemlink.testmonclient.messages.ResultResponse`, in the
+            order of ``results``.
+        :rtype: concurrent.futures.Future
+        """
+        future = concurrent.futures.Future()
+        results = [dict(result) for result in results]
+        with self._condition:
+            self._wait_for_capacity()
+            self._result_creates.append((results, future))
+            self._added(len(results))
+        return future
+
+    def create_steps(self, steps):
+        """
+        Queue one or more steps for creation
+
+        :param steps: A list of dicts, as accepted by
+            :meth:`TestMonitorClient.create_steps`.
+        :type steps: list(dict)
+        :return: A future for the
+            :class:`systemlink.testmonclient.messages.TestMonitorCreateTestStepsResponse`
+            of the request that contained ``steps``.
+        :rtype: concurrent.futures.Future
+        """
+        future = concurrent.futures.Future()
+        steps = [dict(step) for step in steps]
+        with self._condition:
+            self._wait_for_capacity()
+            self._step_creates.append((steps, future))
+            self._added(len(steps))
+        return future
+
+    def update_results(self, updates, replace=False, determine_status_from_steps=False):
+        """
+        Queue one or more test result updates
+
+        Updates for a result id that is already queued with the same options
+        are merged into the queued update; later values win. Unless
+        ``replace`` is ``True``, ``properties`` are merged and ``keywords``
+        and ``fileIds`` are combined, as the service would do for two
+        separate updates. Updates of the same result with different options
+        are sent in the order they were queued.
+
+        :param updates: A list of dicts, as accepted by
+            :meth:`TestMonitorClient.update_results`. Each dict must have an
+            ``id``; otherwise none of them is queued and :class:`ValueError` is raised.
+        :type updates: list(dict)
+        :param replace: See :meth:`TestMonitorClient.update_results`.
+        :type replace: bool
+        :param determine_status_from_steps: See :meth:`TestMonitorClient.update_results`.
+        :type determine_status_from_steps: bool
+        :return: A future for the
+            :class:`systemlink.testmonclient.messages.TestMonitorUpdateTestResultsResponse`
+            of the last request that contained ``updates``.
+        :rtype: concurrent.futures.Future
+        """
+        group_key = (replace, determine_status_from_steps)
+        return self._queue_updates(
+            self._result_updates, group_key, updates, lambda update: update['id'], replace)
+
+    def update_steps(self, steps):
+        """
+        Queue one or more step updates
+
+        Updates for a step that is already queued are merged into the queued
+        update; later values win, except for ``properties``, which are merged.
+
+        :param steps: A list of dicts, as accepted by
+            :meth:`TestMonitorClient.update_steps`. Each dict must have a
+            ``stepId`` and a ``resultId``; otherwise none of them is queued
+            and :class:`ValueError` is raised.
+        :type steps: list(dict)
+        :return: A future for the
+            :class:`systemlink.testmonclient.messages.TestMonitorUpdateTestStepsResponse`
+            of the last request that contained ``steps``.
+        :rtype: concurrent.futures.Future
+        """
+        return self._queue_updates(
+            self._step_updates, None, steps, lambda step: (step['resultId'], step['stepId']),
+            False)
+
+    def _queue_updates(  # pylint: disable=too-many-arguments
+            self, segments, group_key, updates, key_of, replace):
+        """
+        Queue updates in ``segments``, the ordered list of
+        ``[group_key, updates by key, futures]`` batches of one operation.
+
+        An update is merged into the last batch of its group unless an update
+        of the same key with other options was queued after that batch, in
+        which case a new batch is started, so that the updates of one result
+        or step are sent in order.
+        """
+        try:
+            keys = [key_of(update) for update in updates]
+        except KeyError as exc:
+            raise ValueError('Every update must have the {} key'.format(exc))
+        future = concurrent.futures.Future()
+        with self._condition:
+            self._wait_for_capacity()
+            keys_by_segment = collections.OrderedDict()
+            added = 0
+            for update, key in zip(updates, keys):
+                segment = _segment_for(segments, group_key, key)
+                if segment is None:
+                    segment = [group_key, collections.OrderedDict(), []]
+                    segments.append(segment)
+                pending_updates = segment[1]
+                if key in pending_updates:
+                    _merge_update(pending_updates[key], update, replace)
+                    self._coalesced_count += 1
+                else:
+                    pending_updates[key] = dict(update)
+                    added += 1
+                keys_by_segment.setdefault(id(segment), (segment, set()))[1].add(key)
+            # The future completes with the response of the last batch it is in
+            last = max(keys_by_segment.values(), key=lambda entry: segments.index(entry[0]),
+                       default=None)
+            for segment, segment_keys in keys_by_segment.values():
+                segment[2].append((future, segment_keys, segment is last[0]))
+            if last is None:
+                future.set_result(None)
+            self._added(added)
+        return future
+
+    def _wait_for_capacity(self):
+        if self._closing:
+            raise RuntimeError('ResultWriter is closed')
+        while self._pending >= self._max_pending and not self._closing:
+            self._condition.wait()
+        if self._closing:
+            raise RuntimeError('ResultWriter is closed')
+
+    def _added(self, count):
+        self._pending += count
+        if self._pending >= self._batch_size:
+            self._condition.notify_all()
+
+    def _reset_batch(self):
+        self._result_creates = []
+        self._step_creates = []
+        self._result_updates = []
+        self._step_updates = []
+        self._pending = 0
+
+    def _take_batch(self):
+        batch = (self._result_creates, self._step_creates,
+                 self._result_updates, self._step_updates)
+        self._reset_batch()
+        self._condition.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self._flush_interval
+                while (not self._closing and
+                       self._flushed_generation == self._flush_generation and
+                       self._pending < self._batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                generation = self._flush_generation
+                closing = self._closing
+                batch = self._take_batch()
+            self._publish(*batch)
+            with self._condition:
+                self._flushed_generation = generation
+                self._condition.notify_all()
+            if closing:
+                return
+
+    def _publish(self, result_creates, step_creates, result_updates, step_updates):
+        # Creates go first so that updates in the same flush find their targets.
+        for chunk in self._chunks(result_creates):
+            response = self._send(self._client.create_results,
+                                  [result for results, _ in chunk for result in results],
+                                  [future for _, future in chunk])
+            if response is not None:
+                offset = 0
+                for results, future in chunk:
+                    future.set_result(response.results[offset:offset + len(results)])
+                    offset += len(results)
+        for chunk in self._chunks(step_creates):
+            futures = [future for _, future in chunk]
+            response = self._send(self._client.create_steps,
+                                  [step for steps, _ in chunk for step in steps],
+                                  futures)
+            _set_results(futures, response)
+        for (replace, determine_status_from_steps), updates, futures in result_updates:
+            self._send_updates(
+                lambda chunk, replace=replace, determine=determine_status_from_steps:
+                self._client.update_results(chunk, replace, determine),
+                updates, futures)
+        for _, updates, futures in step_updates:
+            self._send_updates(self._client.update_steps, updates, futures)
+
+    def _chunks(self, creates):
+        chunk = []
+        size = 0
+        for items, future in creates:
+            chunk.append((items, future))
+            size += len(items)
+            if size >= self._batch_size:
+                yield chunk
+                chunk = []
+                size = 0
+        if chunk:
+            yield chunk
+
+    def _send_updates(self, operation, updates, futures):
+        """
+        Publish merged updates in chunks and complete each future with the
+        response of the last chunk that carried one of its updates.
+
+        :param updates: The merged updates, by result or step key.
+        :type updates: collections.OrderedDict
+        :param futures: Each queued future, the keys of its updates in this
+            batch and whether this is the last batch that carries its updates.
+            Futures only complete with the last batch, but fail with any batch.
+        :type futures: list(tuple(concurrent.futures.Future, set, bool))
+        """
+        keys = list(updates)
+        chunk_of = {}
+        responses = []
+        for index, start in enumerate(range(0, len(keys), self._batch_size)):
+            chunk_keys = keys[start:start + self._batch_size]
+            waiting = [future for future, future_keys, _ in futures
+                       if not future_keys.isdisjoint(chunk_keys)]
+            responses.append(self._send(operation, [updates[key] for key in chunk_keys],
+                                        waiting))
+            for key in chunk_keys:
+                chunk_of[key] = index
+        for future, future_keys, last in futures:
+            if future.done() or not last:
+                continue
+            future.set_result(responses[max(chunk_of[key] for key in future_keys)])
+
+    def _send(self, operation, items, futures):
+        try:
+            self._request_count += 1
+            return operation(items)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.warning('ResultWriter failed to publish %d items: %s', len(items), exc)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return None
+
+
+def _segment_for(segments, group_key, key):
+    """
+    Return the batch of ``group_key`` an update of ``key`` can be merged into, or ``None``.
+
+    :param segments: The queued batches, oldest first.
+    :type segments: list
+    """
+    candidate = None
+    for segment in reversed(segments):
+        if segment[0] == group_key:
+            if key in segment[1]:
+                return segment
+            if candidate is None:
+                candidate = segment
+        elif key in segment[1]:
+            break
+    return candidate
+
+
+def _merge_update(pending, update, replace):
+    """
+    Merge an update into the update queued for the same result or step.
+
+    :param replace: Whether the updates replace ``properties``, ``keywords``
+        and ``fileIds``. If not, properties are merged and the lists combined.
+    :type replace: bool
+    """
+    for key, value in update.items():
+        if replace or value is None or pending.get(key) is None:
+            pending[key] = value
+        elif key == 'properties' and isinstance(value, dict) and \
+                isinstance(pending[key], dict):
+            pending[key] = dict(pending[key], **value)
+        elif key in ('keywords', 'fileIds'):
+            pending[key] = list(pending[key]) + [item for item in value
+                                                 if item not in pending[key]]
+        else:
+            pending[key] = value
+
+
+def _set_results(futures, response):
+    if response is None:
+        return
+    for future in futures:
+        if not future.done():
+            future.set_result(response)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming recorder of Skyline Test Monitor steps fed with step begin/end events.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import contextlib
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class StepRecorder():
+    """
+    Record the steps of a test result while the sequence runs.
+
+    Each :meth:`begin` is matched by an :meth:`end`; steps that begin before
+    the current step ends are its children. The recorder assigns the step
+    ids and parent links. A step without children is created once, complete,
+    when it ends. A step with children is created with the ``Running``
+    status when its first child begins, so it exists before its children,
+    and is updated with its final status when it ends. Requests go through a
+    :class:`ResultWriter`, so they are sent in bounded batches in the
+    background. Only the currently open steps, and the requests that were
+    not acknowledged yet, are kept in memory, so memory and message size do
+    not grow with the length of the sequence. The errors of the requests
+    that failed are kept and :meth:`close` raises the first one.
+    """
+    def __init__(self, result_id, writer=None, data_model='TestStand', **kwargs):
+        """
+        :param result_id: The id of the test result the steps belong to.
+        :type result_id: str
+        :param writer: The writer to queue the step requests with, or ``None``
+            to allow this object to create and own the writer.
+        :type writer: ResultWriter or None
+        :param data_model: The data model of the steps.
+        :type data_model: str
+        :param kwargs: If ``writer`` is ``None``, the keyword arguments used to
+            create the :class:`ResultWriter`.
+        """
+        # pylint: disable=import-outside-toplevel
+        from . import ResultWriter
+
+        self._result_id = result_id
+        self._data_model = data_model
+        self._own_writer = False
+        if writer:
+            self._writer = writer
+        else:
+            self._writer = ResultWriter(**kwargs)
+            self._own_writer = True
+        self._stack = []
+        self._closing = False
+        self._step_count = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception as exc:  # pylint: disable=broad-except
+            # The exception that ended the block matters more
+            LOGGER.warning('StepRecorder failed to publish the steps of result %s: %s',
+                           self._result_id, exc)
+
+    @property
+    def depth(self):
+        """
+        Number of steps that began and did not end yet.
+
+        :rtype: int
+        """
+        return len(self._stack)
+
+    @property
+    def step_count(self):
+        """
+        Number of steps that ended so far.
+
+        :rtype: int
+        """
+        return self._step_count
+
+    @property
+    def errors(self):
+        """
+        The errors of the step requests that failed so far.
+
+        :rtype: list(Exception)
+        """
+        with self._lock:
+            return list(self._errors)
+
+    def close(self):
+        """
+        End the open steps as ``Terminated``, publish everything and release the writer.
+
+        :raises Exception: The error of the first step request that failed, once
+            everything else is published. :attr:`errors` has all of them.
+        """
+        if self._closing:
+            return
+        while self._stack:
+            self.end('Terminated')
+        self._closing = True
+        if self._own_writer:
+            self._writer.close()
+        else:
+            self._writer.flush()
+        errors = self.errors
+        if errors:
+            LOGGER.warning('StepRecorder failed to publish %d step requests of result %s',
+                           len(errors), self._result_id)
+            raise errors[0]
+
+    def begin(self, name, step_type='', **fields):
+        """
+        Begin a step
+
+        :param name: The name of the step.
+        :type name: str
+        :param step_type: The type of the step, such as ``'NumericLimit'``.
+        :type step_type: str
+        :param fields: Other keys of the step, as accepted by
+            :meth:`TestMonitorClient.create_steps`, for example ``data``.
+        :return: The id of the step.
+        :rtype: str
+        """
+        if self._closing:
+            raise RuntimeError('StepRecorder is closed')
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None and not parent['created']:
+            self._track(self._writer.create_steps([dict(parent['step'], status='Running')]))
+            parent['created'] = True
+        step = {
+            'name': name,
+            'stepType': step_type,
+            'stepId': str(uuid.uuid4()),
+            'parentId': parent['step']['stepId'] if parent is not None else None,
+            'resultId': self._result_id,
+            'startedAt': datetime.datetime.now().isoformat(),
+            'dataModel': self._data_model,
+            'data': {'text': None, 'parameters': []},
+        }
+        step.update(fields)
+        self._stack.append({'step': step, 'created': False, 'start': time.monotonic()})
+        return step['stepId']
+
+    def end(self, status='Passed', **fields):
+        """
+        End the step that began last
+
+        :param status: The status name of the step, such as ``'Passed'`` or ``'Failed'``.
+        :type status: str
+        :param fields: Keys of the step to set or replace, for example ``data``
+            with the measurements of the step. ``totalTimeInSeconds`` defaults
+            to the time since :meth:`begin`.
+        :return: The id of the step.
+        :rtype: str
+        """
+        if not self._stack:
+            raise RuntimeError('No step to end')
+        entry = self._stack.pop()
+        step = entry['step']
+        step.update(fields, status=status)
+        step.setdefault('totalTimeInSeconds', time.monotonic() - entry['start'])
+        if entry['created']:
+            self._track(self._writer.update_steps([step]))
+        else:
+            self._track(self._writer.create_steps([step]))
+        self._step_count += 1
+        return step['stepId']
+
+    @contextlib.contextmanager
+    def step(self, name, step_type='', **fields):
+        """
+        Return a context manager that records a step around the ``with`` block
+
+        The block receives a dict it can set the ``status`` and other keys of
+        the step in. The status defaults to ``'Passed'``, or to ``'Errored'``
+        if the block raises an exception::
+
+            with recorder.step('Video Test', 'NumericLimit') as step:
+                step['status'] = 'Failed'
+                step['data'] = {'text': None, 'parameters': [measurement]}
+
+        :rtype: contextlib.AbstractContextManager
+
+        See :meth:`begin` for the parameters.
+        """
+        self.begin(name, step_type, **fields)
+        outcome = {}
+        try:
+            yield outcome
+        except BaseException:
+            outcome.setdefault('status', 'Errored')
+            self.end(**outcome)
+            raise
+        self.end(**outcome)
+
+    def _track(self, future):
+        """
+        Keep a queued request until it is acknowledged, and its error if it fails.
+
+        :param future: The future returned by the writer.
+        :type future: concurrent.futures.Future
+        """
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the behavior tests of the Test Monitor client helpers.
+
+The helpers are loaded from ``python/test monitor`` as the ``testmonclient``
+package and driven by in-memory clients, so most tests run without the
+SystemLink SDK or a message broker. Tests that publish real request
+messages, through the :class:`FakeMessageService` of ``python/benchmarks``,
+need the SDK and are skipped without it.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+# Import third party libs
+import pytest
+
+_PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PACKAGE_DIR = os.path.join(_PYTHON_DIR, 'test monitor')
+
+
+def _load_package():
+    """
+    Import ``python/test monitor`` as the ``testmonclient`` package.
+    """
+    spec = importlib.util.spec_from_file_location(
+        'testmonclient', os.path.join(_PACKAGE_DIR, '__init__.py'),
+        submodule_search_locations=[_PACKAGE_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['testmonclient'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_module(directory, name):
+    """
+    Import a module of one of the example directories of ``python``, such as ``tag``.
+
+    :param directory: The directory of the module, relative to ``python``.
+    :type directory: str
+    :param name: The name of the module.
+    :type name: str
+    """
+    path = os.path.join(_PYTHON_DIR, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(name)
+
+
+class FakeClient():
+    """
+    In-memory stand-in for :class:`TestMonitorClient`.
+
+    Every call is recorded as ``(operation, items)`` in :attr:`calls`. A
+    request whose ``delay`` is longer than the timeout set with
+    :meth:`request_timeout` waits for the timeout and raises
+    :class:`TimeoutError`, as the client does when no reply arrives.
+    """
+    def __init__(self, delay=0.0, fail=None):
+        """
+        :param delay: Time, in seconds, each request takes.
+        :type delay: float
+        :param fail: Callable that takes the operation and its items and
+            returns whether the request fails, or ``None``.
+        :type fail: callable or None
+        """
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.results = []
+        self.steps = []
+        self.closed = False
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+        self._options = threading.local()
+        self._next_id = 0
+
+    def close(self):
+        self.closed = True
+
+    @contextlib.contextmanager
+    def request_timeout(self, timeout):
+        previous = getattr(self._options, 'timeout', None)
+        self._options.timeout = timeout
+        try:
+            yield
+        finally:
+            self._options.timeout = previous
+
+    def create_results(self, results):
+        self._request('create_results', results)
+        with self._lock:
+            created = []
+            for result in results:
+                self._next_id += 1
+                created.append(dict(result, id='result{}'.format(self._next_id)))
+        return types.SimpleNamespace(results=created)
+
+    def create_steps(self, steps):
+        self._request('create_steps', steps)
+        return types.SimpleNamespace(steps=list(steps))
+
+    def update_results(self, updates, replace=False, determine_status_from_steps=False):
+        self._request('update_results', updates, replace=replace,
+                      determine_status_from_steps=determine_status_from_steps)
+        return types.SimpleNamespace(results=list(updates))
+
+    def update_steps(self, steps):
+        self._request('update_steps', steps)
+        return types.SimpleNamespace(steps=list(steps))
+
+    def query_results(self, query=None, skip=0, take=-1):
+        self._request('query_results', [query])
+        return types.SimpleNamespace(results=[], total_count=0)
+
+    def iter_results(self, query, page_size):  # pylint: disable=unused-argument
+        """
+        Yield the results whose ``updated_at`` is at or after ``query``.
+        """
+        self._request('iter_results', [query])
+        return [result for result in list(self.results)
+                if query is None or result.updated_at >= query]
+
+    def iter_steps(self, query, page_size):  # pylint: disable=unused-argument
+        """
+        Yield the steps whose ``updated_at`` is at or after ``query``.
+        """
+        self._request('iter_steps', [query])
+        return [step for step in list(self.steps)
+                if query is None or step.updated_at >= query]
+
+    def query_steps_for_results(self, result_ids):
+        self._request('query_steps_for_results', result_ids)
+        result_ids = set(result_ids)
+        steps = [step for step in self.steps if step.result_id in result_ids]
+        return steps, len(steps)
+
+    def _request(self, operation, items, **options):
+        timeout = getattr(self._options, 'timeout', None)
+        with self._lock:
+            self.calls.append((operation, list(items), options))
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            if timeout is not None and self.delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError('{} timed out'.format(operation))
+            time.sleep(self.delay)
+            if self.fail is not None and self.fail(operation, items):
+                raise RuntimeError('{} failed'.format(operation))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def operations(self):
+        """
+        Return the operations called so far, in order.
+
+        :rtype: list(str)
+        """
+        with self._lock:
+            return [operation for operation, _, _ in self.calls]
+
+
+class ProbeMessageService():
+    """
+    Wrap a message service and record the timeout and concurrency of its publishes.
+    """
+    def __init__(self, message_service, delay=0.0):
+        """
+        :param message_service: The message service that answers the requests.
+        :param delay: Time, in seconds, added to each request.
+        :type delay: float
+        """
+        self.message_service = message_service
+        self.delay = delay
+        self.timeouts = []
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.message_service.close()
+
+    def publish_synchronous_message(self, message, timeout=None):
+        with self._lock:
+            self.timeouts.append(timeout)
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return self.message_service.publish_synchronous_message(message, timeout)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def publish_routed_message(self, message):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            time.sleep(self.delay)
+            self.message_service.publish_routed_message(message)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class RecordingMessageService():
+    """
+    Message service that records the name and JSON body of the requests it answers.
+
+    ``answer`` takes the message name and body and returns ``'ok'``,
+    ``'rejected'``, ``'timeout'`` or ``'crash'``, which raises.
+    """
+    def __init__(self, answer=None, delay=0.0):
+        self.answer = answer or (lambda name, body: 'ok')
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+
+    def publish_synchronous_message(self, message):
+        name = message.header.message_name
+        body = json.loads(message.body)
+        with self._lock:
+            self.requests.append((name, body))
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            time.sleep(self.delay)
+            answer = self.answer(name, body)
+        finally:
+            with self._lock:
+                self.active -= 1
+        if answer == 'crash':
+            raise RuntimeError('connection lost')
+        if answer == 'timeout':
+            return None
+        return types.SimpleNamespace(has_error=lambda: answer == 'rejected', error=answer)
+
+    def names(self):
+        return [name for name, _ in self.requests]
+
+
+@pytest.fixture(scope='session')
+def testmonclient():
+    """
+    The ``testmonclient`` package of this tree.
+    """
+    return sys.modules.get('testmonclient') or _load_package()
+
+
+@pytest.fixture
+def client():
+    """
+    An in-memory client that answers immediately.
+    """
+    return FakeClient()
+
+
+@pytest.fixture
+def messages(testmonclient, monkeypatch):
+    """
+    The message classes of the SDK, as the ``messages`` submodule of ``testmonclient``.
+
+    Tests that build real requests are skipped when the SDK is not installed.
+    """
+    sdk_messages = pytest.importorskip('systemlink.testmonclient.messages')
+    monkeypatch.setitem(sys.modules, 'testmonclient.messages', sdk_messages)
+    # pylint: disable=protected-access
+    monkeypatch.setattr(testmonclient.testmon_messages, '_module', sdk_messages)
+    return sdk_messages
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    """
+    The in-process message service of ``python/benchmarks``.
+    """
+    pytest.importorskip('systemlink.messagebus.generic_message')
+    monkeypatch.syspath_prepend(os.path.join(_PYTHON_DIR, 'benchmarks'))
+    # pylint: disable=import-error,import-outside-toplevel
+    from fake_message_service import FakeMessageService
+    return FakeMessageService()
+
+
+@pytest.fixture
+def probe(fake_service):
+    """
+    ``fake_service`` wrapped in a :class:`ProbeMessageService`.
+    """
+    return ProbeMessageService(fake_service)
+
+
+@pytest.fixture
+def sdk_client(testmonclient, messages, probe):  # pylint: disable=unused-argument
+    """
+    A :class:`TestMonitorClient` that publishes on ``probe``.
+    """
+    with testmonclient.TestMonitorClient(message_service=probe) as test_monitor_client:
+        yield test_monitor_client
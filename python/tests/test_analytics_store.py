@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the delta sync and incremental aggregates of AnalyticsStore.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import sqlite3
+import types
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import FakeClient
+
+
+class Status():
+    """
+    Stand-in for :class:`systemlink.testmonclient.messages.Status`.
+    """
+    def __init__(self, status_name, status_type=None):
+        self.status_name = status_name
+        self.status_type = status_type or status_name.upper()
+
+    def to_dict(self):
+        return {'statusType': self.status_type, 'statusName': self.status_name}
+
+
+def result(result_id, updated_at, status='Passed',  # pylint: disable=too-many-arguments
+           program_name='Program', total_time=0.5, status_type=None):
+    """
+    Return a result as decoded by the client.
+    """
+    return types.SimpleNamespace(
+        id=result_id, status=Status(status, status_type), started_at=None,
+        updated_at=updated_at, program_name=program_name, system_id=None, operator=None,
+        serial_number=None, total_time_in_seconds=total_time)
+
+
+def step(result_id, step_id, name, status='Passed',  # pylint: disable=too-many-arguments
+         step_type='NumericLimit', updated_at='2020-01-01T00:00:00', status_type=None):
+    """
+    Return a step as decoded by the client.
+    """
+    return types.SimpleNamespace(
+        result_id=result_id, step_id=step_id, parent_id=None, name=name, step_type=step_type,
+        status=Status(status, status_type), started_at=None, updated_at=updated_at,
+        total_time_in_seconds=0.1)
+
+
+@pytest.fixture
+def store(testmonclient, client, tmp_path):
+    """
+    A store mirroring ``client``, whose delta query is the watermark itself.
+    """
+    with testmonclient.AnalyticsStore(str(tmp_path / 'analytics.db'), client,
+                                      lambda watermark: watermark) as analytics_store:
+        yield analytics_store
+
+
+@pytest.fixture
+def step_store(testmonclient, client, tmp_path):
+    """
+    A store that also mirrors the steps updated on their own.
+    """
+    with testmonclient.AnalyticsStore(str(tmp_path / 'analytics.db'), client,
+                                      lambda watermark: watermark,
+                                      step_delta_query=lambda watermark: watermark) as store:
+        yield store
+
+
+def test_first_sync_mirrors_everything(store, client):
+    client.results = [result('1', '2020-01-01T00:00:01', 'Passed', total_time=0.5),
+                      result('2', '2020-01-01T00:00:02', 'Failed', total_time=2.5)]
+    client.steps = [step('2', 's1', 'Video Test', 'Failed'),
+                    step('2', 's2', 'MainSequence', 'Failed', 'SequenceCall')]
+
+    assert store.sync() == 2
+    assert store.watermark == '2020-01-01T00:00:02'
+    assert store.pass_fail_counts() == {'PASSED': 1, 'FAILED': 1}
+    assert store.step_failures() == [('Video Test', 1)]
+    assert store.duration_histogram() == [(0.0, 1), (2.0, 1)]
+
+
+def test_sync_picks_up_results_at_the_watermark_and_skips_unchanged_ones(store, client):
+    client.results = [result('1', '2020-01-01T00:00:01'), result('2', '2020-01-01T00:00:02')]
+    store.sync()
+    client.calls = []
+
+    # Result 3 shares its updatedAt with the newest mirrored result
+    client.results.append(result('3', '2020-01-01T00:00:02', 'Failed'))
+
+    assert store.sync() == 1
+    assert client.calls[0] == ('iter_results', ['2020-01-01T00:00:02'], {})
+    assert client.calls[1][1] == ['3']
+    assert store.pass_fail_counts() == {'PASSED': 2, 'FAILED': 1}
+    assert store.sync() == 0
+
+
+def test_changed_result_replaces_its_row_and_steps(store, client):
+    client.results = [result('1', '2020-01-01T00:00:01', 'Failed')]
+    client.steps = [step('1', 's1', 'Video Test', 'Failed')]
+    store.sync()
+
+    client.results = [result('1', '2020-01-01T00:00:05', 'Passed')]
+    client.steps = [step('1', 's1', 'Video Test', 'Passed')]
+
+    assert store.sync() == 1
+    assert store.watermark == '2020-01-01T00:00:05'
+    assert store.pass_fail_counts() == {'PASSED': 1}
+    assert store.step_failures() == []
+    assert store.query('SELECT COUNT(*) FROM results') == [(1,)]
+
+
+def test_aggregates_use_the_status_type_not_the_status_name(store, client):
+    client.results = [result('1', '2020-01-01T00:00:01', 'Out of tolerance', status_type='FAILED'),
+                      result('2', '2020-01-01T00:00:02', 'Failed', status_type='ERRORED')]
+    client.steps = [step('1', 's1', 'Video Test', 'Out of tolerance', status_type='FAILED'),
+                    step('2', 's2', 'ROM Test', 'Failed', status_type='ERRORED')]
+    store.sync()
+
+    assert store.pass_fail_counts() == {'FAILED': 1, 'ERRORED': 1}
+    assert store.step_failures() == [('Video Test', 1)]
+    assert store.query('SELECT status FROM results WHERE id = ?', ('1',)) == [
+        ('Out of tolerance',)]
+
+
+def test_each_page_is_committed_with_the_watermark(testmonclient, tmp_path):
+    client = FakeClient(fail=lambda operation, ids: operation == 'query_steps_for_results' and
+                        ids == ['3'])
+    client.results = [result(str(index), '2020-01-01T00:00:0{}'.format(index))
+                      for index in range(1, 4)]
+    path = str(tmp_path / 'analytics.db')
+    with testmonclient.AnalyticsStore(path, client, lambda watermark: watermark) as store:
+        with pytest.raises(RuntimeError):
+            store.sync(page_size=1)
+        assert store.watermark == '2020-01-01T00:00:02'
+        assert store.query('SELECT id FROM results ORDER BY id') == [('1',), ('2',)]
+
+        client.fail = None
+        client.calls = []
+        assert store.sync(page_size=1) == 1
+        assert client.calls[-1][1] == ['3']
+        assert store.watermark == '2020-01-01T00:00:03'
+
+
+def test_steps_updated_on_their_own_are_mirrored(step_store, client):
+    client.results = [result('1', '2020-01-01T00:00:01')]
+    client.steps = [step('1', 's1', 'Video Test', updated_at='2020-01-01T00:00:01'),
+                    step('1', 's2', 'ROM Test', updated_at='2020-01-01T00:00:01')]
+    assert step_store.sync() == 1
+    assert step_store.step_watermark == '2020-01-01T00:00:01'
+    assert step_store.sync() == 0
+
+    client.steps[1] = step('1', 's2', 'ROM Test', 'Failed', updated_at='2020-01-01T00:00:09')
+
+    assert step_store.sync() == 1
+    assert step_store.step_watermark == '2020-01-01T00:00:09'
+    assert step_store.step_failures() == [('ROM Test', 1)]
+    assert step_store.query('SELECT COUNT(*) FROM steps') == [(2,)]
+    assert step_store.sync() == 0
+
+
+def test_database_of_an_older_schema_is_mirrored_again(testmonclient, client, tmp_path):
+    path = str(tmp_path / 'analytics.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(
+            'CREATE TABLE settings (key TEXT PRIMARY KEY, value);'
+            "INSERT INTO settings VALUES ('watermark', '2020-01-01T00:00:09');"
+            'CREATE TABLE results (id TEXT PRIMARY KEY, status TEXT, updatedAt TEXT);'
+            "INSERT INTO results VALUES ('1', 'Failed', '2020-01-01T00:00:09');"
+            'CREATE TABLE program_status_counts (programName TEXT, status TEXT, count INTEGER);'
+            "INSERT INTO program_status_counts VALUES ('Program', 'Failed', 1);")
+    connection.close()
+    client.results = [result('1', '2020-01-01T00:00:09', 'Failed')]
+
+    with testmonclient.AnalyticsStore(path, client, lambda watermark: watermark) as store:
+        assert store.watermark is None
+        assert store.pass_fail_counts() == {}
+        assert store.sync() == 1
+        assert store.pass_fail_counts() == {'FAILED': 1}
+
+    with testmonclient.AnalyticsStore(path, client, lambda watermark: watermark) as store:
+        assert store.watermark == '2020-01-01T00:00:09'
+        assert store.pass_fail_counts() == {'FAILED': 1}
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the timeouts and concurrency of AsyncTestMonitorClient.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import asyncio
+import time
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import FakeClient
+
+
+def test_timed_out_request_frees_the_client(testmonclient):
+    client = FakeClient(delay=5)
+
+    async def run():
+        async with testmonclient.AsyncTestMonitorClient(client, timeout=0.05) as async_client:
+            start = time.monotonic()
+            with pytest.raises(TimeoutError):
+                await async_client.query_results()
+            client.delay = 0
+            await async_client.query_results()
+            return time.monotonic() - start
+
+    assert asyncio.run(run()) < 2
+    assert client.operations() == ['query_results', 'query_results']
+
+
+def test_timeout_argument_overrides_the_default(testmonclient):
+    client = FakeClient(delay=0.2)
+
+    async def run():
+        async with testmonclient.AsyncTestMonitorClient(client, timeout=0.01) as async_client:
+            return await async_client.create_results([{'programName': 'a'}], timeout=None)
+
+    response = asyncio.run(run())
+    assert [result['programName'] for result in response.results] == ['a']
+
+
+def test_given_client_serves_one_request_at_a_time(testmonclient):
+    client = FakeClient(delay=0.02)
+
+    async def run():
+        async with testmonclient.AsyncTestMonitorClient(client, pool_size=4) as async_client:
+            await asyncio.gather(*[async_client.query_results() for _ in range(6)])
+
+    asyncio.run(run())
+    assert client.peak_active == 1
+    assert not client.closed
+
+
+def test_owned_pool_runs_pool_size_requests_at_a_time(testmonclient, monkeypatch):
+    created = []
+
+    def create_client(**kwargs):
+        assert kwargs['connection_pool'] is None
+        created.append(FakeClient(delay=0.1))
+        return created[-1]
+
+    monkeypatch.setattr(testmonclient, 'TestMonitorClient', create_client)
+
+    async def run():
+        async with testmonclient.AsyncTestMonitorClient(pool_size=3) as async_client:
+            start = time.monotonic()
+            await asyncio.gather(*[async_client.query_results() for _ in range(6)])
+            return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert len(created) == 3
+    assert all(client.peak_active == 1 for client in created)
+    assert sum(len(client.calls) for client in created) == 6
+    assert all(client.closed for client in created)
+    assert elapsed < 0.55
+
+
+def test_calls_after_close_are_rejected(testmonclient, client):
+    async def run():
+        async_client = testmonclient.AsyncTestMonitorClient(client)
+        await async_client.aclose()
+        with pytest.raises(RuntimeError):
+            await async_client.query_results()
+
+    asyncio.run(run())
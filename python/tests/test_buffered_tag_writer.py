@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the reduction, flush and retry behavior of BufferedTagWriter.
+"""
+from __future__ import absolute_import
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+
+class FakeTagClient():
+    """
+    Records the tags of each ``update_tags`` call, failing while ``fail`` is set.
+    """
+    def __init__(self):
+        self.updates = []
+        self.fail = False
+
+    def update_tags(self, tags):
+        if self.fail:
+            raise RuntimeError('update_tags failed')
+        self.updates.append({tag['path']: tag['value'] for tag in tags})
+
+
+@pytest.fixture
+def buffered_tag_writer():
+    return load_module('tag', 'buffered_tag_writer')
+
+
+@pytest.fixture
+def tag_client():
+    return FakeTagClient()
+
+
+def writer_for(buffered_tag_writer, tag_client, **kwargs):
+    return buffered_tag_writer.BufferedTagWriter(tag_client, flush_interval=60, **kwargs)
+
+
+@pytest.mark.parametrize('reduce, expected',
+                         [('last', 4), ('mean', 2.125), ('min', 0.5), ('max', 4)])
+def test_values_of_one_path_are_reduced(buffered_tag_writer, tag_client, reduce, expected):
+    with writer_for(buffered_tag_writer, tag_client, reduce=reduce) as writer:
+        for value in (1, 3, 0.5, 4):
+            writer.update_tag('a', 'DOUBLE', value)
+        writer.update_tag('s', 'STRING', 'x')
+        writer.update_tag('s', 'STRING', 'y')
+        writer.flush()
+
+        assert tag_client.updates == [{'a': expected, 's': 'y'}]
+        assert writer.statistics()['coalesced'] == 4
+
+
+def test_failed_flush_is_retried_with_newer_values_winning(buffered_tag_writer, tag_client):
+    with writer_for(buffered_tag_writer, tag_client) as writer:
+        writer.update_tags([{'path': 'a', 'type': 'STRING', 'value': 'old'},
+                            {'path': 'b', 'type': 'STRING', 'value': 'kept'}])
+        tag_client.fail = True
+        writer.flush()
+        writer.update_tag('a', 'STRING', 'new')
+        tag_client.fail = False
+        writer.flush()
+
+        assert tag_client.updates == [{'a': 'new', 'b': 'kept'}]
+        assert writer.statistics()['dropped'] == 0
+
+
+def test_failed_values_are_aggregated_with_newer_ones(buffered_tag_writer, tag_client):
+    with writer_for(buffered_tag_writer, tag_client, reduce='mean') as writer:
+        writer.update_tag('a', 'DOUBLE', 1)
+        tag_client.fail = True
+        writer.flush()
+        writer.update_tag('a', 'DOUBLE', 3)
+        tag_client.fail = False
+        writer.flush()
+
+    assert tag_client.updates == [{'a': 2}]
+
+
+def test_values_are_dropped_after_max_attempts(buffered_tag_writer, tag_client):
+    tag_client.fail = True
+    with writer_for(buffered_tag_writer, tag_client, max_attempts=2) as writer:
+        writer.update_tag('a', 'INT', 1)
+        writer.update_tag('a', 'INT', 2)
+        writer.flush()
+        assert writer.statistics()['dropped'] == 0
+        writer.flush()
+        assert writer.statistics()['dropped'] == 2
+        tag_client.fail = False
+        writer.flush()
+
+    assert tag_client.updates == []
+
+
+def test_close_drops_the_values_it_cannot_publish(buffered_tag_writer, tag_client):
+    tag_client.fail = True
+    writer = writer_for(buffered_tag_writer, tag_client)
+    writer.update_tag('a', 'INT', 1)
+    writer.close()
+
+    assert writer.statistics()['dropped'] == 1
+    with pytest.raises(RuntimeError):
+        writer.update_tag('a', 'INT', 2)
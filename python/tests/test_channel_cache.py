@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the eviction, versioning and file handling of ChannelCache.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import os
+import time
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def channel_cache():
+    pytest.importorskip('systemlink.fileingestionclient.messages')
+    pytest.importorskip('systemlink.tdmsreaderclient.messages')
+    return load_module('tdms', 'channel_cache')
+
+
+def array_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.npy'))
+
+
+def test_cached_channels_are_mapped_read_only_and_persisted(channel_cache, tmp_path):
+    cache = channel_cache.ChannelCache(str(tmp_path))
+    cache.put('file', 'group', 'channel', 'window', np.arange(4.0), version='1')
+
+    data = channel_cache.ChannelCache(str(tmp_path)).get('file', 'group', 'channel', 'window')
+
+    np.testing.assert_array_equal(data, [0.0, 1.0, 2.0, 3.0])
+    assert isinstance(data, np.memmap)
+    assert not data.flags.writeable
+
+
+def test_entries_of_another_version_are_removed(channel_cache, tmp_path):
+    cache = channel_cache.ChannelCache(str(tmp_path))
+    cache.put('file', 'group', 'channel', 'window', np.arange(4.0), version='1')
+
+    assert cache.get('file', 'group', 'channel', 'window', version='2') is None
+    assert cache.size == 0
+    assert array_files(str(tmp_path)) == []
+
+
+def test_least_recently_used_entries_are_evicted(channel_cache, tmp_path):
+    cache = channel_cache.ChannelCache(str(tmp_path), max_bytes=2 * 8 * 4)
+    for name in ('a', 'b'):
+        cache.put('file', 'group', name, 'window', np.zeros(4))
+        time.sleep(0.01)
+    cache.get('file', 'group', 'a', 'window')
+    time.sleep(0.01)
+    cache.put('file', 'group', 'c', 'window', np.zeros(4))
+
+    assert cache.get('file', 'group', 'b', 'window') is None
+    assert cache.get('file', 'group', 'a', 'window') is not None
+    assert cache.get('file', 'group', 'c', 'window') is not None
+    assert cache.size == 2 * 8 * 4
+    assert len(array_files(str(tmp_path))) == 2
+
+
+def test_replaced_array_that_cannot_be_deleted_is_swept_on_open(channel_cache, tmp_path,
+                                                                monkeypatch):
+    directory = str(tmp_path)
+    cache = channel_cache.ChannelCache(directory)
+    cache.put('file', 'group', 'channel', 'window', np.zeros(4))
+    mapped = cache.get('file', 'group', 'channel', 'window')
+    (old_file,) = array_files(directory)
+
+    def remove_mapped(path):
+        # As on Windows, a mapped file cannot be deleted
+        raise PermissionError(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(channel_cache.os, 'remove', remove_mapped)
+        cache.put('file', 'group', 'channel', 'window', np.ones(4))
+
+    np.testing.assert_array_equal(mapped, np.zeros(4))
+    assert len(array_files(directory)) == 2
+    del mapped
+
+    reopened = channel_cache.ChannelCache(directory)
+
+    assert old_file not in array_files(directory)
+    assert len(array_files(directory)) == 1
+    np.testing.assert_array_equal(reopened.get('file', 'group', 'channel', 'window'), np.ones(4))
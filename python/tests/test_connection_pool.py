@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the reference counting of ConnectionPool.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import sys
+import types
+
+# Import third party libs
+import pytest
+
+
+class FakeConnectionManager():
+    def __init__(self, config=None):
+        self.config = config
+        self.connection_timeout = None
+        self.auto_reconnect = None
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMessageService():
+    def __init__(self, builder):
+        self.connection_manager = builder.connection_manager
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMessageServiceBuilder():
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.connection_manager = None
+
+
+@pytest.fixture
+def messagebus(monkeypatch):
+    """
+    Replace the message bus modules the pool and the client import.
+    """
+    for name, attribute, value in (
+            ('amqp_connection_manager', 'AmqpConnectionManager', FakeConnectionManager),
+            ('message_service', 'MessageService', FakeMessageService),
+            ('message_service_builder', 'MessageServiceBuilder', FakeMessageServiceBuilder)):
+        module = types.ModuleType('systemlink.messagebus.' + name)
+        setattr(module, attribute, value)
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+
+
+@pytest.fixture
+def pool(testmonclient, messagebus):  # pylint: disable=unused-argument
+    return testmonclient.ConnectionPool()
+
+
+def test_acquire_shares_one_connection_per_configuration(pool):
+    config = object()
+
+    first = pool.acquire()
+    second = pool.acquire()
+    other = pool.acquire(config)
+
+    assert first is second
+    assert other is not first
+    assert other.config is config
+    assert pool.connection_count == 2
+
+
+def test_connection_is_closed_by_the_last_release(pool):
+    first = pool.acquire()
+    pool.acquire()
+
+    pool.release(first)
+    assert not first.closed
+    assert pool.connection_count == 1
+
+    pool.release(first)
+    assert first.closed
+    assert pool.connection_count == 0
+    assert pool.acquire() is not first
+
+
+def test_release_of_an_unknown_connection_is_ignored(pool):
+    shared = pool.acquire()
+    unknown = FakeConnectionManager()
+
+    pool.release(unknown)
+
+    assert not unknown.closed
+    assert pool.connection_count == 1
+    assert not shared.closed
+
+
+def test_message_service_releases_its_connection(pool):
+    with pool.message_service('First') as first:
+        with pool.message_service('Second') as second:
+            assert first.connection_manager is second.connection_manager
+        assert second.closed
+        assert not first.connection_manager.closed
+    assert first.closed
+    assert first.connection_manager.closed
+    assert pool.connection_count == 0
+
+
+def test_clients_own_their_connection_unless_given_a_pool(testmonclient, pool):
+    default_pool = sys.modules['testmonclient.connection_pool'].DEFAULT_POOL
+    first = testmonclient.TestMonitorClient()
+    second = testmonclient.TestMonitorClient()
+    assert first._connection_manager is not second._connection_manager
+    assert default_pool.connection_count == 0
+
+    pooled = [testmonclient.TestMonitorClient(connection_pool=pool) for _ in range(2)]
+    connection_manager = pooled[0]._connection_manager
+    assert pooled[1]._connection_manager is connection_manager
+
+    for client in [first, second] + pooled:
+        client.close()
+    assert first._connection_manager.closed
+    assert connection_manager.closed
+    assert pool.connection_count == 0
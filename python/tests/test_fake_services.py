@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the locking and concurrency counters of the benchmark fake services.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import datetime
+import json
+import threading
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+
+def request(name, body):
+    # pylint: disable=import-error,import-outside-toplevel
+    from systemlink.messagebus.generic_message import GenericMessage
+    from systemlink.messagebus.message_header import MessageHeader
+    return GenericMessage(header=MessageHeader(message_name=name), body=json.dumps(body))
+
+
+@pytest.fixture
+def http_service():
+    pytest.importorskip('requests')
+    service = load_module('benchmarks', 'fake_http_service').FakeHttpService()
+    yield service
+    service.close()
+
+
+def test_requests_wait_out_their_latency_at_the_same_time(fake_service):
+    fake_service.latency = 0.05
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(
+            lambda _: fake_service.publish_synchronous_message(
+                request('TestMonitorQueryResultsRequest', {})), range(4)))
+
+    assert fake_service.request_count == 4
+    assert fake_service.peak_active_count == 4
+    assert fake_service.active_count == 0
+
+    fake_service.reset_counters()
+    assert fake_service.request_count == 0
+    assert fake_service.peak_active_count == 0
+
+
+def test_a_slow_handler_does_not_block_the_other_services(fake_service):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_handler(body):  # pylint: disable=unused-argument
+        started.set()
+        release.wait(5)
+        return {}
+
+    fake_service.register('SlowRequest', slow_handler)
+    thread = threading.Thread(
+        target=fake_service.publish_synchronous_message, args=(request('SlowRequest', {}),))
+    thread.start()
+    try:
+        assert started.wait(5)
+        response = fake_service.publish_synchronous_message(
+            request('TestMonitorCreateTestResultsRequest', {'results': [{'programName': 'a'}]}))
+        assert json.loads(response.body)['results'][0]['programName'] == 'a'
+        assert fake_service.active_count == 1
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_file_upload_chunks_are_sent_at_the_same_time(http_service):
+    file_upload = load_module('file', 'file_upload')
+    http_service.latency = 0.02
+
+    with file_upload.FileUploader(http_service.server_url, chunk_size=4,
+                                  max_workers=3) as uploader:
+        file_id = uploader.upload_stream([b'abcd'] * 6, 'data.bin')
+
+    assert http_service.files[file_id]['name'] == 'data.bin'
+    assert not http_service.sessions
+    # Start, six chunks and finish
+    assert http_service.request_count == 8
+    assert http_service.peak_active_count == 3
+
+
+def test_tag_history_is_read_page_by_page(http_service):
+    tag_history = load_module('tag', 'tag_history')
+    start = datetime.datetime(2020, 1, 1)
+    values = [((start + datetime.timedelta(seconds=index)).isoformat() + 'Z', str(index))
+              for index in range(10)]
+    for path in ('a', 'b'):
+        http_service.add_history(path, values)
+
+    with tag_history.TagHistorianSource(http_service.server_url) as source:
+        reader = tag_history.TagHistoryReader(source.fetch_page, page_size=4, max_workers=2)
+        series = reader.read(['a', 'b'], start, start + datetime.timedelta(minutes=1),
+                             tag_types={'a': 'INT', 'b': 'INT'})
+
+    assert list(series['a'][1]) == list(range(10))
+    assert list(series['b'][1]) == list(range(10))
+    assert http_service.request_count == 6
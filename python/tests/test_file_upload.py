@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the chunking, retries, abort and HTTP sessions of FileUploader.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import threading
+import time
+import types
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+SERVER_URL = 'https://systemlink.example.com'
+
+
+class FakeResponse():
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.reason = 'Server Error' if status_code >= 500 else 'OK'
+        self.body = body or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeSession():
+    """
+    Stand-in for :class:`requests.Session` that records its requests in ``server``.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.headers = {}
+        self.verify = True
+        self.auth = None
+        self.active = 0
+        self.peak_active = 0
+        self.closed = False
+        server.sessions.append(self)
+
+    def close(self):
+        self.closed = True
+
+    def request(self, method, url, **kwargs):
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            time.sleep(self.server.delay)
+            return self.server.answer(method, url[len(SERVER_URL):], kwargs)
+        finally:
+            self.active -= 1
+
+
+class FakeFileService():
+    """
+    Answers the upload session requests of the File service.
+    """
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.sessions = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def answer(self, method, route, kwargs):
+        with self._lock:
+            self.requests.append((method, route, kwargs.get('params')))
+            if method == 'PUT' and self.failures:
+                self.failures -= 1
+                return FakeResponse(503)
+        if route.endswith('/finish'):
+            return FakeResponse(body={'uri': '/nifile/v1/service-groups/Default/files/file1'})
+        if method == 'POST':
+            return FakeResponse(body={'sessionId': 'session1'})
+        return FakeResponse()
+
+    def chunks(self):
+        return sorted((params['chunkIndex'], params['close'])
+                      for method, _, params in self.requests if method == 'PUT')
+
+
+@pytest.fixture
+def file_upload(monkeypatch):
+    pytest.importorskip('requests')
+    module = load_module('file', 'file_upload')
+    # No backoff between retries
+    monkeypatch.setattr(module, 'time', types.SimpleNamespace(sleep=lambda delay: None))
+    return module
+
+
+@pytest.fixture
+def server(file_upload, monkeypatch):
+    file_service = FakeFileService()
+    monkeypatch.setattr(file_upload.requests, 'Session', lambda: FakeSession(file_service))
+    return file_service
+
+
+def test_stream_is_sent_in_chunks_and_finished(file_upload, server):
+    with file_upload.FileUploader(SERVER_URL, api_key='key', chunk_size=4) as uploader:
+        file_id = uploader.upload_stream([b'0123', b'456789'], 'data.bin')
+
+    assert file_id == 'file1'
+    assert server.chunks() == [(0, 'false'), (1, 'false'), (2, 'true')]
+    assert server.requests[-1][:2] == ('POST', '/nifile/v1/service-groups/Default/'
+                                               'upload-sessions/finish')
+    assert all(session.headers['x-ni-api-key'] == 'key' for session in server.sessions)
+    assert all(session.closed for session in server.sessions)
+
+
+def test_failed_chunk_is_retried_on_its_own(file_upload, server):
+    server.failures = 2
+    with file_upload.FileUploader(SERVER_URL, chunk_size=4, max_workers=1) as uploader:
+        uploader.upload_stream([b'01234567'], 'data.bin')
+
+    assert server.chunks() == [(0, 'false'), (0, 'false'), (0, 'false'), (1, 'true')]
+
+
+def test_abort_cancels_the_session(file_upload, server):
+    with file_upload.FileUploader(SERVER_URL, chunk_size=4) as uploader:
+        with pytest.raises(RuntimeError):
+            with uploader.open_upload('data.bin') as upload:
+                upload.write(b'0123456789')
+                raise RuntimeError('writer failed')
+
+    assert upload.file_id is None
+    assert ('DELETE', '/nifile/v1/service-groups/Default/upload-sessions/session1',
+            None) in server.requests
+    assert not any(route.endswith('/finish') for _, route, _ in server.requests)
+
+
+def test_each_session_sends_one_request_at_a_time(file_upload, server):
+    server.delay = 0.01
+    with file_upload.FileUploader(SERVER_URL, chunk_size=4, max_workers=3) as uploader:
+        for _ in range(2):
+            uploader.upload_stream([b'x' * 40], 'data.bin')
+
+    assert all(session.peak_active == 1 for session in server.sessions)
+    assert 1 < len(server.sessions) <= 4
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the conversion of columnar data to create requests.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import math
+
+# Import third party libs
+import pytest
+
+
+class Request():
+    """
+    Stand-in for a create request class, which keeps the dict it is built from.
+    """
+    def __init__(self, values):
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values)
+
+
+def rows(testmonclient, frame, chunk_size=100):
+    """
+    Return the chunks of request dicts built from ``frame``.
+    """
+    # pylint: disable=protected-access
+    return [[request.values for request in chunk]
+            for chunk in testmonclient._requests_from_frame(frame, Request, chunk_size)]
+
+
+def test_missing_values_of_nullable_dtypes_become_none(testmonclient):
+    pd = pytest.importorskip('pandas')
+    frame = pd.DataFrame({
+        'programName': pd.array(['a', None], dtype='string'),
+        'systemId': pd.array([1, None], dtype='Int64'),
+        'totalTimeInSeconds': [1.5, math.nan],
+        'enabled': pd.array([True, None], dtype='boolean'),
+        'startedAt': pd.to_datetime(['2020-01-01T00:00:00', None]),
+    })
+
+    assert rows(testmonclient, frame) == [[
+        {'programName': 'a', 'systemId': 1, 'totalTimeInSeconds': 1.5, 'enabled': True,
+         'startedAt': '2020-01-01T00:00:00'},
+        {'programName': None, 'systemId': None, 'totalTimeInSeconds': None, 'enabled': None,
+         'startedAt': None},
+    ]]
+
+
+def test_dict_of_columns_is_chunked_and_nan_becomes_none(testmonclient):
+    frame = {'programName': ['a', 'b', 'c'], 'totalTimeInSeconds': [1.0, math.nan, 3.0]}
+
+    assert rows(testmonclient, frame, chunk_size=2) == [
+        [{'programName': 'a', 'totalTimeInSeconds': 1.0},
+         {'programName': 'b', 'totalTimeInSeconds': None}],
+        [{'programName': 'c', 'totalTimeInSeconds': 3.0}],
+    ]
+
+
+def test_chunk_size_must_be_positive(testmonclient):
+    with pytest.raises(ValueError):
+        rows(testmonclient, {'programName': ['a']}, chunk_size=0)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the slots, batches and message service use of HeartbeatScheduler.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import time
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import RecordingMessageService, load_module
+
+
+@pytest.fixture
+def heartbeat_scheduler():
+    pytest.importorskip('systemlink.messagebus.generic_message')
+    return load_module('asset', 'heartbeat_scheduler')
+
+
+def test_due_utilizations_are_batched_one_request_per_service(heartbeat_scheduler):
+    services = [RecordingMessageService(delay=0.02) for _ in range(2)]
+    with heartbeat_scheduler.HeartbeatScheduler(services, interval=0.1, resolution=0.2,
+                                                max_batch=2) as scheduler:
+        for index in range(8):
+            scheduler.add('utilization{}'.format(index))
+        time.sleep(0.5)
+    statistics = scheduler.statistics()
+
+    assert statistics['active'] == 8
+    assert statistics['heartbeats'] >= 8
+    assert statistics['requests'] == statistics['heartbeats'] // 2
+    assert statistics['failures'] == 0
+    assert all(service.peak_active == 1 for service in services)
+    assert all(service.requests for service in services)
+    assert all(len(body['utilizationIds']) == 2
+               for service in services for _, body in service.requests)
+
+
+def test_slots_are_due_at_a_random_time_within_them(heartbeat_scheduler):
+    with heartbeat_scheduler.HeartbeatScheduler(RecordingMessageService(), interval=60,
+                                                resolution=1.0) as scheduler:
+        # pylint: disable=protected-access
+        with scheduler._condition:
+            for index in range(50):
+                scheduler._schedule(str(index), time.monotonic() + 1000.0 + index)
+            due_times = dict(scheduler._due_times)
+
+    assert all(slot - 1 <= due_time < slot for slot, due_time in due_times.items())
+    offsets = [due_time - (slot - 1) for slot, due_time in due_times.items()]
+    assert max(offsets) - min(offsets) > 0.5
+
+
+def test_removed_utilizations_get_no_heartbeat(heartbeat_scheduler):
+    service = RecordingMessageService()
+    with heartbeat_scheduler.HeartbeatScheduler(service, interval=0.05,
+                                                resolution=0.05) as scheduler:
+        scheduler.add('kept')
+        scheduler.add('removed')
+        scheduler.remove('removed')
+        time.sleep(0.3)
+
+    assert service.requests
+    assert all(body['utilizationIds'] == ['kept'] for _, body in service.requests)
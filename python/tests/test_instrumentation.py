@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the request statistics and hooks of RequestMetrics.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import contextlib
+
+
+def test_statistics_count_requests_without_sizing_them(sdk_client):
+    sdk_client.query_results(None, 0, 1)
+
+    statistics = sdk_client.metrics.statistics()['query_results']
+    assert statistics['count'] == 1
+    assert statistics['requestBytes'] == 0
+    assert statistics['responseBytes'] > 0
+    assert not sdk_client.metrics.measures_request_bytes
+
+
+def test_hooks_receive_the_size_of_each_request(sdk_client):
+    records = []
+    sdk_client.metrics.add_hook(records.append)
+    sdk_client.query_results(None, 0, 1)
+    sdk_client.metrics.remove_hook(records.append)
+    sdk_client.query_results(None, 0, 1)
+
+    assert [record.operation for record in records] == ['query_results']
+    assert records[0].request_bytes > 0
+    assert set(records[0].durations) == {'serialize', 'round_trip', 'deserialize'}
+    assert sdk_client.metrics.statistics()['query_results']['requestBytes'] == \
+        records[0].request_bytes
+
+
+def test_span_factory_turns_on_request_sizes(testmonclient):
+    spans = []
+
+    @contextlib.contextmanager
+    def span_factory(name):
+        spans.append(name)
+        yield
+
+    metrics = testmonclient.RequestMetrics(span_factory)
+    assert metrics.measures_request_bytes
+    with metrics.measure('query_results') as record:
+        record.serialized()
+    assert spans == ['query_results']
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the prefetching page iterators of TestMonitorClient.
+"""
+from __future__ import absolute_import
+
+
+def add_results(fake_service, count):
+    for index in range(count):
+        result_id = 'result{}'.format(index)
+        fake_service.results[result_id] = {
+            'id': result_id, 'programName': 'Program',
+            'status': {'statusType': 'PASSED', 'statusName': 'Passed'}}
+
+
+def test_iter_results_walks_every_page(sdk_client, fake_service, probe):
+    add_results(fake_service, 5)
+
+    ids = [result.id for result in sdk_client.iter_results(page_size=2)]
+
+    assert ids == ['result{}'.format(index) for index in range(5)]
+    assert len(probe.timeouts) == 3
+
+
+def test_prefetched_pages_use_the_callers_timeout(sdk_client, fake_service, probe):
+    add_results(fake_service, 5)
+
+    with sdk_client.request_timeout(7):
+        results = sdk_client.iter_results(page_size=2)
+    list(results)
+
+    assert probe.timeouts == [7, 7, 7]
+
+
+def test_prefetch_does_not_publish_while_the_caller_does(sdk_client, fake_service, probe):
+    add_results(fake_service, 6)
+    probe.delay = 0.01
+
+    for _ in sdk_client.iter_results(page_size=2):
+        sdk_client.query_results(None, 0, 1)
+
+    assert probe.peak_active == 1
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the refresh, snapshots and aggregates of LiveTagCache.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import types
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+np = pytest.importorskip('numpy')
+
+
+def current_value(path, value, minimum=None, maximum=None, mean=None):
+    """
+    Return a tag as returned by ``TagClient.query_current_values``.
+    """
+    aggregates = None
+    if mean is not None:
+        aggregates = types.SimpleNamespace(min=minimum, max=maximum, avg=mean)
+    return types.SimpleNamespace(
+        tag=types.SimpleNamespace(path=path),
+        current=types.SimpleNamespace(value=types.SimpleNamespace(value=value)),
+        aggregates=aggregates)
+
+
+class FakeTagClient():
+    """
+    Answers ``query_current_values`` with the matching tags, in its own order.
+    """
+    def __init__(self, tags):
+        self.tags = tags
+
+    def query_current_values(self, paths):
+        return [tag for tag in self.tags if tag.tag.path in paths]
+
+
+@pytest.fixture
+def live_tag_cache():
+    return load_module('tag', 'live_tag_cache')
+
+
+def test_refresh_matches_tags_by_path(live_tag_cache):
+    # The service leaves out the missing tag b and answers in another order
+    client = FakeTagClient([current_value('c', '3', 1, 5, 2.5), current_value('a', '1')])
+    with live_tag_cache.LiveTagCache(client, ['a', 'b', 'c']) as cache:
+        cache.refresh()
+
+        np.testing.assert_array_equal(cache.snapshot(), [1.0, np.nan, 3.0])
+        np.testing.assert_array_equal(cache.aggregates('c'), [[1.0], [5.0], [2.5]])
+
+
+def test_updates_are_aggregated_and_selected_by_pattern(live_tag_cache):
+    with live_tag_cache.LiveTagCache() as cache:
+        for value in ('1', '3', 'not a number', 'True'):
+            cache.apply_update('cpu.0.use', value)
+        cache.apply_update('cpu.1.use', 4)
+        cache.apply_update('memory.use', 7)
+
+        np.testing.assert_array_equal(cache.snapshot('cpu.*.use'), [1.0, 4.0])
+        np.testing.assert_array_equal(cache.aggregates(['cpu.0.use']), [[1.0], [3.0], [5 / 3]])
+        with pytest.raises(KeyError):
+            cache.snapshot('disk.use')
+
+
+def test_patterns_cannot_be_tracked(live_tag_cache):
+    with pytest.raises(ValueError):
+        live_tag_cache.LiveTagCache(paths=['cpu.*.use'])
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the chunked step queries of TestMonitorClient.query_steps_for_results.
+"""
+from __future__ import absolute_import
+
+# Import local libs
+from conftest import ProbeMessageService
+
+
+def add_steps(fake_service, result_count):
+    for index in range(result_count):
+        result_id = 'result{}'.format(index)
+        fake_service.steps[(result_id, 'step')] = {
+            'resultId': result_id, 'stepId': 'step', 'name': 'Step {}'.format(index),
+            'status': {'statusType': 'PASSED', 'statusName': 'Passed'}}
+
+
+def test_chunks_are_queried_one_at_a_time_with_the_callers_timeout(sdk_client, fake_service,
+                                                                   probe):
+    add_steps(fake_service, 5)
+    probe.delay = 0.01
+    result_ids = ['result{}'.format(index) for index in range(5)]
+
+    with sdk_client.request_timeout(7):
+        steps, total_count = sdk_client.query_steps_for_results(result_ids, chunk_size=2)
+
+    assert [step.result_id for step in steps] == result_ids
+    assert total_count == 5
+    assert probe.timeouts == [7, 7, 7]
+    assert probe.peak_active == 1
+
+
+def test_other_clients_query_chunks_in_order_with_the_callers_timeout(testmonclient, sdk_client,
+                                                                      fake_service, probe):
+    add_steps(fake_service, 6)
+    other_probe = ProbeMessageService(fake_service, delay=0.01)
+    probe.delay = 0.01
+    result_ids = ['result{}'.format(index) for index in range(6)]
+
+    with testmonclient.TestMonitorClient(message_service=other_probe) as other_client:
+        with sdk_client.request_timeout(7):
+            steps, total_count = sdk_client.query_steps_for_results(
+                result_ids, chunk_size=1, clients=[other_client])
+
+    assert [step.result_id for step in steps] == result_ids
+    assert total_count == 6
+    assert probe.timeouts == other_probe.timeouts == [7, 7, 7]
+    assert probe.peak_active == other_probe.peak_active == 1
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batching, back-pressure and close behavior of ResultWriter.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import threading
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import FakeClient
+
+
+def test_flush_publishes_one_request_per_operation(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        first = writer.create_results([{'programName': 'a'}, {'programName': 'b'}])
+        second = writer.create_results([{'programName': 'c'}])
+        writer.flush()
+
+        assert client.operations() == ['create_results']
+        assert [result['programName'] for result in first.result(1)] == ['a', 'b']
+        assert [result['programName'] for result in second.result(1)] == ['c']
+
+
+def test_batch_size_triggers_a_flush(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=2, flush_interval=60) as writer:
+        future = writer.create_steps([{'stepId': '1'}, {'stepId': '2'}])
+        future.result(5)
+        assert client.operations() == ['create_steps']
+
+
+def test_close_publishes_queued_items_and_rejects_new_ones(testmonclient, client):
+    writer = testmonclient.ResultWriter(client, batch_size=100, flush_interval=60)
+    future = writer.update_steps([{'resultId': 'r', 'stepId': '1', 'status': 'Passed'}])
+    writer.close()
+
+    assert future.done()
+    assert client.operations() == ['update_steps']
+    with pytest.raises(RuntimeError):
+        writer.create_results([{'programName': 'late'}])
+
+
+def test_updates_of_one_result_are_merged(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        first = writer.update_results([{'id': 'r', 'properties': {'a': '1'}, 'keywords': ['x']}])
+        second = writer.update_results([{'id': 'r', 'properties': {'b': '2'}, 'keywords': ['y'],
+                                         'status': 'Passed'}])
+        writer.flush()
+
+    assert writer.coalesced_count == 1
+    ((operation, updates, _),) = client.calls
+    assert operation == 'update_results'
+    assert updates == [{'id': 'r', 'properties': {'a': '1', 'b': '2'}, 'keywords': ['x', 'y'],
+                        'status': 'Passed'}]
+    assert first.result(1) is second.result(1)
+
+
+def test_replace_updates_are_not_merged_with_other_updates(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        writer.update_results([{'id': 'r', 'keywords': ['x']}])
+        writer.update_results([{'id': 'r', 'keywords': ['y']}], replace=True)
+        writer.flush()
+
+    assert [(updates, options['replace']) for _, updates, options in client.calls] == [
+        ([{'id': 'r', 'keywords': ['x']}], False),
+        ([{'id': 'r', 'keywords': ['y']}], True),
+    ]
+
+
+def test_failed_chunk_only_fails_its_futures(testmonclient):
+    client = FakeClient(fail=lambda operation, items: any(item['id'] == 'b' for item in items))
+    with testmonclient.ResultWriter(client, batch_size=1, flush_interval=60) as writer:
+        ok_future = writer.update_results([{'id': 'a', 'status': 'Passed'}])
+        failed_future = writer.update_results([{'id': 'b', 'status': 'Passed'}])
+        writer.flush()
+
+    assert ok_future.result(1).results == [{'id': 'a', 'status': 'Passed'}]
+    with pytest.raises(RuntimeError):
+        failed_future.result(1)
+
+
+def test_queuing_blocks_while_max_pending_items_wait(testmonclient):
+    gate = threading.Event()
+    client = FakeClient(fail=lambda operation, items: not gate.wait(5))
+    writer = testmonclient.ResultWriter(client, batch_size=2, max_pending=2, flush_interval=60)
+    try:
+        # The first batch is taken by the background thread, which then waits on the gate
+        writer.create_results([{'programName': '1'}, {'programName': '2'}])
+        # The next batch fills the queue
+        writer.create_results([{'programName': '3'}, {'programName': '4'}])
+        blocked = threading.Thread(
+            target=writer.create_results, args=([{'programName': '5'}],), daemon=True)
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+
+        gate.set()
+        blocked.join(5)
+        assert not blocked.is_alive()
+        writer.flush()
+    finally:
+        gate.set()
+        writer.close()
+
+    created = [result['programName'] for operation, results, _ in client.calls
+               for result in results if operation == 'create_results']
+    assert created == ['1', '2', '3', '4', '5']
+
+
+def test_updates_of_one_result_keep_their_order_across_options(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        writer.update_results([{'id': 'r', 'keywords': ['a']}])
+        writer.update_results([{'id': 'r', 'keywords': ['b']}], replace=True)
+        last = writer.update_results([{'id': 'r', 'keywords': ['c'], 'status': 'Passed'}])
+        other = writer.update_results([{'id': 's', 'keywords': ['d']}])
+        writer.flush()
+
+    assert [(updates, options['replace']) for _, updates, options in client.calls] == [
+        ([{'id': 'r', 'keywords': ['a']}], False),
+        ([{'id': 'r', 'keywords': ['b']}], True),
+        ([{'id': 'r', 'keywords': ['c'], 'status': 'Passed'}, {'id': 's', 'keywords': ['d']}],
+         False),
+    ]
+    assert last.result(1) is other.result(1)
+
+
+def test_future_spanning_batches_completes_with_the_last_one(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        writer.update_results([{'id': 'x', 'keywords': ['a']}])
+        writer.update_results([{'id': 'y', 'keywords': ['b']}], replace=True)
+        # x is merged into the first batch, y needs a batch after the replace
+        both = writer.update_results([{'id': 'x', 'keywords': ['c']},
+                                      {'id': 'y', 'keywords': ['d']}])
+        writer.flush()
+
+    assert len(client.calls) == 3
+    assert both.result(1).results == [{'id': 'y', 'keywords': ['d']}]
+
+
+def test_future_spanning_batches_fails_with_any_of_them(testmonclient):
+    client = FakeClient(fail=lambda operation, items: items[0]['id'] == 'x')
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        writer.update_results([{'id': 'x', 'keywords': ['a']}])
+        writer.update_results([{'id': 'y', 'keywords': ['b']}], replace=True)
+        both = writer.update_results([{'id': 'x', 'keywords': ['c']},
+                                      {'id': 'y', 'keywords': ['d']}])
+        writer.flush()
+
+    with pytest.raises(RuntimeError):
+        both.result(1)
+
+
+def test_update_without_its_key_queues_nothing(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        with pytest.raises(ValueError):
+            writer.update_results([{'id': 'r', 'status': 'Passed'}, {'status': 'Failed'}])
+        with pytest.raises(ValueError):
+            writer.update_steps([{'resultId': 'r'}])
+        writer.flush()
+
+    assert client.calls == []
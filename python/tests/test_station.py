@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of how StationDaemon shares its cached clients between threads.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+import threading
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import FakeClient, load_module
+
+KEY = b'station-test-key'
+
+
+@pytest.fixture
+def station():
+    return load_module('station', 'station')
+
+
+@pytest.fixture
+def clients():
+    """
+    The clients served by the daemon, by name.
+    """
+    return {'testmon': FakeClient(delay=0.02), 'tag': FakeClient(delay=0.2)}
+
+
+@pytest.fixture
+def daemon(station, clients):
+    station_daemon = station.StationDaemon(
+        ('localhost', 0), key=KEY,
+        client_factories=dict((name, lambda client=client: client)
+                              for name, client in clients.items()))
+    yield station_daemon
+    station_daemon.close()
+
+
+def test_calls_to_one_client_are_made_one_at_a_time(station, daemon, clients):
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+
+    def query(_):
+        with station.StationClient(daemon.address, key=KEY) as station_client:
+            station_client.call('testmon', 'query_results', None, 0, 1)
+            station_client.call('testmon', 'query_results', None, 0, 1, wait=False)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(query, range(4)))
+    daemon.close()
+
+    assert clients['testmon'].operations() == ['query_results'] * 8
+    assert clients['testmon'].peak_active == 1
+    assert clients['testmon'].closed
+
+
+def test_calls_to_different_clients_run_at_the_same_time(daemon, clients):
+    # pylint: disable=protected-access
+    tag_call = threading.Thread(target=daemon._call,
+                                args=('tag', 'query_results', (None, 0, 1), {}))
+    tag_call.start()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(daemon._call, 'testmon', 'query_results', (None, 0, 1), {})
+            future.result(timeout=0.15)
+        assert clients['tag'].active == 1
+    finally:
+        tag_call.join()
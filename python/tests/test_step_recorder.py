@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the order of the step requests queued by StepRecorder.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import concurrent.futures
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import FakeClient
+
+
+class RecordingWriter():
+    """
+    Stand-in for :class:`ResultWriter` that records the queued steps in order.
+
+    Each call returns a future that fails if ``fail`` returns ``True`` for
+    the step names of the call.
+    """
+    def __init__(self, fail=None):
+        self.calls = []
+        self.flush_count = 0
+        self.fail = fail
+
+    def create_steps(self, steps):
+        self.calls.extend(('create', dict(step)) for step in steps)
+        return self._future(steps)
+
+    def update_steps(self, steps):
+        self.calls.extend(('update', dict(step)) for step in steps)
+        return self._future(steps)
+
+    def _future(self, steps):
+        future = concurrent.futures.Future()
+        names = [step['name'] for step in steps]
+        if self.fail is not None and self.fail(names):
+            future.set_exception(RuntimeError('{} failed'.format(', '.join(names))))
+        else:
+            future.set_result(None)
+        return future
+
+    def flush(self):
+        self.flush_count += 1
+
+    def summary(self):
+        return [(operation, step['name'], step['status']) for operation, step in self.calls]
+
+
+@pytest.fixture
+def writer():
+    """
+    A writer that records the queued steps.
+    """
+    return RecordingWriter()
+
+
+def test_leaf_steps_are_created_once_complete(testmonclient, writer):
+    with testmonclient.StepRecorder('result', writer=writer) as recorder:
+        with recorder.step('Video Test', 'NumericLimit') as step:
+            step['status'] = 'Failed'
+        with recorder.step('ROM Test', 'PassFailTest'):
+            pass
+
+    assert writer.summary() == [('create', 'Video Test', 'Failed'),
+                                ('create', 'ROM Test', 'Passed')]
+    assert writer.flush_count == 1
+
+
+def test_parent_is_created_before_its_children_and_updated_after_them(testmonclient, writer):
+    with testmonclient.StepRecorder('result', writer=writer) as recorder:
+        parent_id = recorder.begin('MainSequence Callback', 'SequenceCall')
+        child_id = recorder.begin('Video Test', 'NumericLimit')
+        recorder.end('Passed')
+        recorder.end('Failed')
+
+    assert writer.summary() == [('create', 'MainSequence Callback', 'Running'),
+                                ('create', 'Video Test', 'Passed'),
+                                ('update', 'MainSequence Callback', 'Failed')]
+    steps = [step for _, step in writer.calls]
+    assert steps[0]['stepId'] == steps[2]['stepId'] == parent_id
+    assert steps[1]['stepId'] == child_id
+    assert steps[1]['parentId'] == parent_id
+    assert steps[0]['parentId'] is None
+
+
+def test_step_that_raises_is_errored(testmonclient, writer):
+    with testmonclient.StepRecorder('result', writer=writer) as recorder:
+        with pytest.raises(ValueError):
+            with recorder.step('Power Test'):
+                raise ValueError('no power')
+
+    assert writer.summary() == [('create', 'Power Test', 'Errored')]
+
+
+def test_close_terminates_open_steps_innermost_first(testmonclient, writer):
+    recorder = testmonclient.StepRecorder('result', writer=writer)
+    recorder.begin('Outer')
+    recorder.begin('Inner')
+    recorder.close()
+
+    assert recorder.depth == 0
+    assert recorder.step_count == 2
+    assert writer.summary() == [('create', 'Outer', 'Running'),
+                                ('create', 'Inner', 'Terminated'),
+                                ('update', 'Outer', 'Terminated')]
+    with pytest.raises(RuntimeError):
+        recorder.begin('After close')
+
+
+def test_steps_reach_the_client_in_order(testmonclient, client):
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        with testmonclient.StepRecorder('result', writer=writer) as recorder:
+            with recorder.step('Outer', 'SequenceCall'):
+                with recorder.step('Inner'):
+                    pass
+
+    assert [(operation, [step['name'] for step in steps])
+            for operation, steps, _ in client.calls] == [('create_steps', ['Outer', 'Inner']),
+                                                         ('update_steps', ['Outer'])]
+
+
+def test_close_raises_the_first_failed_request_after_publishing_everything(testmonclient):
+    writer = RecordingWriter(fail=lambda names: 'Video Test' in names or 'ROM Test' in names)
+    recorder = testmonclient.StepRecorder('result', writer=writer)
+    for name in ('Video Test', 'Power Test', 'ROM Test'):
+        with recorder.step(name):
+            pass
+
+    with pytest.raises(RuntimeError, match='Video Test failed'):
+        recorder.close()
+    assert writer.flush_count == 1
+    assert [str(error) for error in recorder.errors] == ['Video Test failed', 'ROM Test failed']
+
+
+def test_failed_requests_do_not_hide_the_exception_of_the_block(testmonclient):
+    writer = RecordingWriter(fail=lambda names: True)
+    with pytest.raises(ValueError):
+        with testmonclient.StepRecorder('result', writer=writer) as recorder:
+            with recorder.step('Power Test'):
+                pass
+            raise ValueError('no power')
+
+    assert len(recorder.errors) == 1
+
+
+def test_errors_of_the_result_writer_reach_close(testmonclient):
+    client = FakeClient(fail=lambda operation, steps: operation == 'update_steps')
+    with testmonclient.ResultWriter(client, batch_size=100, flush_interval=60) as writer:
+        recorder = testmonclient.StepRecorder('result', writer=writer)
+        with recorder.step('Outer', 'SequenceCall'):
+            with recorder.step('Inner'):
+                pass
+        with pytest.raises(RuntimeError, match='update_steps failed'):
+            recorder.close()
+
+    assert client.operations() == ['create_steps', 'update_steps']
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the paging and decoding of TagHistoryReader.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import datetime
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+np = pytest.importorskip('numpy')
+
+START = datetime.datetime(2020, 1, 1)
+END = datetime.datetime(2020, 1, 2)
+
+
+@pytest.fixture
+def tag_history():
+    return load_module('tag', 'tag_history')
+
+
+def source(history):
+    """
+    Return a ``fetch_page`` that pages the ``(timestamp, value)`` pairs of each path.
+    """
+    calls = []
+
+    def fetch_page(path, start, end, continuation, take, **options):
+        # pylint: disable=unused-argument,too-many-arguments
+        calls.append((path, continuation, options))
+        skip = continuation or 0
+        page = history[path][skip:skip + take]
+        more = skip + take < len(history[path])
+        return page, skip + take if more else None
+    return fetch_page, calls
+
+
+def test_pages_are_decoded_into_typed_arrays(tag_history):
+    fetch_page, calls = source({
+        'double': [('2020-01-01T00:00:00Z', '1.5'), ('2020-01-01T00:00:01.25Z', '-2'),
+                   ('2020-01-01T02:00:02+02:00', '3e2')],
+        'int': [('2020-01-01T00:00:00', '7')],
+        'boolean': [('2020-01-01T00:00:00Z', 'True'), ('2020-01-01T00:00:01Z', 'false')],
+        'string': [('2020-01-01T00:00:00Z', 'Running')],
+        'empty': [],
+    })
+    reader = tag_history.TagHistoryReader(fetch_page, page_size=2, max_workers=1)
+
+    series = reader.read(['double', 'int', 'boolean', 'string', 'empty'], START, END,
+                         {'int': 'INT', 'boolean': 'BOOLEAN', 'string': 'STRING'})
+
+    timestamps, values = series['double']
+    np.testing.assert_array_equal(timestamps, np.array(
+        ['2020-01-01T00:00:00', '2020-01-01T00:00:01.25', '2020-01-01T00:00:02'],
+        dtype='datetime64[ns]'))
+    np.testing.assert_array_equal(values, [1.5, -2.0, 300.0])
+    assert series['int'][1].dtype == np.int32
+    np.testing.assert_array_equal(series['boolean'][1], [True, False])
+    assert series['string'][1].tolist() == ['Running']
+    assert series['empty'][0].dtype == np.dtype('datetime64[ns]')
+    assert len(series['empty'][1]) == 0
+    assert [continuation for path, continuation, _ in calls if path == 'double'] == [None, 2]
+
+
+def test_datetime_objects_are_converted_to_utc(tag_history):
+    east = datetime.timezone(datetime.timedelta(hours=1))
+    timestamps = tag_history.decode_timestamps(
+        [datetime.datetime(2020, 1, 1, 1, tzinfo=east), datetime.datetime(2020, 1, 1, 2)])
+
+    np.testing.assert_array_equal(timestamps, np.array(
+        ['2020-01-01T00:00', '2020-01-01T02:00'], dtype='datetime64[ns]'))
+
+
+def test_series_are_downsampled_and_decimation_is_passed_on(tag_history):
+    history = {'a': [('2020-01-01T00:00:{:02d}Z'.format(second), str(second))
+                     for second in range(6)]}
+    fetch_page, calls = source(history)
+    reader = tag_history.TagHistoryReader(fetch_page, page_size=10)
+
+    timestamps, values = reader.read(['a'], START, END, buckets=2, decimation=100)['a']
+
+    np.testing.assert_array_equal(timestamps, np.array(
+        ['2020-01-01T00:00:00', '2020-01-01T00:00:03'], dtype='datetime64[ns]'))
+    np.testing.assert_array_equal(values, [[0, 3], [2, 5], [1, 4]])
+    assert calls == [('a', None, {'decimation': 100})]
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the known tag registry and of create_tags.
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import json
+import threading
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import load_module
+
+
+class FakeTagClient():
+    """
+    Records the tags it creates.
+    """
+    def __init__(self):
+        self.created = []
+
+    def create_tag(self, path, tag_type, properties, keywords, collect_aggregates):
+        # pylint: disable=unused-argument,too-many-arguments
+        self.created.append(path)
+
+
+@pytest.fixture
+def tag_registry():
+    return load_module('tag', 'tag_registry')
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'known_tags.json')
+
+
+def test_known_tags_are_not_created_again(tag_registry, path):
+    client = FakeTagClient()
+    tags = [{'path': 'system.a', 'type': 'STRING'}, {'path': 'system.b', 'type': 'INT'}]
+
+    assert tag_registry.create_tags(
+        client, tags, registry=tag_registry.KnownTagRegistry(path, 'server')) == [
+            'system.a', 'system.b']
+    tags[1]['type'] = 'DOUBLE'
+    assert tag_registry.create_tags(
+        client, tags, registry=tag_registry.KnownTagRegistry(path, 'server')) == ['system.b']
+    assert tag_registry.create_tags(
+        client, tags, registry=tag_registry.KnownTagRegistry(path, 'other')) == [
+            'system.a', 'system.b']
+
+
+def test_save_keeps_the_entries_saved_by_other_registries(tag_registry, path):
+    first = tag_registry.KnownTagRegistry(path, 'server')
+    second = tag_registry.KnownTagRegistry(path, 'server')
+    first.add(tag_registry.tag_definition({'path': 'a', 'type': 'STRING'}))
+    first.add(tag_registry.tag_definition({'path': 'gone', 'type': 'STRING'}))
+    first.save()
+    second.add(tag_registry.tag_definition({'path': 'b', 'type': 'STRING'}))
+    second.forget(['gone'])
+    second.save()
+
+    with open(path) as registry_file:
+        assert sorted(json.load(registry_file)['server']) == ['a', 'b']
+    assert 'a' in second
+    assert len(tag_registry.KnownTagRegistry(path, 'server')) == 2
+
+
+def test_concurrent_saves_lose_no_entries(tag_registry, path):
+    registries = [tag_registry.KnownTagRegistry(path, 'server') for _ in range(8)]
+
+    def add_and_save(index):
+        registries[index].add(
+            tag_registry.tag_definition({'path': str(index), 'type': 'STRING'}))
+        registries[index].save()
+
+    threads = [threading.Thread(target=add_and_save, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tag_registry.KnownTagRegistry(path, 'server')) == 8
+
+
+def test_stale_lock_is_removed(tag_registry, path, monkeypatch):
+    lock_path = path + '.lock'
+    open(lock_path, 'w').close()
+    monkeypatch.setattr(tag_registry, 'STALE_LOCK_AGE', -1)
+    registry = tag_registry.KnownTagRegistry(path, 'server')
+    registry.add(tag_registry.tag_definition({'path': 'a', 'type': 'STRING'}))
+
+    registry.save()
+
+    assert 'a' in tag_registry.KnownTagRegistry(path, 'server')
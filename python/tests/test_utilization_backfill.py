@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the checkpointing, resume and concurrency of UtilizationBackfill.
+"""
+from __future__ import absolute_import
+
+# Import third party libs
+import pytest
+
+# Import local libs
+from conftest import RecordingMessageService, load_module
+
+START = 'AssetPerformanceManagementRecordAssetUtilizationStartRequest'
+END = 'AssetPerformanceManagementRecordAssetUtilizationEndRequest'
+
+
+def utilization(index):
+    return {
+        'minionId': 'minion',
+        'systemControllerIdentification': {'serialNumber': 'system'},
+        'assetIdentifications': [{'vendorNumber': 1, 'modelNumber': 2,
+                                  'serialNumber': str(index)}],
+        'startTimestamp': '2019-01-01T{:02d}:00:00Z'.format(index),
+        'endTimestamp': '2019-01-01T{:02d}:30:00Z'.format(index),
+    }
+
+
+@pytest.fixture
+def utilization_backfill():
+    pytest.importorskip('systemlink.messagebus.generic_message')
+    return load_module('asset', 'utilization_backfill')
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / 'backfill.checkpoint')
+
+
+def run(utilization_backfill, service, checkpoint_path, count=3):
+    backfill = utilization_backfill.UtilizationBackfill(
+        service, checkpoint_path, progress_callback=lambda progress: None)
+    return backfill.run(utilization(index) for index in range(count))
+
+
+def test_resume_skips_ended_and_only_ends_started_utilizations(utilization_backfill,
+                                                               checkpoint_path):
+    first = RecordingMessageService(
+        lambda name, body: 'crash' if name == END and body['utilizationTimestamp'].startswith(
+            '2019-01-01T01') else 'ok')
+    progress = run(utilization_backfill, first, checkpoint_path)
+    assert (progress['completed'], progress['failed']) == (2, 1)
+
+    second = RecordingMessageService()
+    progress = run(utilization_backfill, second, checkpoint_path)
+
+    assert (progress['completed'], progress['skipped']) == (1, 2)
+    assert second.names() == [END]
+    # The end that failed, with the id of its start
+    assert second.requests[0][1] == first.requests[3][1]
+
+
+def test_rejected_start_is_sent_again_on_resume(utilization_backfill, checkpoint_path):
+    run(utilization_backfill, RecordingMessageService(
+        lambda name, body: 'rejected' if name == START else 'ok'), checkpoint_path, count=1)
+
+    second = RecordingMessageService()
+    run(utilization_backfill, second, checkpoint_path, count=1)
+
+    assert second.names() == [START, END]
+
+
+def test_start_that_timed_out_is_not_sent_again(utilization_backfill, checkpoint_path):
+    run(utilization_backfill, RecordingMessageService(
+        lambda name, body: 'timeout' if name == START else 'ok'), checkpoint_path, count=1)
+
+    second = RecordingMessageService()
+    run(utilization_backfill, second, checkpoint_path, count=1)
+
+    assert second.names() == [END]
+
+
+def test_each_message_service_records_one_utilization_at_a_time(utilization_backfill):
+    services = [RecordingMessageService(delay=0.01) for _ in range(3)]
+
+    progress = run(utilization_backfill, services, None, count=9)
+
+    assert progress['completed'] == 9
+    assert all(service.peak_active == 1 for service in services)
+    assert sum(len(service.requests) for service in services) == 18
+    assert all(service.requests for service in services)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Run a parameterized report notebook over many parameter sets in parallel.
+
+Example::
+
+    python report_runner.py add.ipynb parameters.json --cache-dir .report_cache
+"""
+from __future__ import absolute_import
+
+# Import python libs
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+
+class ReportRunner():
+    """
+    Execute a notebook with papermill for many parameter sets and collect its scraps.
+
+    Executions run in a pool of worker processes that stay alive for the
+    whole batch, so papermill, scrapbook and the notebook machinery are
+    imported once per worker rather than once per report. The scraps glued
+    by each execution are cached on disk, keyed by a hash of the notebook and
+    of the parameters, so a parameter set that was already run with the same
+    notebook is not executed again.
+    """
+    def __init__(self, notebook_path, cache_dir=None, max_workers=None, kernel_name=None):
+        """
+        :param notebook_path: The notebook to execute.
+        :type notebook_path: str
+        :param cache_dir: The directory the scraps are cached in, or ``None`` to
+            not cache them.
+        :type cache_dir: str or None
+        :param max_workers: Maximum number of notebooks executed at the same time,
+            or ``None`` for the number of processors.
+        :type max_workers: int or None
+        :param kernel_name: The kernel to execute the notebook with, or ``None``
+            for the kernel in the notebook's metadata.
+        :type kernel_name: str or None
+        """
+        self._notebook_path = notebook_path
+        self._cache_dir = cache_dir
+        self._max_workers = max_workers
+        self._kernel_name = kernel_name
+        with open(notebook_path, 'rb') as notebook:
+            self._notebook_hash = hashlib.sha256(notebook.read()).hexdigest()
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def run(self, parameter_sets):
+        """
+        Execute the notebook once per parameter set
+
+        :param parameter_sets: The parameters of each execution.
+        :type parameter_sets: list(dict)
+        :return: One column per scrap name, plus a ``parameters`` column, with
+            one row per parameter set in the order of ``parameter_sets``.
+            Rows of executions that failed or did not glue a scrap hold ``None``.
+        :rtype: dict(str, list)
+        """
+        parameter_sets = list(parameter_sets)
+        scraps = [None] * len(parameter_sets)
+        pending = {}
+        for index, parameters in enumerate(parameter_sets):
+            cached = self._load(parameters)
+            if cached is not None:
+                scraps[index] = cached
+            else:
+                pending.setdefault(self._key(parameters), []).append(index)
+        LOGGER.info('%d of %d reports cached, %d to run', len(parameter_sets) - sum(
+            len(indexes) for indexes in pending.values()), len(parameter_sets), len(pending))
+
+        if pending:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+                futures = dict(
+                    (executor.submit(execute_notebook, self._notebook_path,
+                                     parameter_sets[indexes[0]], self._kernel_name), key)
+                    for key, indexes in pending.items())
+                for future in concurrent.futures.as_completed(futures):
+                    indexes = pending[futures[future]]
+                    try:
+                        result = future.result()
+                    except Exception as exc:  # pylint: disable=broad-except
+                        LOGGER.warning('Report with parameters %r failed: %s',
+                                       parameter_sets[indexes[0]], exc)
+                        continue
+                    self._store(parameter_sets[indexes[0]], result)
+                    for index in indexes:
+                        scraps[index] = result
+
+        names = []
+        for result in scraps:
+            for name in result or ():
+                if name not in names:
+                    names.append(name)
+        columns = {'parameters': parameter_sets}
+        for name in names:
+            columns[name] = [result.get(name) if result is not None else None
+                             for result in scraps]
+        return columns
+
+    def _key(self, parameters):
+        identity = json.dumps([self._notebook_hash, parameters], sort_keys=True, default=str)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def _cache_path(self, parameters):
+        return os.path.join(self._cache_dir, self._key(parameters) + '.json')
+
+    def _load(self, parameters):
+        if self._cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(parameters)) as cached:
+                return json.load(cached)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, parameters, scraps):
+        if self._cache_dir is None:
+            return
+        path = self._cache_path(parameters)
+        try:
+            with open(path + '.tmp', 'w') as cached:
+                json.dump(scraps, cached)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as exc:
+            LOGGER.warning('Could not cache report scraps: %s', exc)
+
+
+def execute_notebook(notebook_path, parameters, kernel_name=None):
+    """
+    Execute a notebook with papermill and return the data it glued with scrapbook.
+
+    :param notebook_path: The notebook to execute.
+    :type notebook_path: str
+    :param parameters: The parameters injected in the notebook.
+    :type parameters: dict
+    :param kernel_name: The kernel to execute the notebook with, or ``None``.
+    :type kernel_name: str or None
+    :return: The data of each scrap, by scrap name.
+    :rtype: dict
+    """
+    # pylint: disable=import-error,import-outside-toplevel
+    import papermill
+    import scrapbook
+    # pylint: enable=import-error,import-outside-toplevel
+
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, os.path.basename(notebook_path))
+        papermill.execute_notebook(notebook_path, output_path, parameters=parameters,
+                                   kernel_name=kernel_name, progress_bar=False,
+                                   cwd=os.path.dirname(os.path.abspath(notebook_path)))
+        return dict(scrapbook.read_notebook(output_path).scraps.data_dict)
+
+
+def main(argv=None):
+    """
+    Run a notebook over the parameter sets of a JSON file and write the scraps as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('notebook', help='The notebook to execute')
+    parser.add_argument('parameters', help='JSON file with a list of parameter sets')
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--kernel-name', default=None)
+    parser.add_argument('--output', default='-', help='Output JSON file, - for stdout')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.parameters) as parameters_file:
+        parameter_sets = json.load(parameters_file)
+    runner = ReportRunner(args.notebook, args.cache_dir, args.max_workers, args.kernel_name)
+    columns = runner.run(parameter_sets)
+    if args.output == '-':
+        print(json.dumps(columns, default=str))
+    else:
+        with open(args.output, 'w') as output:
+            json.dump(columns, output, default=str)
+
+
+if __name__ == '__main__':
+    main()